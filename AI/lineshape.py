@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import warnings
+import numpy as np
+import pandas as pd
+from scipy.signal import peak_widths, savgol_filter
+
+"""
+Подгонка найденных пиков лоренцианами (общий код для plot_spectrum_AI_detect.py).
+Каждому пику - окно ±WINDOW_FWHM ширин вокруг него, ширина в cm⁻¹ из peak_widths (по сглаженному
+спектру, как при поиске пиков); в окне широкой линии на плотной оси берется не больше
+WINDOW_POINTS точек (прореживание с шагом), у узкой - все. Пики с перекрывающимися окнами
+подгоняются вместе (группа, не больше MAX_GROUP пиков) с общим постоянным фоном.
+Все группы всех переданных спектров с одинаковым числом пиков решаются одним батчевым
+Левенбергом-Марквардтом: окна дополнены до одинакового числа точек, невязка, якобиан (G, M, P)
+и нормальные уравнения (G, P, P) считаются сразу для всех групп, у каждой группы свое затухание
+и свой останов (сошедшиеся группы выбывают из батча).
+Результат на пик: центр, FWHM, высота (с ошибками из ковариации группы), добротность, rmse группы.
+Подгонка, упершаяся в границу (нулевая высота, центр или полуширина на краю окна), отбрасывается:
+столбцы подгонки этого пика - NaN.
+"""
+
+MIN_HALF_WINDOW = 4  # bins on each side of a peak at least
+MAX_HALF_WINDOW_CM = 100.0  # cm^-1 on each side at most, for widths of a noise bump
+WINDOW_FWHM = 2.0  # half window in units of the estimated FWHM
+WINDOW_POINTS = 64  # points of one peak window at most; wider windows are thinned
+BOUND_RTOL = 1e-9  # a parameter this close to a bound is at the bound
+MAX_GROUP = 6  # peaks fitted jointly at most
+MAX_ITERATIONS = 100
+TOLERANCE = 1e-8  # relative cost decrease that ends the fit of a group
+COLUMNS = ('peak_cm', 'center_cm', 'center_err', 'fwhm_cm', 'fwhm_err', 'height', 'height_err', 'q_factor', 'rmse')
+
+
+def _groups(idx, half):
+    """Consecutive runs of peaks whose windows (idx ± half) overlap"""
+    groups = []
+    for k in range(len(idx)):
+        if groups and len(groups[-1]) < MAX_GROUP and idx[k] - half[k] <= idx[k - 1] + half[k - 1]:
+            groups[-1].append(k)
+        else:
+            groups.append([k])
+    return groups
+
+
+def _samples(center, half, n):
+    """Bin indices of the window center ± half, every stride-th so that at most WINDOW_POINTS remain"""
+    stride = -(-(2 * half + 1) // WINDOW_POINTS)
+    offsets = np.arange(-(half // stride) * stride, half + 1, stride)
+    points = center + offsets
+    return points[(points >= 0) & (points < n)]
+
+
+def _windows(spectra):
+    """Groups of all spectra: (spectrum number, peak numbers, bin indices, FWHM estimates in bins)"""
+    windows = []
+    for number, (freq, spectrum, idx) in enumerate(spectra):
+        if len(idx) == 0:
+            continue
+        with warnings.catch_warnings():
+            # A peak of the smoothed spectrum can be a shoulder of the raw one: width 0, clipped below
+            warnings.simplefilter('ignore')
+            smoothed = savgol_filter(spectrum, window_length=11, polyorder=2)
+            fwhm_bins = np.maximum(peak_widths(smoothed, idx, rel_height=0.5)[0], 1.0)
+        step = freq[1] - freq[0]
+        # The window follows the line width in cm^-1, whatever the bin step of the axis
+        half = np.clip(np.round(WINDOW_FWHM * fwhm_bins), MIN_HALF_WINDOW,
+                       max(MAX_HALF_WINDOW_CM / step, MIN_HALF_WINDOW)).astype(np.intp)
+        for members in _groups(idx, half):
+            # Union of the member windows: a narrow line keeps its full resolution next to a wide one
+            points = np.unique(np.concatenate([_samples(idx[k], half[k], len(spectrum)) for k in members]))
+            windows.append((number, members, points, fwhm_bins[members]))
+    return windows
+
+
+class _Batch:
+    """Groups of K peaks padded to M points; parameters (G, 3K + 1): heights, centers, HWHM, background"""
+
+    def __init__(self, spectra, windows):
+        G = len(windows)
+        self.K = K = len(windows[0][1])
+        M = max(len(points) for _, _, points, _ in windows)
+        self.x = np.zeros((G, M))
+        self.y = np.zeros((G, M))
+        self.mask = np.zeros((G, M))
+        params = np.zeros((G, 3 * K + 1))
+        lower = np.full((G, 3 * K + 1), -np.inf)
+        upper = np.full((G, 3 * K + 1), np.inf)
+        for g, (number, members, points, fwhm_bins) in enumerate(windows):
+            freq, spectrum, idx = spectra[number]
+            x, y = freq[points], spectrum[points]
+            step = freq[1] - freq[0]
+            self.x[g, :len(x)], self.x[g, len(x):] = x, x[-1]
+            self.y[g, :len(y)] = y
+            self.mask[g, :len(x)] = 1.0
+            background = np.min(y)
+            peaks = idx[members]
+            params[g] = np.concatenate((np.maximum(spectrum[peaks] - background, 0.0), freq[peaks],
+                                        0.5 * fwhm_bins * step, [background]))
+            lower[g, :K], lower[g, K:2 * K], lower[g, 2 * K:3 * K] = 0.0, x[0], 0.25 * step
+            upper[g, K:2 * K], upper[g, 2 * K:3 * K] = x[-1], max(x[-1] - x[0], step)
+        self.lower, self.upper = lower, upper
+        self.params = np.clip(params, lower, upper)
+
+    def residuals(self, params, groups):
+        K = self.K
+        u = (self.x[groups, :, None] - params[:, None, K:2 * K]) / params[:, None, 2 * K:3 * K]
+        lorentz = 1.0 / (1.0 + u * u)
+        model = (lorentz @ params[:, :K, None])[:, :, 0] + params[:, -1:]
+        return (model - self.y[groups]) * self.mask[groups], u, lorentz
+
+    def normal(self, params, groups, residuals, u, lorentz):
+        """J^T J and J^T r"""
+        K = self.K
+        common = 2.0 * params[:, None, :K] * lorentz * lorentz / params[:, None, 2 * K:3 * K]
+        jac = np.concatenate((lorentz, common * u, common * u * u, np.ones(lorentz.shape[:2] + (1,))), axis=2)
+        jac *= self.mask[groups, :, None]
+        jac_t = jac.transpose(0, 2, 1)
+        return jac_t @ jac, (jac_t @ residuals[:, :, None])[:, :, 0]
+
+    def fit(self):
+        """Levenberg-Marquardt with steps clipped to the bounds; returns (params, residuals, J^T J)"""
+        params = self.params.copy()
+        everything = np.arange(len(params))
+        residuals, u, lorentz = self.residuals(params, everything)
+        cost = np.sum(residuals ** 2, axis=1)
+        damping = np.full(len(params), 1e-3)
+        active = everything
+        for _ in range(MAX_ITERATIONS):
+            if len(active) == 0:
+                break
+            p, r, c, d = params[active], residuals[active], cost[active], damping[active]
+            jtj, gradient = self.normal(p, active, r, u, lorentz)
+            # Marquardt scaling; the floor keeps parameters of a zero-height line solvable
+            diagonal = np.einsum('gpp->gp', jtj)
+            diagonal = np.maximum(diagonal, 1e-12 * diagonal.max(axis=1, keepdims=True))
+            damped = jtj + (d[:, None] * diagonal)[:, :, None] * np.eye(jtj.shape[1])
+            trial = np.clip(p - np.linalg.solve(damped, gradient[:, :, None])[:, :, 0],
+                            self.lower[active], self.upper[active])
+            trial_residuals, trial_u, trial_lorentz = self.residuals(trial, active)
+            trial_cost = np.sum(trial_residuals ** 2, axis=1)
+            better = trial_cost < c
+            done = (better & (c - trial_cost <= TOLERANCE * c)) | (d > 1e10)
+            accepted = active[better]
+            params[accepted], residuals[accepted], cost[accepted] = trial[better], trial_residuals[better], \
+                trial_cost[better]
+            u = np.where(better[:, None, None], trial_u, u)[~done]
+            lorentz = np.where(better[:, None, None], trial_lorentz, lorentz)[~done]
+            damping[active] = np.where(better, d / 3, d * 2)
+            active = active[~done]
+        _, u, lorentz = self.residuals(params, everything)
+        return params, residuals, self.normal(params, everything, residuals, u, lorentz)[0]
+
+
+def fit_lorentzians(spectra):
+    """
+    Fit every peak of every spectrum in one batched solve.
+    spectra: [(freq cm⁻¹, amplitude, peak indices), ...]; returns one DataFrame of COLUMNS per spectrum,
+    rows in increasing peak index. Fit columns are NaN for a peak whose fit ended on a bound.
+    """
+    spectra = [(np.asarray(freq, dtype='float64'), np.asarray(amplitude, dtype='float64'),
+                np.sort(np.asarray(idx, dtype=np.intp))) for freq, amplitude, idx in spectra]
+    tables = [[] for _ in spectra]
+    windows = _windows(spectra)
+    # One batch per group size: no padding peaks
+    for size in sorted({len(members) for _, members, _, _ in windows}):
+        sized = [window for window in windows if len(window[1]) == size]
+        batch = _Batch(spectra, sized)
+        params, residuals, jtj = batch.fit()
+        points = batch.mask.sum(axis=1)
+        dof = points - params.shape[1]
+        ssr = np.sum(residuals ** 2, axis=1)
+        rmse = np.sqrt(ssr / points)
+        # Covariance of each group scaled by its residual variance; nan without spare points
+        variance = np.where(dof > 0, ssr / np.maximum(dof, 1), np.nan)
+        errors = np.sqrt(np.clip(np.einsum('gpp->gp', np.linalg.pinv(jtj)), 0.0, None) * variance[:, None])
+        # A line clipped by its window or squeezed to zero height is not measured
+        bounded = np.isclose(params, batch.lower, rtol=BOUND_RTOL, atol=0) | \
+            np.isclose(params, batch.upper, rtol=BOUND_RTOL, atol=0)
+        for g, (number, members, _, _) in enumerate(sized):
+            freq, _, idx = spectra[number]
+            for k, member in enumerate(members):
+                if bounded[g, [k, size + k, 2 * size + k]].any():
+                    tables[number].append((idx[member], freq[idx[member]]) + (np.nan,) * (len(COLUMNS) - 1))
+                    continue
+                height, center, hwhm = params[g, k], params[g, size + k], params[g, 2 * size + k]
+                tables[number].append((idx[member], freq[idx[member]], center, errors[g, size + k], 2 * hwhm,
+                                       2 * errors[g, 2 * size + k], height, errors[g, k], center / (2 * hwhm),
+                                       rmse[g]))
+    return [pd.DataFrame([row[1:] for row in sorted(rows)], columns=COLUMNS) for rows in tables]
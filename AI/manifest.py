@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import hashlib
+
+"""
+Манифест пакетного запуска: для каждого входного .dat - размер, mtime, хэш содержимого,
+параметры расчета, выходные файлы, статус и найденные пики.
+Повторный запуск (после лимита SLURM) пропускает то, что уже посчитано с теми же параметрами,
+и заново считает только измененные или упавшие файлы.
+"""
+
+HASH_CHUNK = 8 * 1024 * 1024
+TAIL_SIZE = 64 * 1024
+
+
+def file_digest(path):
+    """blake2b of the whole file, read in chunks"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_complete(path):
+    """
+    Cheap check of the file tail before a full read. Returns None if the file looks complete,
+    otherwise the reason: an MD run that crashed mid-write leaves an unterminated or short last line.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return "empty file"
+    with open(path, 'rb') as f:
+        head = f.read(min(size, TAIL_SIZE)).split(b'\n')
+        f.seek(max(0, size - TAIL_SIZE))
+        tail = f.read()
+    if not tail.endswith(b'\n'):
+        return "last line is not terminated"
+    data_lines = [line for line in head[1:] if line.strip()]
+    last_line = tail.rstrip(b'\n').rsplit(b'\n', 1)[-1]
+    if data_lines and len(last_line.split()) != len(data_lines[0].split()):
+        return "last line has %d fields instead of %d" % (len(last_line.split()), len(data_lines[0].split()))
+    return None
+
+
+class Manifest:
+    """JSON manifest keyed by input file name, flushed atomically after every change"""
+
+    def __init__(self, path, params):
+        self.path = path
+        self.params = params
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f).get('files', {})
+            except (OSError, ValueError) as e:
+                print(f"Manifest {path} is unreadable ({e}), starting a new one")
+
+    def is_up_to_date(self, file_path):
+        """True if file_path was processed successfully with the same parameters and its outputs exist"""
+        entry = self.entries.get(os.path.basename(file_path))
+        if entry is None or entry.get('status') != 'done' or entry.get('params') != self.params:
+            return False
+        if not all(os.path.exists(output) for output in entry.get('outputs', [])):
+            return False
+        st = os.stat(file_path)
+        if entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+            return True
+        # Touched or copied, but maybe the same content
+        if entry['size'] == st.st_size and entry.get('hash') == file_digest(file_path):
+            entry['mtime_ns'] = st.st_mtime_ns
+            self.flush()
+            return True
+        return False
+
+    def peaks(self, file_path):
+        return self.entries[os.path.basename(file_path)].get('peaks')
+
+    def record(self, file_path, status, peaks=None, outputs=(), error=None, digest=None):
+        """
+        digest: file_digest() of the input, computed by the worker that read it. Without it a 'done'
+        entry keeps the old hash if size and mtime are unchanged, else the file is hashed here.
+        """
+        st = os.stat(file_path)
+        old = self.entries.get(os.path.basename(file_path)) or {}
+        if status == 'done' and digest is None:
+            if old.get('hash') and old.get('size') == st.st_size and old.get('mtime_ns') == st.st_mtime_ns:
+                digest = old['hash']
+            else:
+                digest = file_digest(file_path)
+        self.entries[os.path.basename(file_path)] = {
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'hash': digest if status == 'done' else None,
+            'params': self.params,
+            'outputs': [output for output in outputs if os.path.exists(output)],
+            'status': status,
+            'peaks': peaks,
+            'error': error,
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        self.flush()
+
+    def mark(self, file_paths, status):
+        """Record a status (e.g. 'interrupted' on SIGTERM) for files without a finished entry"""
+        for file_path in file_paths:
+            entry = self.entries.get(os.path.basename(file_path))
+            if entry is None or entry.get('status') != 'done':
+                self.record(file_path, status)
+
+    def flush(self):
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'params': self.params, 'files': self.entries}, f, indent=1)
+        os.replace(tmp_path, self.path)
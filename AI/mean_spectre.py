@@ -1,52 +1,60 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import os
 import glob
+from peaks import detect_peaks
+from spectrum_store import SpectrumStore, default_path
 
 # Configuration
 INPUT_DIR = os.getcwd()
 OUTPUT_DIR = os.getcwd()
 DPI = 300
 
-def detect_peaks(xf_filtered, smoothed_spectrum, original_spectrum):
-    """Detect peaks using sliding window and iterative filtering."""
-    max_amp = np.max(original_spectrum)
-    # Step 1: Find all local maxima with 3-point window
-    peaks = []
-    for i in range(1, len(smoothed_spectrum) - 1):
-        if smoothed_spectrum[i] > smoothed_spectrum[i - 1] and smoothed_spectrum[i] > smoothed_spectrum[i + 1]:
-            peaks.append((xf_filtered[i], smoothed_spectrum[i]))
-    if not peaks:
-        return []
-    # Step 2: Iteratively filter until less than 20 peaks remain
-    current_peaks = peaks.copy()
-    while len(current_peaks) >= 500:
-        new_peaks = []
-        n = len(current_peaks)
-        if n == 0:
-            break
-        for i in range(n):
-            if n == 1:
-                new_peaks.append(current_peaks[i])
-                break
-            if i == 0:
-                if current_peaks[i][1] > current_peaks[i + 1][1]:
-                    new_peaks.append(current_peaks[i])
-            elif i == n - 1:
-                if current_peaks[i][1] > current_peaks[i - 1][1]:
-                    new_peaks.append(current_peaks[i])
-            else:
-                if current_peaks[i][1] > current_peaks[i - 1][1] and current_peaks[i][1] > current_peaks[i + 1][1]:
-                    new_peaks.append(current_peaks[i])
-        if len(new_peaks) == len(current_peaks):
-            break
-        current_peaks = new_peaks
-    # Filter peaks below 1.5% of max amplitude from original spectrum
-    current_peaks = [peak for peak in current_peaks if peak[1] >= 0.01 * max_amp]
-    return current_peaks
+class RunningSpectrum:
+    """Welford mean/variance and min/max of spectra on one frequency axis, one spectrum at a time"""
+
+    def __init__(self, freq):
+        self.freq = np.array(freq, dtype='float64')
+        self.count = 0
+        self.mean = np.zeros(len(self.freq))
+        self.m2 = np.zeros(len(self.freq))
+        self.minimum = np.full(len(self.freq), np.inf)
+        self.maximum = np.full(len(self.freq), -np.inf)
+
+    def add(self, amplitude):
+        amplitude = np.asarray(amplitude, dtype='float64')
+        self.count += 1
+        delta = amplitude - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (amplitude - self.mean)
+        np.minimum(self.minimum, amplitude, out=self.minimum)
+        np.maximum(self.maximum, amplitude, out=self.maximum)
+
+    @property
+    def std(self):
+        """Population standard deviation, as np.std"""
+        return np.sqrt(self.m2 / max(self.count, 1))
+
+    def save(self, output_dir=OUTPUT_DIR, dpi=DPI, plot=True):
+        return save_mean_spectrum(self.freq, self.mean, output_dir, dpi, std=self.std,
+                                  bounds=(self.minimum, self.maximum), plot=plot)
 
 def main():
+    # Spectra of plot_spectrum_AI_detect.py are in the store, *_spectrum.csv are the older format
+    store = SpectrumStore(default_path(INPUT_DIR))
+    if store.exists():
+        axes = store.axes()
+        if len(axes) > 1:
+            print("Error: Frequency axes mismatch between files")
+            return
+        axis, names = next(iter(axes.items()))
+        print(f"Found {len(names)} spectra in {store.path}. Processing...")
+        stats = RunningSpectrum(store.freq(axis))
+        for name in names:
+            stats.add(store.spectrum(name)[1])
+        stats.save()
+        return
+
     # Find all spectrum CSV files
     csv_files = glob.glob(os.path.join(INPUT_DIR, '*_spectrum.csv'))
     if not csv_files:
@@ -55,9 +63,8 @@ def main():
 
     print(f"Found {len(csv_files)} spectrum files. Processing...")
 
-    # Load and validate all spectra
-    spectra_data = []
-    reference_freq = None
+    # Load, validate and accumulate the spectra one by one
+    stats = None
     for file in csv_files:
         df = pd.read_csv(file)
         if 'Frequency_cm-1' not in df or 'Amplitude' not in df:
@@ -68,31 +75,47 @@ def main():
         amp = df['Amplitude'].values
         
         # Check frequency axis consistency
-        if reference_freq is None:
-            reference_freq = freq
+        if stats is None:
+            stats = RunningSpectrum(freq)
         else:
-            if not np.allclose(freq, reference_freq, atol=0.01):
+            if not np.allclose(freq, stats.freq, atol=0.01):
                 print("Error: Frequency axes mismatch between files")
                 return
         
-        spectra_data.append(amp)
+        stats.add(amp)
 
-    # Calculate mean spectrum
-    mean_spectrum = np.mean(spectra_data, axis=0)
+    stats.save()
 
+def save_mean_spectrum(reference_freq, mean_spectrum, output_dir=OUTPUT_DIR, dpi=DPI, std=None, bounds=None,
+                       plot=True):
+    """Detect peaks of the mean spectrum, save it (with std and min/max if given) and its peaks to CSV, plot it"""
     # Detect peaks using original spectrum for both smoothed and original arguments
     detected_peaks = detect_peaks(reference_freq, mean_spectrum, mean_spectrum)
 
     # Save mean spectrum
-    output_csv = os.path.join(OUTPUT_DIR, 'mean_spectre_AI.csv')
-    pd.DataFrame({
+    output_csv = os.path.join(output_dir, 'mean_spectre_AI.csv')
+    columns = {
         'Frequency_cm-1': reference_freq,
         'Amplitude': mean_spectrum
-    }).to_csv(output_csv, index=False)
+    }
+    if std is not None:
+        columns['Std'] = std
+    if bounds is not None:
+        columns['Min'], columns['Max'] = bounds
+    pd.DataFrame(columns).to_csv(output_csv, index=False)
     print(f"Saved mean spectrum to {output_csv}")
+    peaks_csv = os.path.join(output_dir, 'mean_spectre_AI_peaks.csv')
+    pd.DataFrame(detected_peaks, columns=['Frequency_cm-1', 'Amplitude']).to_csv(peaks_csv, index=False)
+    print(f"Saved {len(detected_peaks)} mean spectrum peaks to {peaks_csv}")
+    if not plot:
+        return detected_peaks
 
-    # Plot results
+    # Plot results; pyplot is imported here, so the detect workers that import this module do not load it
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(12, 6))
+    if std is not None:
+        plt.fill_between(reference_freq, mean_spectrum - std, mean_spectrum + std, color='0.8', lw=0,
+                         label='±1 std')
     plt.plot(reference_freq, mean_spectrum, 'k-', lw=0.8, label='Mean Spectrum')
     
     # Plot peaks with unique labels
@@ -112,10 +135,11 @@ def main():
     plt.legend(title='Peak Positions', loc='upper right', ncol=2, fontsize=8)
     plt.tight_layout()
     
-    output_img = os.path.join(OUTPUT_DIR, 'mean_spectrum_with_peaks.png')
-    plt.savefig(output_img, dpi=DPI, bbox_inches='tight')
+    output_img = os.path.join(output_dir, 'mean_spectrum_with_peaks.png')
+    plt.savefig(output_img, dpi=dpi, bbox_inches='tight')
     plt.close()
     print(f"Saved plot to {output_img}")
+    return detected_peaks
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
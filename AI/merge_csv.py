@@ -1,11 +1,15 @@
 import os
+import sys
 import pandas as pd
 import re
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from peak_catalog import PeakCatalog
 
 
 """
 Так как мы обрабатываем большие файлы в два подхода, то этот скрипт
-нужен для того, чтобы слить 2 .csv файла воедино
+нужен для того, чтобы слить результаты воедино: каталоги пиков (*.sqlite)
+дописываются в merged_peaks.sqlite, старые ';' .csv (PEAKS_CSV) склеиваются как раньше
 """
 def extract_number(filename):
     match = re.search(r'\d+', filename)
@@ -36,11 +40,25 @@ def merge_csv_files(input_dir, output_file):
     sorted_merged_df.to_csv(output_file, sep=';', index=False, encoding='utf-8')
     print(f"Merged CSV saved as: {output_file}")
 
+def merge_catalogs(input_dir, output_file):
+    """Append every peak catalog of input_dir to output_file"""
+    catalog_files = sorted((f for f in os.listdir(input_dir)
+                            if f.endswith('.sqlite') and f != os.path.basename(output_file)), key=extract_number)
+    catalog = PeakCatalog(output_file)
+    for file in catalog_files:
+        catalog.merge(os.path.join(input_dir, file))
+    print(f"Merged {len(catalog_files)} catalogs ({len(catalog.files())} files) into: {output_file}")
+
 if __name__ == "__main__":
     input_directory = os.getcwd()
     output_csv = os.path.join(input_directory, "merged_peaks.csv")
+    output_catalog = os.path.join(input_directory, "merged_peaks.sqlite")
     
-    if os.path.exists(output_csv):
-        os.remove(output_csv)
+    for output_file in (output_csv, output_catalog):
+        if os.path.exists(output_file):
+            os.remove(output_file)
     
-    merge_csv_files(input_directory, output_csv)
\ No newline at end of file
+    if any(f.endswith('.sqlite') for f in os.listdir(input_directory)):
+        merge_catalogs(input_directory, output_catalog)
+    else:
+        merge_csv_files(input_directory, output_csv)
\ No newline at end of file
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import re
+import sys
+import sqlite3
+import argparse
+import numpy as np
+import pandas as pd
+
+"""
+Каталог пиков вместо транспонированного <dir>_peaks_summary.csv: длинная типизированная таблица SQLite
+<result>/peaks.sqlite, строка на пик:
+  run, file                      - папка запуска и имя .dat;
+  system, n, environment, replica - метки из имени файла (trp_1_water.dat, trp_1_water_2.dat);
+  frequency, amplitude, prominence, width - найденный пик (по сглаженному спектру, cm⁻¹);
+  center ... rmse                - подгонка лоренцианом (lineshape.py), пусто без нее.
+Индексы по частоте и по (system, environment, n, frequency): выборка диапазона - миллисекунды.
+Повторно посчитанный файл заменяет свои строки, слияние запусков - дописывание строк:
+    python peak_catalog.py query <result>/peaks.sqlite 3300 3400 --system trp --environment water --n 1 18
+    python peak_catalog.py merge all_peaks.sqlite run1/peaks.sqlite run2/peaks.sqlite
+"""
+
+FILENAME = 'peaks.sqlite'
+# <system>_<N>_<environment>[_<replica>], as in create_title() of Processing/spectres.py
+TAG_PATTERN = re.compile(r'^([A-Za-z0-9]+?)_(\d+)_([A-Za-z]+)(?:_(\d+))?')
+TAGS = ('system', 'n', 'environment', 'replica')
+PEAK_COLUMNS = ('frequency', 'amplitude', 'prominence', 'width')
+FIT_COLUMNS = ('center', 'center_err', 'fwhm', 'fwhm_err', 'height', 'height_err', 'q_factor', 'rmse')
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS peaks (
+    run TEXT NOT NULL, file TEXT NOT NULL,
+    system TEXT, n INTEGER, environment TEXT, replica INTEGER,
+    frequency REAL NOT NULL, amplitude REAL, prominence REAL, width REAL,
+    center REAL, center_err REAL, fwhm REAL, fwhm_err REAL, height REAL, height_err REAL, q_factor REAL, rmse REAL
+);
+CREATE INDEX IF NOT EXISTS peaks_frequency ON peaks (frequency);
+CREATE INDEX IF NOT EXISTS peaks_tags ON peaks (system, environment, n, frequency);
+CREATE INDEX IF NOT EXISTS peaks_file ON peaks (run, file);
+"""
+TIMEOUT = 60  # seconds to wait for another writer
+
+
+def default_path(output_dir):
+    return os.path.join(output_dir, FILENAME)
+
+
+def parse_tags(name):
+    """{'system', 'n', 'environment', 'replica'} from a file name; None for what the name does not carry"""
+    match = TAG_PATTERN.match(os.path.basename(name))
+    if match is None:
+        return dict.fromkeys(TAGS)
+    system, n, environment, replica = match.groups()
+    return {'system': system.lower(), 'n': int(n), 'environment': environment.lower(),
+            'replica': int(replica) if replica is not None else None}
+
+
+class PeakCatalog:
+    """SQLite table of peaks, one row per peak, replaced per (run, file)"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def connect(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=TIMEOUT)
+        connection.executescript(SCHEMA)
+        return connection
+
+    def replace(self, run, table):
+        """Store the peaks of table (file, PEAK_COLUMNS[, FIT_COLUMNS]), dropping older rows of its files"""
+        table = table.copy()
+        table.insert(0, 'run', run)
+        tags = pd.DataFrame([parse_tags(name) for name in table['file']], index=table.index, columns=TAGS)
+        table = pd.concat([table, tags], axis=1)
+        for column in FIT_COLUMNS:
+            if column not in table:
+                table[column] = np.nan
+        columns = ('run', 'file') + TAGS + PEAK_COLUMNS + FIT_COLUMNS
+        rows = table[list(columns)].astype(object).where(table[list(columns)].notna(), None)
+        with self.connect() as connection:
+            connection.executemany("DELETE FROM peaks WHERE run = ? AND file = ?",
+                                   [(run, name) for name in table['file'].unique()])
+            connection.executemany("INSERT INTO peaks (%s) VALUES (%s)" % (', '.join(columns), ', '.join('?' * len(columns))),
+                                   rows.itertuples(index=False, name=None))
+        connection.close()
+        return len(table)
+
+    def merge(self, other):
+        """Append the rows of another catalog; its (run, file) pairs replace ours"""
+        with self.connect() as connection:
+            connection.execute("ATTACH DATABASE ? AS other", (other,))
+            connection.execute("DELETE FROM peaks WHERE (run, file) IN (SELECT DISTINCT run, file FROM other.peaks)")
+            connection.execute("INSERT INTO peaks SELECT * FROM other.peaks")
+        connection.execute("DETACH DATABASE other")
+        connection.close()
+
+    def query(self, low=None, high=None, system=None, environment=None, n=None, replica=None, run=None):
+        """Peaks with low <= frequency <= high and the given tags (n: value or (first, last)) as a DataFrame"""
+        conditions, params = [], []
+        for column, value in (('system', system), ('environment', environment), ('replica', replica), ('run', run)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value.lower() if column in ('system', 'environment') else value)
+        if n is not None:
+            first, last = n if isinstance(n, (tuple, list)) else (n, n)
+            conditions.append("n BETWEEN ? AND ?")
+            params += [first, last]
+        if low is not None:
+            conditions.append("frequency >= ?")
+            params.append(low)
+        if high is not None:
+            conditions.append("frequency <= ?")
+            params.append(high)
+        sql = "SELECT * FROM peaks" + (" WHERE " + " AND ".join(conditions) if conditions else "")
+        with self.connect() as connection:
+            table = pd.read_sql_query(sql + " ORDER BY run, system, environment, n, replica, file, frequency",
+                                      connection, params=params)
+        connection.close()
+        return table
+
+    def files(self):
+        """(run, file, peaks) of every catalogued file"""
+        with self.connect() as connection:
+            rows = connection.execute("SELECT run, file, COUNT(*) FROM peaks GROUP BY run, file ORDER BY run, file").fetchall()
+        connection.close()
+        return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query, merge and export peak catalogs')
+    sub = parser.add_subparsers(dest='command', required=True)
+    query = sub.add_parser('query', help='peaks in a frequency range, optionally of some systems')
+    query.add_argument('catalog')
+    query.add_argument('low', type=float, nargs='?')
+    query.add_argument('high', type=float, nargs='?')
+    query.add_argument('--system')
+    query.add_argument('--environment')
+    query.add_argument('--n', type=int, nargs='+', metavar='N', help='N or first last')
+    query.add_argument('--replica', type=int)
+    query.add_argument('--run')
+    query.add_argument('--output', help='.csv or .parquet instead of printing')
+    listing = sub.add_parser('list', help='catalogued files')
+    listing.add_argument('catalog')
+    merge = sub.add_parser('merge', help='append the peaks of other catalogs')
+    merge.add_argument('catalog')
+    merge.add_argument('others', nargs='+')
+    args = parser.parse_args()
+    catalog = PeakCatalog(args.catalog)
+    if args.command != 'merge' and not catalog.exists():
+        print(f"No peak catalog {args.catalog}")
+        sys.exit(1)
+    if args.command == 'query':
+        n = None if args.n is None else (args.n[0], args.n[-1])
+        table = catalog.query(args.low, args.high, args.system, args.environment, n, args.replica, args.run)
+        if args.output is None:
+            print(table.to_string(index=False))
+        elif args.output.endswith('.parquet'):
+            table.to_parquet(args.output, index=False)
+        else:
+            table.to_csv(args.output, index=False)
+        print(f"{len(table)} peaks")
+    elif args.command == 'list':
+        for run, name, count in catalog.files():
+            print(f"{run}/{name}: {count} peaks")
+    else:
+        for other in args.others:
+            catalog.merge(other)
+        print(f"{len(catalog.files())} files in {args.catalog}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+
+"""
+Поиск пиков в спектре (общий код для plot_spectrum_AI_detect.py и mean_spectre.py).
+Те же шаги, что и в прежнем цикле, но на массивах индексов:
+локальные максимумы по 3 точкам, затем повторные проходы по списку максимумов,
+пока их не станет меньше MAX_PEAKS, и отсечка по доле от максимума исходного спектра.
+"""
+
+MAX_PEAKS = 500
+MIN_RELATIVE_AMPLITUDE = 0.01
+
+
+def _local_maxima(values):
+    """Mask of strict local maxima; the ends are compared with their only neighbour"""
+    keep = np.empty(len(values), dtype=bool)
+    keep[0] = values[0] > values[1]
+    keep[-1] = values[-1] > values[-2]
+    keep[1:-1] = (values[1:-1] > values[:-2]) & (values[1:-1] > values[2:])
+    return keep
+
+
+def find_peak_indices(smoothed_spectrum, original_spectrum, max_peaks=MAX_PEAKS,
+                      min_relative_amplitude=MIN_RELATIVE_AMPLITUDE):
+    """Indices of the selected peaks in smoothed_spectrum, in increasing order"""
+    smoothed_spectrum = np.asarray(smoothed_spectrum)
+    if len(smoothed_spectrum) < 3:
+        return np.empty(0, dtype=np.intp)
+    max_amp = np.max(original_spectrum)
+    # Step 1: Find all local maxima with 3-point window
+    inner = smoothed_spectrum[1:-1]
+    idx = np.flatnonzero((inner > smoothed_spectrum[:-2]) & (inner > smoothed_spectrum[2:])) + 1
+    # Step 2: Keep only the maxima among the maxima until less than max_peaks remain
+    while len(idx) >= max_peaks:
+        new_idx = idx[_local_maxima(smoothed_spectrum[idx])]
+        if len(new_idx) == len(idx):
+            break
+        idx = new_idx
+    # Filter peaks below 1% of max amplitude from original spectrum
+    return idx[smoothed_spectrum[idx] >= min_relative_amplitude * max_amp]
+
+
+def detect_peaks(xf_filtered, smoothed_spectrum, original_spectrum):
+    """Detect peaks using sliding window and iterative filtering. Returns [(frequency, amplitude), ...]"""
+    idx = find_peak_indices(smoothed_spectrum, original_spectrum)
+    return list(zip(np.asarray(xf_filtered)[idx].tolist(), np.asarray(smoothed_spectrum)[idx].tolist()))
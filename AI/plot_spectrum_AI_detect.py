@@ -1,18 +1,30 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import os
+import sys
+import json
+import argparse
+import signal as signals
+from time import perf_counter
 import numpy as np
 import pandas as pd
-import gc
-from scipy.fft import rfft, rfftfreq, irfft
-from scipy.signal import find_peaks, peak_prominences, peak_widths
-from scipy.signal.windows import hann
+from functools import partial
 from multiprocessing import Pool
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
-from scipy.signal import savgol_filter
+from scipy.signal import savgol_filter, peak_prominences, peak_widths
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import dipole_cache
+import spectral
+from peaks import detect_peaks
+from lineshape import fit_lorentzians
+from peak_catalog import PeakCatalog, FIT_COLUMNS, default_path as default_catalog_path
+import render
+import spectrum_store
+from spectrum_store import SpectrumStore, default_path as default_store_path, key as store_key
+from manifest import Manifest, check_complete, file_digest
+from mean_spectre import RunningSpectrum
+from scheduler import imap_budgeted, default_budget, estimate_peak_bytes, count_rows
+import stages
+from stages import stage, track_file
 
 """
 Тут делаем все: и суммарные файлы, и частные файлы, и графики для каждого файла.
@@ -23,6 +35,21 @@ OUTPUT_DIR = os.path.abspath(os.path.join(INPUT_DIR, "..", "result"))
 JOBS = 16
 DPI = 300
 CUTOFF_FREQ = 3e12  # 3 THz
+MAX_WAVENUMBER = 4000  # cm⁻¹, upper edge of the analysed band
+RESOLUTION = None  # cm⁻¹, step of the 'czt' band; None keeps the native rfft bins
+ENGINE = 'fft'  # 'fft'; 'czt' only to sample the band at RESOLUTION (not faster, same O(n) memory)
+DECIMATE = False  # low-pass + downsample the signal to the band before the spectrum
+BATCHED = False  # transform equal-length files together as 2-D blocks
+BATCH_SIZE = JOBS  # rows per block; every row costs about 20 bytes per sample during the FFT
+RENDER_JOBS = 4  # processes drawing PNGs next to the compute pool
+SPECTRUM_CSV = False  # also write <name>_spectrum.csv; spectra always go to the store in <result>/spectra
+ENSEMBLE = True  # mean, std band and min/max over all files, accumulated as they finish (no mean_spectre.py pass)
+COMPONENTS = False  # also dip_x, dip_y, dip_z and their isotropic sum, transformed together with |dip|
+COMPONENT_ROWS = ('dip_x', 'dip_y', 'dip_z', '|dip|')
+FIT_PEAKS = True  # Lorentzian centre, FWHM, height and Q of every peak in the peak catalog
+FIT_BATCH = 64  # files whose peaks go into one batched fit
+PEAKS_CSV = False  # also the former transposed ';' <dir>_peaks_summary.csv; peaks always go to <result>/peaks.sqlite
+MEMORY_BUDGET = None  # GB for the files in flight; None = 80% of the SLURM allocation / available RAM
 
 def create_output_dir():
     """Create output directory if it doesn't exist"""
@@ -30,174 +57,555 @@ def create_output_dir():
         os.makedirs(OUTPUT_DIR)
     return OUTPUT_DIR
 
-def detect_peaks(xf_filtered, smoothed_spectrum, original_spectrum):
-    """Detect peaks using sliding window and iterative filtering."""
-    max_amp = np.max(original_spectrum)
-    # Step 1: Find all local maxima with 3-point window
-    peaks = []
-    for i in range(1, len(smoothed_spectrum) - 1):
-        if smoothed_spectrum[i] > smoothed_spectrum[i - 1] and smoothed_spectrum[i] > smoothed_spectrum[i + 1]:
-            peaks.append((xf_filtered[i], smoothed_spectrum[i]))
-    if not peaks:
-        return []
-    # Step 2: Iteratively filter until less than 20 peaks remain
-    current_peaks = peaks.copy()
-    while len(current_peaks) >= 500:
-        new_peaks = []
-        n = len(current_peaks)
-        if n == 0:
-            break
-        for i in range(n):
-            if n == 1:
-                new_peaks.append(current_peaks[i])
-                break
-            if i == 0:
-                if current_peaks[i][1] > current_peaks[i + 1][1]:
-                    new_peaks.append(current_peaks[i])
-            elif i == n - 1:
-                if current_peaks[i][1] > current_peaks[i - 1][1]:
-                    new_peaks.append(current_peaks[i])
-            else:
-                if current_peaks[i][1] > current_peaks[i - 1][1] and current_peaks[i][1] > current_peaks[i + 1][1]:
-                    new_peaks.append(current_peaks[i])
-        if len(new_peaks) == len(current_peaks):
-            break
-        current_peaks = new_peaks
-    # Filter peaks below 3% of max amplitude from original spectrum
-    current_peaks = [peak for peak in current_peaks if peak[1] >= 0.01 * max_amp]
-    return current_peaks
-
-def process_file(file_path):
-    """Process a .dat file to generate spectrum and peak plots."""
-    try:
-        base_name = os.path.splitext(os.path.basename(file_path))[0]
-        output_prefix = os.path.join(create_output_dir(), base_name)
-        print(f"Processing: {file_path}")
-        # Read data
-        df = pd.read_csv(
-            file_path,
-            sep=' ',
-            usecols=['#', 'Unnamed: 8'],
-            dtype={'#': 'int32', 'Unnamed: 8': 'float32'},
-            engine='c'
-        )
-        if df.empty or len(df) < 2:
-            raise ValueError("DataFrame is empty or has fewer than 2 rows.")
-        # Prepare data
-        time = df['#'].values * 2e-3  # Convert fs to ps
-        signal = df['Unnamed: 8'].values.astype('float32')
+def load_signal(file_path):
+    """Read a dipole .dat file: time (ps) and |dip| with the DC offset removed"""
+    with stage('read'):
+        data = dipole_cache.load_dipole(file_path)
+        if len(data['frame']) < 2:
+            raise ValueError("Data is empty or has fewer than 2 rows.")
+        time = data['frame'] * 2e-3  # Convert fs to ps
+        signal = np.array(data['|dip|'], dtype='float32')
         signal -= signal.mean()  # Remove DC offset
-        # Plot original signal
-        plt.figure(figsize=(12, 6))
-        plt.plot(time, signal, 'b-', lw=0.8)
-        plt.xlabel("Time (ps)")
-        plt.ylabel("Dipole moment (D)")
-        plt.grid(True, alpha=0.3)
-        plt.tight_layout()
-        plt.savefig(f"{output_prefix}_original.png", dpi=DPI, bbox_inches='tight')
-        plt.close()
-        # Autocorrelation with FFT
-        n = len(signal)
-        fft_sig = rfft(signal, n=2*n)
-        autocorr = irfft(fft_sig * np.conj(fft_sig), n=2*n)[:n].real
-        autocorr /= np.max(autocorr)
-        del fft_sig
-        gc.collect()
-        # Spectral analysis with Hanning window
-        window = hann(n)
-        autocorr_windowed = autocorr * window
-        yf = rfft(autocorr_windowed)
-        xf = rfftfreq(n, d=1e-15)  # d in seconds (1 fs)
-        # Apply frequency cutoff
-        cutoff_idx = np.searchsorted(xf, CUTOFF_FREQ)
-        yf[:cutoff_idx] = 0
-        # Convert to cm⁻¹ and limit to 4000 cm⁻¹
-        xf_cm = (xf * 1e-12) / 0.03  # Convert THz to cm⁻¹
-        mask = xf_cm <= 4000
-        xf_filtered = xf_cm[mask]
-        yf_masked = yf[:len(xf_filtered)]
-        spectrum = 2.0 / n * np.abs(yf_masked)
-        spectrum *= 10000  # Scaling factor
+        return time, signal
+
+def load_components(file_path):
+    """All dipole columns as one (4, n) block with the DC offsets removed, and the x, y, z weights of the isotropic sum"""
+    with stage('read'):
+        data = dipole_cache.load_dipole(file_path)
+        if len(data['frame']) < 2:
+            raise ValueError("Data is empty or has fewer than 2 rows.")
+        signals = np.stack([np.asarray(data[name], dtype='float32') for name in COMPONENT_ROWS])
+        signals -= signals.mean(axis=1, keepdims=True)
+        # Each ACF is normalised by its own c[0]: weighting by c[0] puts the sum back on the <μ(0)·μ(t)> scale
+        power = np.einsum('ij,ij->i', signals[:3], signals[:3], dtype='float64')
+        weights = power / power.sum() if power.sum() > 0 else np.full(3, 1.0 / 3)
+        return signals, weights
+
+def compute_spectrum(signal, workers=None):
+    """Spectrum of the Hann-windowed autocorrelation (1-D signal or equal-length rows)"""
+    return spectral.acf_spectrum(signal, engine=ENGINE, cutoff_freq=CUTOFF_FREQ,
+                                 max_wavenumber=MAX_WAVENUMBER, resolution=RESOLUTION,
+                                 decimate=DECIMATE, workers=workers)
+
+def output_prefix_for(file_path):
+    """<output dir>/<name> for all outputs of a .dat file"""
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(create_output_dir(), base_name)
+
+def finish_file(file_path, xf_filtered, spectrum, plot_data=True, store_path=None):
+    """
+    Smooth, detect peaks, append the spectrum to the store (default: <result>/spectra)
+    and (if plot_data) save the _plot.npz for the render stage.
+    Returns sorted peak frequencies, None on error.
+    """
+    try:
+        output_prefix = output_prefix_for(file_path)
         # Smooth spectrum
-        smoothed_spectrum = savgol_filter(spectrum, window_length=11, polyorder=2)
+        with stage('savgol'):
+            smoothed_spectrum = savgol_filter(spectrum, window_length=11, polyorder=2)
         # Detect peaks with original spectrum for amplitude threshold
-        selected_peaks = detect_peaks(xf_filtered, smoothed_spectrum, spectrum)
+        with stage('peaks'):
+            selected_peaks = detect_peaks(xf_filtered, smoothed_spectrum, spectrum)
         # Extract and sort frequencies
         freq_list = sorted([peak[0] for peak in selected_peaks])
         
-        # Save spectrum to CSV
-        spectrum_df = pd.DataFrame({
-            'Frequency_cm-1': xf_filtered,
-            'Amplitude': spectrum
-        })
+        # Save spectrum to the store (a file missing from it is not done), CSV only on request
+        with stage('store'):
+            SpectrumStore(store_path or default_store_path(create_output_dir())).append(
+                os.path.basename(file_path), xf_filtered, spectrum)
         try:
-            spectrum_df.to_csv(f"{output_prefix}_spectrum.csv", index=False)
+            if SPECTRUM_CSV:
+                spectrum_df = pd.DataFrame({
+                    'Frequency_cm-1': xf_filtered,
+                    'Amplitude': spectrum
+                })
+                with stage('csv'):
+                    spectrum_df.to_csv(f"{output_prefix}_spectrum.csv", index=False)
         except Exception as e:
-            print(f"Ошибка при сохранении CSV: {e}")
+            print(f"Ошибка при сохранении спектра: {e}")
         
-        # Plot spectrum with peaks
-        plt.figure(figsize=(12, 6))
-        plt.plot(xf_filtered, smoothed_spectrum, 'k-', lw=0.8, label='_nolegend_')
-        for freq, amp in selected_peaks:
-            plt.scatter(freq, amp, color='red', marker='x', s=100, label=f'{freq:.2f} cm⁻¹')
-        plt.legend(title=None, loc="upper right")
-        plt.xlabel("Frequency (cm⁻¹)")
-        plt.ylabel("Spectral ACF EDM Amplitude (a. u.)")
-        plt.grid(True, alpha=0.3)
-        plt.tight_layout()
-        plt.savefig(f"{output_prefix}_spectrum.png", dpi=DPI, bbox_inches='tight')
-        plt.close()
+        # Plots are drawn by render.py from this file
+        if plot_data:
+            with stage('plot_data'):
+                render.save_plot_data(output_prefix, file_path, xf_filtered, smoothed_spectrum, selected_peaks)
         return freq_list
     except Exception as e:
         print(f"Error processing {file_path}: {str(e)}")
-        return []
+        return None
 
-if __name__ == '__main__':
+def finish_components(file_path, xf_filtered, spectra, weights, store_path=None):
+    """
+    Store the dip_x, dip_y, dip_z rows of spectra and their isotropic sum as <name>:<component>,
+    write the peaks of each to <name>_component_peaks.csv. Errors fail the file (process_file).
+    """
+    store = SpectrumStore(store_path or default_store_path(create_output_dir()))
+    name = os.path.basename(file_path)
+    components = dict(zip(COMPONENT_ROWS[:3], spectra[:3]))
+    components['iso'] = weights @ spectra[:3]
+    rows = []
+    for component, spectrum in components.items():
+        with stage('peaks'):
+            smoothed_spectrum = savgol_filter(spectrum, window_length=11, polyorder=2)
+            rows.extend((component, freq, amp) for freq, amp in detect_peaks(xf_filtered, smoothed_spectrum, spectrum))
+        with stage('store'):
+            store.append(store_key(name, component), xf_filtered, spectrum)
+    pd.DataFrame(rows, columns=['Component', 'Frequency_cm-1', 'Amplitude']).to_csv(
+        f"{output_prefix_for(file_path)}_component_peaks.csv", index=False)
+
+def transform_file(file_path, plot_data=True, store_path=None):
+    """Load, transform and finish one file: |dip| only, or all components as one 2-D block"""
+    if COMPONENTS:
+        signals, weights = load_components(file_path)
+        xf_filtered, spectra = compute_spectrum(signals)
+        del signals
+        finish_components(file_path, xf_filtered, spectra, weights, store_path)
+        return finish_file(file_path, xf_filtered, spectra[-1], plot_data, store_path)
+    time, signal = load_signal(file_path)
+    xf_filtered, spectrum = compute_spectrum(signal)
+    del time, signal
+    return finish_file(file_path, xf_filtered, spectrum, plot_data, store_path)
+
+def estimate_bytes(file_path):
+    """Peak memory of a file for the scheduler: one row per transformed component"""
+    return estimate_peak_bytes(file_path) * (len(COMPONENT_ROWS) if COMPONENTS else 1)
+
+def finish_file_tracked(file_path, xf_filtered, spectrum, plot_data=True, store_path=None):
+    """finish_file with its stages attributed to file_path"""
+    with track_file(file_path):
+        return finish_file(file_path, xf_filtered, spectrum, plot_data, store_path)
+
+def process_file(file_path, plot_data=True, store_path=None):
+    """Process a .dat file to generate spectrum, peaks and plot data."""
+    try:
+        print(f"Processing: {file_path}")
+        with track_file(file_path):
+            return transform_file(file_path, plot_data, store_path)
+    except Exception as e:
+        print(f"Error processing {file_path}: {str(e)}")
+        return None
+
+def with_digest(func, file_path, *args, **kwargs):
+    """Pool task: (func(file_path, ...), file_digest for the manifest), hashed while the file is in the page cache"""
+    result = func(file_path, *args, **kwargs)
+    peaks = result[0] if isinstance(result, tuple) else result
+    return result, file_digest(file_path) if peaks is not None else None
+
+def file_rows(file_path):
+    """Row count for grouping, None if the file cannot be read (it then fails in process_file)"""
+    try:
+        return count_rows(file_path)
+    except Exception as e:
+        print(f"Error reading {file_path}: {str(e)}")
+        return None
+
+def read_signal(file_path):
+    """Pool task: the DC-free signal of one block member, None if it cannot be read"""
+    try:
+        with track_file(file_path):
+            return load_signal(file_path)[1]
+    except Exception as e:
+        print(f"Error reading {file_path}: {str(e)}")
+        return None
+
+def group_by_length(dat_files, lengths):
+    """Split files into equal-length groups (batched) and stragglers (processed one by one)"""
+    groups = {}
+    for file_path, length in zip(dat_files, lengths):
+        groups.setdefault(length, []).append(file_path)
+    batches = [(length, files) for length, files in groups.items() if length is not None and len(files) > 1]
+    stragglers = [f for length, files in groups.items() if length is None or len(files) == 1 for f in files]
+    return batches, stragglers
+
+def run_batched(pool, dat_files, plot_data=True, on_result=None, budget=None):
+    """
+    Transform equal-length files as 2-D blocks of BATCH_SIZE rows with scipy.fft workers,
+    then finish each file in the pool. Lengths are counted and block members read in the pool;
+    stragglers, members of another length and failed blocks go through process_file.
+    """
+    results = {}
+    batches, stragglers = group_by_length(dat_files, pool.map(file_rows, dat_files))
+    workers = min(JOBS, os.cpu_count() or 1)
+    for length, files in batches:
+        for start in range(0, len(files), BATCH_SIZE):
+            block = files[start:start + BATCH_SIZE]
+            print(f"Processing batch of {len(block)}: {', '.join(os.path.basename(f) for f in block)}")
+            loaded = pool.map(read_signal, block)
+            # The line count can differ from the parsed rows (blank lines): those files go one by one
+            stragglers.extend(f for f, s in zip(block, loaded) if s is None or len(s) != length)
+            kept = [i for i, s in enumerate(loaded) if s is not None and len(s) == length]
+            block, loaded = [block[i] for i in kept], [loaded[i] for i in kept]
+            if not block:
+                continue
+            try:
+                signals = np.stack(loaded)
+                del loaded
+                with track_file(f"batch of {len(block)} from {os.path.basename(block[0])}"):
+                    xf_filtered, spectra = compute_spectrum(signals, workers=workers)
+                del signals
+            except Exception as e:
+                print(f"Batch failed ({str(e)}), falling back to per-file processing")
+                stragglers.extend(block)
+                continue
+            tasks = [(finish_file_tracked, f, xf_filtered, spectra[i], plot_data) for i, f in enumerate(block)]
+            for file_path, (peaks, digest) in zip(block, pool.starmap(with_digest, tasks)):
+                results[file_path] = peaks
+                if on_result is not None:
+                    on_result(file_path, peaks, digest)
+    task = partial(with_digest, process_file, plot_data=plot_data)
+    if budget is None:
+        stream = zip(stragglers, pool.imap(task, stragglers))
+    else:
+        stream = imap_budgeted(pool, task, stragglers, budget, estimate_bytes)
+    for file_path, (peaks, digest) in stream:
+        results[file_path] = peaks
+        if on_result is not None:
+            on_result(file_path, peaks, digest)
+    return [results[f] for f in dat_files]
+
+def write_peaks_summary(output_dir, dat_files, results):
+    """Transposed ';'-separated report: file names in the header, peak frequencies below"""
+    # Collect successful results
+    success_files = []
+    all_peaks = []
+    for file_path, peaks in zip(dat_files, results):
+        if isinstance(peaks, list) and len(peaks) > 0:
+            success_files.append(os.path.basename(file_path))
+            all_peaks.append(peaks)
+    success_count = len(success_files)
+    # Generate CSV report
+    if success_count > 0:
+        max_peaks = max(len(peaks) for peaks in all_peaks)
+        # Pad each peak list to max_peaks length
+        padded_peaks = [peaks + [''] * (max_peaks - len(peaks)) for peaks in all_peaks]
+        # Transpose rows and columns
+        transposed = list(zip(*padded_peaks))
+        # Format values to strings with 2 decimal places
+        formatted_transposed = []
+        for row in transposed:
+            formatted_row = []
+            for val in row:
+                if isinstance(val, float):
+                    formatted_row.append(f"{val:.2f}")
+                else:
+                    formatted_row.append(str(val))
+            formatted_transposed.append(formatted_row)
+        # Write CSV
+        csv_path = os.path.join(output_dir, os.path.basename(os.getcwd()) + "_peaks_summary.csv")
+        with open(csv_path, 'w', encoding='utf-8') as f:
+            # Header with filenames
+            f.write(';'.join(success_files) + '\n')
+            # Write each transposed row
+            for row in formatted_transposed:
+                f.write(';'.join(row) + '\n')
+        print(f"CSV report saved to: {csv_path}")
+    else:
+        print("No peaks detected in any files, CSV report skipped.")
+
+def catalog_table(store, block):
+    """Peaks of the (name, peak frequencies) in block as rows of the catalog, fitted together if FIT_PEAKS"""
+    tables, spectra = [], []
+    for name, peaks in block:
+        freq, amplitude = store.spectrum(name)
+        amplitude = np.asarray(amplitude, dtype='float64')
+        idx = np.clip(np.searchsorted(freq, peaks), 0, len(freq) - 1)
+        smoothed_spectrum = savgol_filter(amplitude, window_length=11, polyorder=2)
+        prominence = peak_prominences(smoothed_spectrum, idx)
+        width = peak_widths(smoothed_spectrum, idx, rel_height=0.5, prominence_data=prominence)[0]
+        tables.append(pd.DataFrame({'file': name, 'frequency': freq[idx], 'amplitude': smoothed_spectrum[idx],
+                                    'prominence': prominence[0], 'width': width * (freq[1] - freq[0])}))
+        spectra.append((freq, amplitude, idx))
+    if FIT_PEAKS:
+        for table, fit in zip(tables, fit_lorentzians(spectra)):
+            for column in FIT_COLUMNS:
+                table[column] = fit[column + '_cm' if column + '_cm' in fit else column].to_numpy()
+    return pd.concat(tables, ignore_index=True)
+
+def write_peak_catalog(output_dir, store_path, names, results, run=None):
+    """
+    Replace the rows of the successful files in <result>/peaks.sqlite with their peaks
+    (amplitude, prominence and width of the smoothed spectrum, Lorentzian fit), FIT_BATCH files per fit
+    """
+    store = SpectrumStore(store_path)
+    done = [(name, peaks) for name, peaks in zip(names, results)
+            if isinstance(peaks, list) and peaks and name in store.index['files']]
+    print(f"Successfully processed: {len(done)}/{len(names)}")
+    if not done:
+        return
+    catalog = PeakCatalog(default_catalog_path(output_dir))
+    run = run or os.path.basename(os.getcwd())
+    count = 0
+    with stage('catalog'):
+        for start in range(0, len(done), FIT_BATCH):
+            count += catalog.replace(run, catalog_table(store, done[start:start + FIT_BATCH]))
+    print(f"Peak catalog: {count} peaks of {len(done)} files saved to {catalog.path}")
+
+def process_file_shard(file_path, plot_data=True, store_path=None):
+    """process_file for a shard run: also returns the wall time for the partial results"""
+    start = perf_counter()
+    try:
+        print(f"Processing: {file_path}")
+        with track_file(file_path):
+            peaks = transform_file(file_path, plot_data, store_path)
+        return peaks, perf_counter() - start
+    except Exception as e:
+        print(f"Error processing {file_path}: {str(e)}")
+        return None, perf_counter() - start
+
+def shard_from_env():
+    """(index, count) of this SLURM array task, None outside of an array job"""
+    if 'SLURM_ARRAY_TASK_ID' not in os.environ:
+        return None
+    task_id = int(os.environ['SLURM_ARRAY_TASK_ID'])
+    task_min = int(os.environ.get('SLURM_ARRAY_TASK_MIN', 0))
+    if 'SLURM_ARRAY_TASK_COUNT' in os.environ:
+        count = int(os.environ['SLURM_ARRAY_TASK_COUNT'])
+    else:
+        count = int(os.environ['SLURM_ARRAY_TASK_MAX']) - task_min + 1
+    return task_id - task_min, count
+
+def select_shard(dat_files, index, count):
+    """Deterministic split balanced by file size: largest first, each to the lightest shard"""
+    loads = [0] * count
+    shards = [[] for _ in range(count)]
+    for file_path in sorted(dat_files, key=lambda f: (-os.path.getsize(f), os.path.basename(f))):
+        lightest = loads.index(min(loads))
+        shards[lightest].append(file_path)
+        loads[lightest] += os.path.getsize(file_path)
+    return sorted(shards[index])
+
+def shard_paths(output_dir, index, count):
+    """(.json, spectrum store) partial results of one shard"""
+    shard_dir = os.path.join(output_dir, 'shards')
+    os.makedirs(shard_dir, exist_ok=True)
+    prefix = os.path.join(shard_dir, f"{os.path.basename(INPUT_DIR)}_shard_{index:04d}_of_{count:04d}")
+    return prefix + '.json', prefix + '_spectra'
+
+def write_shard(output_dir, index, count, shard_files, results, timings):
+    """Partial results of a shard: peaks, status and timings in .json; the spectra are already in its store"""
+    json_path, store_path = shard_paths(output_dir, index, count)
+    files = {}
+    for k, file_path in enumerate(shard_files):
+        name = os.path.basename(file_path)
+        files[name] = {
+            'index': k,
+            'peaks': results.get(file_path),
+            'status': 'failed' if results.get(file_path) is None else 'done',
+            'seconds': timings.get(file_path),
+        }
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump({'index': index, 'count': count, 'store': os.path.basename(store_path), 'files': files}, f, indent=1)
+    print(f"Shard {index + 1}/{count} saved to: {json_path}")
+
+def run_params(plot_data):
+    """Parameters that make old outputs stale when they change"""
+    return {
+        'cutoff_freq': CUTOFF_FREQ,
+        'max_wavenumber': MAX_WAVENUMBER,
+        'resolution': RESOLUTION,
+        'engine': ENGINE,
+        'decimate': DECIMATE,
+        'scale': spectral.SCALE,
+        'window': 'hann',
+        'plot_data': plot_data,
+        'components': COMPONENTS,
+    }
+
+class Ensemble:
+    """Running statistics per frequency axis, fed from the spectrum store row by row"""
+
+    def __init__(self, store_path):
+        self.store = SpectrumStore(store_path)
+        self.axes = {}
+        self.added = set()
+
+    def add(self, file_path):
+        name = os.path.basename(file_path)
+        if name in self.added:
+            return
+        self.store.refresh()
+        entry = self.store.index['files'].get(name)
+        if entry is None:
+            return
+        if entry['axis'] not in self.axes:
+            self.axes[entry['axis']] = RunningSpectrum(self.store.freq(entry['axis']))
+        self.axes[entry['axis']].add(self.store.matrix(entry['axis'])[entry['row']])
+        self.added.add(name)
+
+    def save(self, output_dir, plot=True):
+        """Mean spectrum of the axis shared by the most files"""
+        if not self.axes:
+            return
+        stats = max(self.axes.values(), key=lambda s: s.count)
+        if stats.count < len(self.added):
+            print(f"Mean spectrum over {stats.count}/{len(self.added)} files with the same frequency axis")
+        stats.save(output_dir, plot=plot)
+
+def output_files(file_path, plot_data, store_path=None):
+    output_prefix = output_prefix_for(file_path)
+    store_path = store_path or default_store_path(os.path.dirname(output_prefix))
+    outputs = [os.path.join(store_path, spectrum_store.INDEX)]
+    if COMPONENTS:
+        outputs.append(f"{output_prefix}_component_peaks.csv")
+    if SPECTRUM_CSV:
+        outputs.append(f"{output_prefix}_spectrum.csv")
+    if plot_data:
+        outputs.append(output_prefix + render.SUFFIX)
+    return outputs
+
+def init_worker(stage_init=None):
+    """Pool initializer: an empty Hann window cache for the process, and the stage recorder with --stages"""
+    spectral.init_worker()
+    if stage_init:
+        stages.activate(*stage_init)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='ACF spectra, peaks and plots for all .dat files in the current directory')
+    plots = parser.add_mutually_exclusive_group()
+    plots.add_argument('--no-plots', action='store_true', help='compute only, no plots and no plot data')
+    plots.add_argument('--plots-later', action='store_true',
+                       help='save plot data only; draw later with render.py <result dir>')
+    parser.add_argument('--render-jobs', type=int, default=RENDER_JOBS, help='processes of the render pool')
+    parser.add_argument('--force', action='store_true', help='ignore the manifest and process every file')
+    parser.add_argument('--mem-budget', type=float, default=MEMORY_BUDGET, metavar='GB',
+                        help='memory for the files in flight (default: 80%% of the allocation)')
+    parser.add_argument('--stages', action='store_true',
+                        help='log wall/CPU time and peak RSS of every stage to <dir>_stages.jsonl')
+    parser.add_argument('--profile', action='store_true', help='with --stages: cProfile dump per process in profile/')
+    parser.add_argument('--shard', nargs=2, type=int, metavar=('INDEX', 'COUNT'),
+                        help='process one shard of the files (default: from SLURM_ARRAY_TASK_* if set)')
+    parser.add_argument('--components', action='store_true', default=COMPONENTS,
+                        help='also spectra and peaks of dip_x, dip_y, dip_z and their isotropic sum')
+    return parser.parse_args()
+
+def main():
+    global COMPONENTS
+    args = parse_args()
+    # Set before the pools fork, so the workers see it too
+    COMPONENTS = args.components
     dat_files = [os.path.join(INPUT_DIR, f) for f in os.listdir(INPUT_DIR) if f.endswith('.dat')]
     if not dat_files:
         print("No .dat files found!")
         exit(1)
+    shard = tuple(args.shard) if args.shard else shard_from_env()
+    if shard is not None:
+        dat_files = select_shard(dat_files, *shard)
+        print(f"Shard {shard[0] + 1}/{shard[1]}: {len(dat_files)} files")
+    plot_data = not args.no_plots
+    render_now = plot_data and not args.plots_later
     print(f"Number of files found: {len(dat_files)}")
     print("Processing parameters:")
     print(f"* Number of cores: {min(JOBS, len(dat_files))}")
     print(f"* Cutoff frequency: {CUTOFF_FREQ / 1e12:.1f} THz")
+    print(f"* Batched: {BATCHED and shard is None and not COMPONENTS}")
+    print(f"* Components: {'x, y, z, |dip| and isotropic sum' if COMPONENTS else '|dip| only'}")
+    print(f"* Plots: {'now' if render_now else 'later' if plot_data else 'no'}")
     output_dir = create_output_dir()
-    with Pool(min(JOBS, len(dat_files))) as pool:
-        results = pool.map(process_file, dat_files)
-        # Collect successful results
-        success_files = []
-        all_peaks = []
-        for file_path, peaks in zip(dat_files, results):
-            if isinstance(peaks, list) and len(peaks) > 0:
-                success_files.append(os.path.basename(file_path))
-                all_peaks.append(peaks)
-        success_count = len(success_files)
-        print(f"Successfully processed: {success_count}/{len(dat_files)}")
-        # Generate CSV report
-        if success_count > 0:
-            max_peaks = max(len(peaks) for peaks in all_peaks)
-            # Pad each peak list to max_peaks length
-            padded_peaks = [peaks + [''] * (max_peaks - len(peaks)) for peaks in all_peaks]
-            # Transpose rows and columns
-            transposed = list(zip(*padded_peaks))
-            # Format values to strings with 2 decimal places
-            formatted_transposed = []
-            for row in transposed:
-                formatted_row = []
-                for val in row:
-                    if isinstance(val, float):
-                        formatted_row.append(f"{val:.2f}")
-                    else:
-                        formatted_row.append(str(val))
-                formatted_transposed.append(formatted_row)
-            # Write CSV
-            csv_path = os.path.join(output_dir, os.path.basename(os.getcwd()) + "_peaks_summary.csv")
-            with open(csv_path, 'w', encoding='utf-8') as f:
-                # Header with filenames
-                f.write(';'.join(success_files) + '\n')
-                # Write each transposed row
-                for row in formatted_transposed:
-                    f.write(';'.join(row) + '\n')
-            print(f"CSV report saved to: {csv_path}")
-        else:
-            print("No peaks detected in any files, CSV report skipped.")
\ No newline at end of file
+    # Skip files already done with the same parameters, reject truncated ones before reading them
+    manifest_name = os.path.basename(INPUT_DIR) + "_manifest.json"
+    if shard is not None:
+        # The count is part of the name: a rerun with another split does not skip on a stale shard manifest
+        manifest_name = f"{os.path.basename(INPUT_DIR)}_manifest_shard_{shard[0]:04d}_of_{shard[1]:04d}.json"
+    manifest = Manifest(os.path.join(output_dir, manifest_name), run_params(plot_data))
+    results = {}
+    timings = {}
+    # A shard keeps its spectra apart, reduce_shards.py merges them into <result>/spectra
+    store_path = shard_paths(output_dir, *shard)[1] if shard is not None else default_store_path(output_dir)
+    ensemble = Ensemble(store_path) if ENSEMBLE and shard is None else None
+    todo = []
+    up_to_date = 0
+    for file_path in dat_files:
+        if not args.force and manifest.is_up_to_date(file_path):
+            results[file_path] = manifest.peaks(file_path)
+            up_to_date += 1
+            continue
+        problem = check_complete(file_path)
+        if problem is not None:
+            print(f"Skipping truncated {file_path}: {problem}")
+            manifest.record(file_path, 'failed', error=f"truncated: {problem}")
+            results[file_path] = None
+            continue
+        todo.append(file_path)
+    print(f"* Up to date: {up_to_date}, truncated: {len(dat_files) - up_to_date - len(todo)}, to process: {len(todo)}")
+    if todo:
+        # Stage log: this process (batched transforms) and every pool worker append to it
+        stage_init = None
+        if args.stages:
+            stage_log = os.path.join(output_dir, manifest_name.replace('_manifest', '_stages').replace('.json', '.jsonl'))
+            if os.path.exists(stage_log):
+                os.remove(stage_log)
+            stage_init = (stage_log, os.path.join(output_dir, 'profile') if args.profile else None)
+            stages.activate(*stage_init)
+        worker_init = {'initializer': init_worker, 'initargs': (stage_init,)}
+        # Rendering has its own pool and consumes plot data as soon as a file is computed
+        render_pool = Pool(min(args.render_jobs, len(todo)), **worker_init) if render_now else None
+        rendered = []
+
+        def on_result(file_path, peaks, digest=None):
+            results[file_path] = peaks
+            if peaks is None:
+                manifest.record(file_path, 'failed', error='processing error, see log')
+                return
+            manifest.record(file_path, 'done', peaks=peaks, outputs=output_files(file_path, plot_data, store_path),
+                            digest=digest)
+            if ensemble is not None:
+                ensemble.add(file_path)
+            plot_path = output_prefix_for(file_path) + render.SUFFIX
+            if render_pool is not None and os.path.exists(plot_path):
+                rendered.append(render_pool.apply_async(render.render_file, (plot_path, DPI)))
+
+        jobs = min(JOBS, len(todo))
+        budget = int(args.mem_budget * 2**30) if args.mem_budget is not None else default_budget(jobs)
+        print(f"* Memory budget: {budget / 2**30:.1f} GB")
+        with Pool(jobs, **worker_init) as pool:
+            # SLURM sends SIGTERM before the time limit kill: save what is known and stop
+            def on_sigterm(signum, frame):
+                manifest.mark([f for f in todo if f not in results], 'interrupted')
+                print("SIGTERM received, manifest saved")
+                if render_pool is not None:
+                    render_pool.terminate()
+                sys.exit(128 + signum)
+            signals.signal(signals.SIGTERM, on_sigterm)
+            # Largest files first, as many at a time as the memory budget allows, results as they finish
+            if shard is not None:
+                for done, (file_path, ((peaks, seconds), digest)) in enumerate(imap_budgeted(
+                        pool, partial(with_digest, process_file_shard, plot_data=plot_data, store_path=store_path),
+                        todo, budget, estimate_bytes), 1):
+                    timings[file_path] = seconds
+                    on_result(file_path, peaks, digest)
+                    print(f"[{done}/{len(todo)}] {os.path.basename(file_path)} done")
+            elif BATCHED and not COMPONENTS:
+                # A components file is already transformed as a 2-D block
+                run_batched(pool, todo, plot_data, on_result, budget)
+            else:
+                for done, (file_path, (peaks, digest)) in enumerate(imap_budgeted(
+                        pool, partial(with_digest, process_file, plot_data=plot_data), todo, budget,
+                        estimate_bytes), 1):
+                    on_result(file_path, peaks, digest)
+                    print(f"[{done}/{len(todo)}] {os.path.basename(file_path)} done")
+        if render_pool is not None:
+            render_pool.close()
+            render_pool.join()
+            print(f"Plots rendered: {sum(r.get() for r in rendered)}/{len(rendered)}")
+        elif plot_data:
+            print(f"Plot data saved, render with: python {os.path.join(os.path.dirname(os.path.abspath(__file__)), 'render.py')} {output_dir}")
+        if stage_init:
+            stages.deactivate()
+            print(f"Stage log: {stage_init[0]}")
+            stages.summarize(stage_init[0])
+    if shard is not None:
+        # The summary of a sharded run is written by reduce_shards.py
+        write_shard(output_dir, shard[0], shard[1], dat_files, results, timings)
+        return
+    if PEAKS_CSV:
+        write_peaks_summary(output_dir, dat_files, [results[f] for f in dat_files])
+    write_peak_catalog(output_dir, store_path, [os.path.basename(f) for f in dat_files],
+                       [results[f] for f in dat_files])
+    if ensemble is not None:
+        # Files up to date from an earlier run are only in the store
+        for file_path in dat_files:
+            if results[file_path] is not None:
+                ensemble.add(file_path)
+        ensemble.save(output_dir, plot=plot_data)
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,26 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import os
-import gc
+import sys
 import matplotlib
 import numpy as np
 import pandas as pd
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-from scipy.signal.windows import hann
+import signal as signals
+from functools import partial
 from multiprocessing import Pool, cpu_count
-from scipy.fft import rfft, rfftfreq, irfft
 from scipy.signal import find_peaks, peak_widths, peak_prominences
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import dipole_cache
+import spectral
+from manifest import Manifest, check_complete, file_digest
 
 
 """
 Тут простая обработка: пишем только локальные CSV  в отдельную папку, 
 без картинок, без суммарного CSV.
+Манифест в папке результатов: повторный запуск (после лимита SLURM) пропускает посчитанные файлы.
 
 """
 
@@ -25,6 +30,10 @@ OUTPUT_DIR = os.path.abspath(os.path.join(INPUT_DIR, "..", "result"))
 JOBS = 16
 DPI = 300
 CUTOFF_FREQ = 3e12  # 3 THz
+MAX_WAVENUMBER = 4000  # cm⁻¹, upper edge of the analysed band
+RESOLUTION = None  # cm⁻¹, step of the 'czt' band; None keeps the native rfft bins
+ENGINE = 'fft'  # 'fft'; 'czt' only to sample the band at RESOLUTION (not faster, same O(n) memory)
+DECIMATE = False  # low-pass + downsample the signal to the band before the spectrum
 
 def create_output_dir():
     """Create output directory if it doesn't exist"""
@@ -32,49 +41,39 @@ def create_output_dir():
         os.makedirs(OUTPUT_DIR)
     return OUTPUT_DIR
 
+def run_params():
+    """Parameters that make old outputs stale when they change"""
+    return {
+        'cutoff_freq': CUTOFF_FREQ,
+        'max_wavenumber': MAX_WAVENUMBER,
+        'resolution': RESOLUTION,
+        'engine': ENGINE,
+        'decimate': DECIMATE,
+        'scale': spectral.SCALE,
+        'window': 'hann',
+    }
+
+def output_file(file_path, output_dir):
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(file_path))[0] + "_spectrum.csv")
+
 def process_file(file_path, output_dir):
-    """Process the .dat file"""
+    """Process the .dat file; returns (file_path, file_digest for the manifest) or (file_path, None) on error"""
     try:
         base_name = os.path.splitext(os.path.basename(file_path))[0]
         output_prefix = os.path.join(output_dir, base_name)
         print("Processing: %s" % file_path)
         # Read data
-        df = pd.read_csv(
-            file_path,
-            sep=' ',
-            usecols=['#', 'Unnamed: 8'],
-            dtype={'#': 'int32', 'Unnamed: 8': 'float32'},
-            engine='c'
-        )
-        if df.empty or len(df) < 2:
-            raise ValueError("DataFrame is empty or has less than 2 rows.")
-        print(df.head())
+        data = dipole_cache.load_dipole(file_path)
+        if len(data['frame']) < 2:
+            raise ValueError("Data is empty or has less than 2 rows.")
         # Prepare data
-        time = df['#'].values * 2e-3
-        signal = df['Unnamed: 8'].values.astype('float32')
+        time = data['frame'] * 2e-3
+        signal = np.array(data['|dip|'], dtype='float32')
         signal -= signal.mean()
-        # Autocorrelation
-        n = len(signal)
-        fft_sig = rfft(signal, n=2*n)
-        autocorr = irfft(fft_sig * np.conj(fft_sig), n=2*n)[:n].real
-        autocorr /= np.max(autocorr)
-        del fft_sig
-        gc.collect()
         # Spectral analysis
-        window = hann(n)
-        autocorr_windowed = autocorr * window
-        yf = rfft(autocorr_windowed)
-        xf = rfftfreq(n, d=1e-15)
-        # Frequency filtering
-        cutoff_idx = np.searchsorted(xf, CUTOFF_FREQ)
-        yf[:cutoff_idx] = 0
-        # Convert to cm⁻¹
-        xf_cm = (xf * 1e-12) / 0.03
-        mask = xf_cm <= 4000
-        xf_filtered = xf_cm[mask]
-        spectrum = 2.0 / n * np.abs(yf[:len(mask)][mask])
-        # Scale spectrum
-        spectrum *= 10000
+        xf_filtered, spectrum = spectral.acf_spectrum(signal, engine=ENGINE, cutoff_freq=CUTOFF_FREQ,
+                                                      max_wavenumber=MAX_WAVENUMBER, resolution=RESOLUTION,
+                                                      decimate=DECIMATE)
         # Save spectrum to CSV
         spectrum_df = pd.DataFrame({
             'Frequency_cm-1': xf_filtered,
@@ -84,10 +83,12 @@ def process_file(file_path, output_dir):
             spectrum_df.to_csv("%s_spectrum.csv" % output_prefix, index=False)
         except Exception as e:
             print(f"Ошибка при сохранении CSV: {e}")
-        return True
+            return file_path, None
+        # Hashed here, while the file is still in the page cache
+        return file_path, file_digest(file_path)
     except Exception as e:
         print("Error processing %s: %s" % (file_path, str(e)))
-        return False
+        return file_path, None
 
 def main():
     dat_files = [
@@ -105,11 +106,41 @@ def main():
     print("* Cutoff frequency: %.1f THz" % (CUTOFF_FREQ / 1e12))
     
     output_dir = create_output_dir()
-    
-    with Pool(min(JOBS, len(dat_files))) as pool:
-        results = pool.starmap(process_file, [(file_path, output_dir) for file_path in dat_files])
-        success_count = sum(results)
+    # Own manifest: plot_spectrum_AI_detect.py writes to the same result directory with other parameters
+    manifest = Manifest(os.path.join(output_dir, os.path.basename(INPUT_DIR) + "_simple_manifest.json"), run_params())
+    todo = []
+    success_count = 0
+    for file_path in dat_files:
+        if manifest.is_up_to_date(file_path):
+            success_count += 1
+            continue
+        problem = check_complete(file_path)
+        if problem is not None:
+            print("Skipping truncated %s: %s" % (file_path, problem))
+            manifest.record(file_path, 'failed', error="truncated: %s" % problem)
+            continue
+        todo.append(file_path)
+    print("* Up to date: %d, to process: %d" % (success_count, len(todo)))
+    if not todo:
         print("Successfully processed: %d/%d" % (success_count, len(dat_files)))
+        return
+
+    finished = set()
+    with Pool(min(JOBS, len(todo)), initializer=spectral.init_worker) as pool:
+        # SLURM sends SIGTERM before the time limit kill: save what is known and stop
+        def on_sigterm(signum, frame):
+            manifest.mark([f for f in todo if f not in finished], 'interrupted')
+            print("SIGTERM received, manifest saved")
+            sys.exit(128 + signum)
+        signals.signal(signals.SIGTERM, on_sigterm)
+        for file_path, digest in pool.imap_unordered(partial(process_file, output_dir=output_dir), todo):
+            finished.add(file_path)
+            if digest is None:
+                manifest.record(file_path, 'failed', error='processing error, see log')
+                continue
+            manifest.record(file_path, 'done', outputs=[output_file(file_path, output_dir)], digest=digest)
+            success_count += 1
+    print("Successfully processed: %d/%d" % (success_count, len(dat_files)))
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
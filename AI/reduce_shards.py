@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import glob
+import json
+import argparse
+import subprocess
+import numpy as np
+import plot_spectrum_AI_detect as detect
+from mean_spectre import RunningSpectrum
+from spectrum_store import SpectrumStore, default_path
+
+"""
+Сборка результатов массива задач SLURM (plot_spectrum_AI_detect.py --shard / SLURM_ARRAY_TASK_ID):
+общий каталог пиков peaks.sqlite, средний спектр и сводка времени по шардам.
+Запускать из той же папки с .dat, что и шарды.
+Локальная проверка без SLURM: python reduce_shards.py --run-local 4
+"""
+
+
+def run_local(count, detect_args=()):
+    """Run count shards as subprocesses with faked SLURM array variables"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plot_spectrum_AI_detect.py')
+    processes = []
+    for index in range(count):
+        env = dict(os.environ, SLURM_ARRAY_TASK_ID=str(index), SLURM_ARRAY_TASK_MIN='0',
+                   SLURM_ARRAY_TASK_MAX=str(count - 1), SLURM_ARRAY_TASK_COUNT=str(count))
+        processes.append(subprocess.Popen([sys.executable, script, *detect_args], env=env))
+    failed = [index for index, process in enumerate(processes) if process.wait() != 0]
+    if failed:
+        print(f"Shards failed: {failed}")
+    return not failed
+
+
+def load_shards(output_dir):
+    """Shard .json files and spectrum stores of the current input directory, checked for completeness"""
+    pattern = os.path.join(output_dir, 'shards', f"{os.path.basename(detect.INPUT_DIR)}_shard_*_of_*.json")
+    shards = []
+    for json_path in sorted(glob.glob(pattern)):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            shard = json.load(f)
+        shard['store'] = os.path.join(os.path.dirname(json_path), shard['store'])
+        shards.append(shard)
+    if shards:
+        counts = {shard['count'] for shard in shards}
+        if len(counts) > 1:
+            raise ValueError(f"Shards of different runs in {output_dir}: counts {sorted(counts)}")
+        missing = sorted(set(range(counts.pop())) - {shard['index'] for shard in shards})
+        if missing:
+            print(f"Warning: shards missing: {missing}")
+    return shards
+
+
+def reduce(output_dir, plot=True):
+    shards = load_shards(output_dir)
+    if not shards:
+        print("No shard results found!")
+        return False
+    names, results, timings = [], [], []
+    # Shard stores are appended to the store of the directory, as a single-node run leaves it
+    store = SpectrumStore(default_path(output_dir))
+    for shard in shards:
+        if os.path.exists(shard['store']):
+            store.merge(SpectrumStore(shard['store']))
+        for name, entry in sorted(shard['files'].items()):
+            names.append(name)
+            results.append(entry['peaks'])
+            if entry['seconds'] is not None:
+                timings.append(entry['seconds'])
+    # Peak catalog (and report) as a single-node run writes them
+    if detect.PEAKS_CSV:
+        detect.write_peaks_summary(output_dir, names, results)
+    detect.write_peak_catalog(output_dir, default_path(output_dir), names, results)
+    if timings:
+        print(f"Processing time: total {sum(timings):.1f} s, max {max(timings):.1f} s, "
+              f"mean {np.mean(timings):.1f} s over {len(timings)} files in {len(shards)} shards")
+    # Mean spectrum over the files sharing the most common frequency axis
+    done = [name for name, peaks in zip(names, results) if peaks is not None and name in store.index['files']]
+    if done:
+        axes = {}
+        for name in done:
+            axes.setdefault(store.index['files'][name]['axis'], []).append(name)
+        axis, group = max(axes.items(), key=lambda item: len(item[1]))
+        if len(group) < len(done):
+            print(f"Mean spectrum over {len(group)}/{len(done)} files with the same frequency axis")
+        stats = RunningSpectrum(store.freq(axis))
+        for name in group:
+            stats.add(store.spectrum(name)[1])
+        stats.save(output_dir, plot=plot)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge shard results of plot_spectrum_AI_detect.py')
+    parser.add_argument('--run-local', type=int, metavar='COUNT',
+                        help='first run COUNT shards here as subprocesses (faked SLURM_ARRAY_* variables)')
+    parser.add_argument('--no-plots', action='store_true',
+                        help='no mean spectrum plot (implied by --no-plots among the shard arguments)')
+    parser.add_argument('detect_args', nargs=argparse.REMAINDER,
+                        help='arguments passed to the shards after --, e.g. -- --no-plots')
+    args = parser.parse_args()
+    detect_args = [a for a in args.detect_args if a != '--']
+    if args.run_local and not run_local(args.run_local, detect_args):
+        sys.exit(1)
+    plot = not (args.no_plots or '--no-plots' in detect_args)
+    if not reduce(detect.create_output_dir(), plot):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import glob
+import argparse
+import numpy as np
+from multiprocessing import Pool
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import dipole_cache
+from downsample import downsample
+from stages import stage, track_file
+
+"""
+Отрисовка графиков отдельно от расчета спектров.
+plot_spectrum_AI_detect.py пишет <name>_plot.npz (спектр, сглаженный спектр, пики, путь к .dat),
+а картинки строятся здесь - в отдельном пуле процессов или потом, другой задачей:
+    python render.py /path/to/result --jobs 16
+"""
+
+DPI = 300
+JOBS = 16
+SUFFIX = '_plot.npz'
+
+
+def _pyplot():
+    """matplotlib.pyplot on Agg, imported on first drawing: importing this module for save_plot_data does not load it"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def save_plot_data(output_prefix, file_path, xf_filtered, smoothed_spectrum, selected_peaks):
+    """Write everything the plots need next to the other outputs; returns the .npz path"""
+    path = output_prefix + SUFFIX
+    np.savez(path, source=np.array(os.path.abspath(file_path)), xf=xf_filtered,
+             smoothed=smoothed_spectrum, peaks=np.array(selected_peaks, dtype=float).reshape(-1, 2))
+    return path
+
+
+def plot_original(output_prefix, time, signal, dpi=DPI):
+    plt = _pyplot()
+    plt.figure(figsize=(12, 6))
+    plt.plot(*downsample(time, signal), 'b-', lw=0.8)
+    plt.xlabel("Time (ps)")
+    plt.ylabel("Dipole moment (D)")
+    plt.grid(True, alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(f"{output_prefix}_original.png", dpi=dpi, bbox_inches='tight')
+    plt.close()
+
+
+def plot_spectrum(output_prefix, xf_filtered, smoothed_spectrum, selected_peaks, dpi=DPI):
+    plt = _pyplot()
+    plt.figure(figsize=(12, 6))
+    plt.plot(*downsample(xf_filtered, smoothed_spectrum), 'k-', lw=0.8, label='_nolegend_')
+    for freq, amp in selected_peaks:
+        plt.scatter(freq, amp, color='red', marker='x', s=100, label=f'{freq:.2f} cm⁻¹')
+    plt.legend(title=None, loc="upper right")
+    plt.xlabel("Frequency (cm⁻¹)")
+    plt.ylabel("Spectral ACF EDM Amplitude (a. u.)")
+    plt.grid(True, alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(f"{output_prefix}_spectrum.png", dpi=dpi, bbox_inches='tight')
+    plt.close()
+
+
+def render_file(plot_data_path, dpi=DPI):
+    """Draw <name>_original.png and <name>_spectrum.png from a _plot.npz file"""
+    try:
+        output_prefix = plot_data_path[:-len(SUFFIX)]
+        with np.load(plot_data_path) as plot_data:
+            source = str(plot_data['source'])
+            xf_filtered = plot_data['xf']
+            smoothed_spectrum = plot_data['smoothed']
+            selected_peaks = plot_data['peaks'].tolist()
+        with track_file(source), stage('png'):
+            # The raw signal is not duplicated in the .npz: it is mapped from the dipole cache
+            data = dipole_cache.load_dipole(source)
+            time = data['frame'] * 2e-3  # Convert fs to ps
+            signal = np.array(data['|dip|'], dtype='float32')
+            signal -= signal.mean()
+            plot_original(output_prefix, time, signal, dpi)
+            del time, signal, data
+            plot_spectrum(output_prefix, xf_filtered, smoothed_spectrum, selected_peaks, dpi)
+        return True
+    except Exception as e:
+        print(f"Error rendering {plot_data_path}: {str(e)}")
+        return False
+
+
+def render_dir(output_dir, jobs=JOBS, dpi=DPI):
+    """Render every _plot.npz in output_dir with its own process pool"""
+    plot_files = sorted(glob.glob(os.path.join(output_dir, '*' + SUFFIX)))
+    if not plot_files:
+        print(f"No {SUFFIX} files in {output_dir}")
+        return 0
+    with Pool(min(jobs, len(plot_files))) as pool:
+        results = pool.starmap(render_file, [(path, dpi) for path in plot_files])
+    print(f"Rendered: {sum(results)}/{len(plot_files)}")
+    return sum(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render spectrum plots saved by plot_spectrum_AI_detect.py')
+    parser.add_argument('output_dir', nargs='?', default=os.getcwd())
+    parser.add_argument('--jobs', type=int, default=JOBS)
+    parser.add_argument('--dpi', type=int, default=DPI)
+    args = parser.parse_args()
+    render_dir(args.output_dir, args.jobs, args.dpi)
+
+
+if __name__ == '__main__':
+    main()
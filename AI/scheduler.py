@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import threading
+from functools import partial
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import dipole_cache
+
+"""
+Планировщик файлов для пула с учетом памяти.
+Пиковая память на файл оценивается по числу строк (из кэша или по размеру текста),
+задачи выдаются в пул (imap_unordered) только пока сумма оценок влезает в бюджет RAM,
+самые большие файлы идут первыми. Результаты приходят по мере готовности.
+"""
+
+BYTES_PER_SAMPLE = 64  # measured peak of process_file ('fft' engine) per row of the .dat file
+WORKER_RSS = 160 * 2**20  # resident size of a worker after the imports
+MEMORY_FRACTION = 0.8  # share of the available memory given to the pool
+SAMPLE_BYTES = 1 << 16  # text read to estimate the line length
+COUNT_BLOCK = 16 << 20  # bytes per read when counting lines
+
+
+def estimate_rows(file_path):
+    """Rows of a dipole .dat file: exact from a fresh cache, otherwise from the mean line length"""
+    if dipole_cache.is_fresh(file_path):
+        return dipole_cache.cached_rows(file_path)
+    with open(file_path, 'rb') as f:
+        head = f.read(SAMPLE_BYTES)
+    lines = head.count(b'\n')
+    if lines == 0:
+        return 0
+    return int(os.path.getsize(file_path) * lines / len(head))
+
+
+def count_rows(file_path):
+    """Rows of a dipole .dat file: exact from a fresh cache, otherwise by counting line breaks, without parsing"""
+    if dipole_cache.is_fresh(file_path):
+        return dipole_cache.cached_rows(file_path)
+    lines = 0
+    last = b'\n'
+    with open(file_path, 'rb') as f:
+        for block in iter(partial(f.read, COUNT_BLOCK), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1  # no line break after the last row
+    return max(lines - 1, 0)  # header line
+
+
+def estimate_peak_bytes(file_path):
+    """Peak memory of processing one file, bytes"""
+    return estimate_rows(file_path) * BYTES_PER_SAMPLE
+
+
+def available_memory():
+    """Memory this job may use: the SLURM allocation if any, otherwise MemAvailable"""
+    if 'SLURM_MEM_PER_NODE' in os.environ:
+        return int(os.environ['SLURM_MEM_PER_NODE']) * 2**20
+    if 'SLURM_MEM_PER_CPU' in os.environ:
+        cpus = int(os.environ.get('SLURM_CPUS_ON_NODE', os.cpu_count() or 1))
+        return int(os.environ['SLURM_MEM_PER_CPU']) * cpus * 2**20
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+def default_budget(workers):
+    """Bytes for file tasks: a fraction of the available memory minus the idle workers"""
+    return max(int(available_memory() * MEMORY_FRACTION) - workers * WORKER_RSS, 0)
+
+
+class _Admission:
+    """Feeds tasks to the pool while their estimated memory fits the budget"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.in_use = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def tasks(self, items, sizes):
+        # Runs in the task handler thread of the pool
+        for item in items:
+            with self.condition:
+                # A file larger than the whole budget still runs, alone
+                while not self.closed and self.in_use > 0 and self.in_use + sizes[item] > self.budget:
+                    self.condition.wait(1.0)
+                if self.closed:
+                    return
+                self.in_use += sizes[item]
+            yield item
+
+    def release(self, size):
+        with self.condition:
+            self.in_use -= size
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+def _tagged(func, item):
+    return item, func(item)
+
+
+def imap_budgeted(pool, func, items, budget, estimate=estimate_peak_bytes):
+    """
+    Yield (item, func(item)) in completion order, largest items first, keeping the sum of
+    estimate(item) over queued and running items within budget bytes.
+    """
+    sizes = {item: estimate(item) for item in items}
+    order = sorted(items, key=lambda item: sizes[item], reverse=True)
+    for item in order:
+        if sizes[item] > budget:
+            print(f"Warning: {os.path.basename(item)} needs ~{sizes[item] / 2**30:.1f} GB, "
+                  f"more than the budget {budget / 2**30:.1f} GB; it will run alone")
+    admission = _Admission(budget)
+    try:
+        for item, result in pool.imap_unordered(partial(_tagged, func), admission.tasks(order, sizes)):
+            admission.release(sizes[item])
+            yield item, result
+    finally:
+        admission.close()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import numpy as np
+from scipy.fft import rfft, rfftfreq, irfft, next_fast_len
+from scipy.signal import zoom_fft
+from scipy.signal.windows import hann
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import decimate as decimation
+from stages import stage
+
+"""
+Спектр АКФ дипольного момента (общий код для plot_spectrum_AI_*.py).
+Движки:
+  fft - как раньше: rfft(2n) -> irfft (АКФ) -> окно Ханна -> rfft, три больших преобразования;
+  czt - только для шага по частоте: последнее rfft заменено на chirp-z (zoom FFT), бины полосы
+        [cutoff_freq, max_wavenumber] считаются с заданным шагом (мельче или крупнее 1/(n dt)).
+        АКФ по-прежнему строится на всю длину, так что память O(n) и время не меньше, чем у fft
+        (на нативных бинах медленнее) - это не ускорение, поэтому czt нет в ENGINES.
+С decimate=True перед любым движком сигнал прореживается (common/decimate.py).
+АКФ считается на месте (|X|^2 в массиве преобразования, длина next_fast_len(2n - 1)),
+окна Ханна хранятся в процессе от файла к файлу; init_worker - инициализатор Pool.
+"""
+
+TIMESTEP = 1e-15  # 1 fs
+CUTOFF_FREQ = 3e12  # 3 THz
+MAX_WAVENUMBER = 4000  # cm⁻¹
+SCALE = 10000
+CACHE_WINDOWS = 4  # window lengths kept per process
+
+_windows = {}
+
+
+def init_worker():
+    """Pool initializer: an empty window cache for this process"""
+    _windows.clear()
+
+
+def hann_window(n, dtype='float64'):
+    """hann(n) in dtype, built once per process for the last CACHE_WINDOWS lengths"""
+    key = (n, np.dtype(dtype).str)
+    if key not in _windows:
+        if len(_windows) >= CACHE_WINDOWS:
+            _windows.pop(next(iter(_windows)))
+        _windows[key] = hann(n).astype(dtype)
+    return _windows[key]
+
+
+def _windowed_autocorr(signal, workers=None):
+    """Hann-windowed, max-normalised linear autocorrelation along the last axis (two transforms)"""
+    with stage('acf'):
+        n = signal.shape[-1]
+        # Any length >= 2n - 1 keeps the circular correlation free of wrap-around
+        size = next_fast_len(2 * n - 1, real=True)
+        spectrum = rfft(signal, n=size, axis=-1, workers=workers)
+        # |X|^2 in place (no conjugate and product copies); irfft may use it as work space
+        spectrum.real **= 2
+        spectrum.imag **= 2
+        spectrum.real += spectrum.imag
+        spectrum.imag = 0
+        autocorr = irfft(spectrum, n=size, axis=-1, workers=workers, overwrite_x=True)[..., :n]
+        del spectrum
+        autocorr /= np.max(autocorr, axis=-1, keepdims=True)
+        # Windowed in the precision of the signal, as the transforms before
+        autocorr *= hann_window(n, autocorr.dtype)
+        return autocorr
+
+
+def _transform_fft(signal, workers=None):
+    """rfft of the Hann-windowed, max-normalised autocorrelation (three transforms)"""
+    autocorr_windowed = _windowed_autocorr(signal, workers)
+    with stage('fft'):
+        return rfft(autocorr_windowed, axis=-1, workers=workers)
+
+
+_FULL_RANGE = {
+    'fft': _transform_fft,
+}
+ENGINES = tuple(_FULL_RANGE)  # the engines to pick for speed
+RESOLUTION_ENGINES = ('czt',)  # band at a chosen step, at full-length ACF cost
+
+
+def windowed_acf_transform(signal, engine='fft', workers=None):
+    """Transform of the windowed autocorrelation over all rfft bins (full-range engines)"""
+    if engine not in _FULL_RANGE:
+        raise ValueError("Unknown full-range spectrum engine: %s (use one of %s)" % (engine, ', '.join(_FULL_RANGE)))
+    return _FULL_RANGE[engine](signal, workers)
+
+
+def band_axis(n, dt=TIMESTEP, cutoff_freq=CUTOFF_FREQ, max_wavenumber=MAX_WAVENUMBER, resolution=None):
+    """
+    Frequencies (Hz) of the band [cutoff_freq, max_wavenumber].
+    Without resolution (cm⁻¹) the native rfft bins are used, so 'czt' matches 'fft' bin for bin.
+    """
+    f_max = max_wavenumber * 0.03e12
+    if resolution is None:
+        # Same bins and the same comparisons as rfftfreq + cutoff + mask in the full-range path
+        df = 1.0 / (n * dt)
+        k = np.arange(max(int(cutoff_freq / df) - 1, 0), min(int(f_max / df) + 2, n // 2 + 1))
+        xf = k * df
+        return xf[(xf >= cutoff_freq) & ((xf * 1e-12) / 0.03 <= max_wavenumber)]
+    step = resolution * 0.03e12
+    count = int(np.floor((f_max - cutoff_freq) / step)) + 1
+    return cutoff_freq + np.arange(count) * step
+
+
+def _band_spectrum(signal, dt, cutoff_freq, max_wavenumber, resolution, workers=None):
+    n = signal.shape[-1]
+    xf = band_axis(n, dt, cutoff_freq, max_wavenumber, resolution)
+    if len(xf) == 0:
+        return xf, np.empty(signal.shape[:-1] + (0,))
+    autocorr_windowed = _windowed_autocorr(signal, workers)
+    end = xf[-1] if len(xf) > 1 else xf[0] + 1.0 / (n * dt)
+    with stage('czt'):
+        yf = zoom_fft(autocorr_windowed, [xf[0], end], m=len(xf), fs=1.0 / dt, endpoint=len(xf) > 1, axis=-1)
+        return xf, yf
+
+
+def acf_spectrum(signal, engine='fft', cutoff_freq=CUTOFF_FREQ, max_wavenumber=MAX_WAVENUMBER, dt=TIMESTEP,
+                 resolution=None, decimate=False, workers=None):
+    """
+    Return (frequency in cm⁻¹, amplitude) of the ACF spectrum up to max_wavenumber.
+    Full-range engines return the axis from 0 with bins below cutoff_freq set to zero;
+    'czt' returns only the band starting at cutoff_freq, with the step resolution (cm⁻¹) if given;
+    it still builds the full-length ACF, so it changes the resolution, not the cost.
+    decimate=True low-passes and downsamples the signal first (dropping the last n % factor samples);
+    the bin step is 1/(n'*dt) with n' = n - n % factor and amplitudes stay on the undecimated scale.
+    A 2-D signal (equal-length series in rows) is transformed along the last axis in one
+    call; workers is passed to scipy.fft.
+    """
+    band_fraction = 1.0
+    if decimate:
+        power = _mean_power(signal)
+        with stage('decimate'):
+            signal, dt, factor = decimation.decimate(signal, dt, max_wavenumber * 0.03e12)
+        # The ACF is normalised by c[0]; the filter removed the power above the band from it
+        if factor > 1:
+            band_fraction = _mean_power(signal) / np.where(power > 0, power, 1.0)
+    n = signal.shape[-1]
+    if engine == 'czt':
+        xf, yf = _band_spectrum(signal, dt, cutoff_freq, max_wavenumber, resolution, workers)
+        spectrum = 2.0 / n * np.abs(yf)
+        spectrum *= SCALE * band_fraction
+        return (xf * 1e-12) / 0.03, spectrum
+    yf = windowed_acf_transform(signal, engine, workers)
+    xf = rfftfreq(n, d=dt)
+    # Apply frequency cutoff
+    cutoff_idx = np.searchsorted(xf, cutoff_freq)
+    yf[..., :cutoff_idx] = 0
+    # Convert to cm⁻¹ and limit to max_wavenumber
+    xf_cm = (xf * 1e-12) / 0.03
+    mask = xf_cm <= max_wavenumber
+    xf_filtered = xf_cm[mask]
+    spectrum = np.abs(yf[..., :len(xf_filtered)])
+    spectrum *= 2.0 / n * SCALE * band_fraction
+    return xf_filtered, spectrum
+
+
+def _mean_power(signal):
+    """Mean square along the last axis, shaped to broadcast against spectra"""
+    return np.einsum('...i,...i->...', signal, signal)[..., np.newaxis] / signal.shape[-1]
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import fcntl
+import hashlib
+import argparse
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+"""
+Общее бинарное хранилище спектров вместо <name>_spectrum.csv на каждый файл.
+Папка <result>/spectra:
+  <ось>.freq.npy - общая ось частот (cm⁻¹); имя оси <bins>_<хэш частот>, так что спектры одной длины
+                   с разным шагом (другие dt, число кадров) лежат в разных матрицах;
+  <ось>.f32      - матрица амплитуд float32, строка на файл, строки только дописываются;
+  index.json      - имя файла -> (ось, строка); дополнительные спектры файла (компоненты диполя)
+                    хранятся под именем <файл>:<компонента>.
+Читатели открывают матрицу через np.memmap, ничего не разбирая. Пишут процессы пула
+параллельно, под блокировкой (fcntl.flock). Повторно посчитанный файл получает новую строку,
+старая остается мертвой до compact(). CSV по запросу:
+    python spectrum_store.py export <result>/spectra [names...]
+"""
+
+DIRNAME = 'spectra'
+INDEX = 'index.json'
+LOCK = '.lock'
+COMPONENT_SEP = ':'
+FREQ_DECIMALS = 6  # cm^-1 kept when hashing an axis, below the noise of the float64 grid
+
+
+def default_path(output_dir):
+    return os.path.join(output_dir, DIRNAME)
+
+
+def key(name, component=None):
+    """Store name of a file spectrum, or of one of its component spectra"""
+    return name if component is None else f"{name}{COMPONENT_SEP}{component}"
+
+
+def axis_key(freq):
+    """Name of the axis of freq: bin count and a hash of the values"""
+    digest = hashlib.blake2b(np.round(freq, FREQ_DECIMALS).tobytes(), digest_size=6).hexdigest()
+    return f"{len(freq)}_{digest}"
+
+
+def split_key(stored_name):
+    """(file name, component or None)"""
+    name, _, component = stored_name.partition(COMPONENT_SEP)
+    return name, component or None
+
+
+class SpectrumStore:
+    """Append-only spectra sharing frequency axes, one float32 row per file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._index = None
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, INDEX))
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, LOCK), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_index(self):
+        index_path = os.path.join(self.path, INDEX)
+        if not os.path.exists(index_path):
+            return {'axes': {}, 'files': {}}
+        with open(index_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_index(self, index):
+        index_path = os.path.join(self.path, INDEX)
+        tmp_path = "%s.%d.tmp" % (index_path, os.getpid())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = self._read_index()
+        return self._index
+
+    def refresh(self):
+        self._index = None
+
+    def _axis_files(self, axis):
+        base = os.path.join(self.path, axis)
+        return base + '.freq.npy', base + '.f32'
+
+    def append(self, name, freq, amplitude):
+        """Store the spectrum of name (replacing an older one); returns the index path"""
+        freq = np.asarray(freq, dtype='float64')
+        amplitude = np.asarray(amplitude, dtype='<f4')
+        if freq.shape != amplitude.shape or freq.ndim != 1:
+            raise ValueError("freq and amplitude must be 1-D of the same length")
+        axis = axis_key(freq)
+        with self._locked():
+            index = self._read_index()
+            freq_path, data_path = self._axis_files(axis)
+            entry = index['axes'].get(axis)
+            if entry is None:
+                np.save(freq_path, freq)
+                entry = index['axes'][axis] = {'rows': 0, 'bins': len(freq)}
+            elif not np.allclose(np.load(freq_path, mmap_mode='r'), freq, rtol=0, atol=1e-6):
+                raise ValueError("%s: frequency axis differs from the stored axis %s" % (name, axis))
+            row = entry['rows']
+            # Rows past the index are left by an interrupted append: overwrite them
+            with open(data_path, 'ab') as f:
+                f.truncate(row * amplitude.nbytes)
+                f.write(amplitude.tobytes())
+            entry['rows'] = row + 1
+            index['files'][name] = {'axis': axis, 'row': row}
+            self._write_index(index)
+            self._index = index
+        return os.path.join(self.path, INDEX)
+
+    def names(self):
+        return sorted(self.index['files'])
+
+    def axes(self, component=None):
+        """{axis: names} for every stored axis; file spectra by default, or those of one component"""
+        groups = {}
+        for name, entry in sorted(self.index['files'].items()):
+            if split_key(name)[1] == component:
+                groups.setdefault(entry['axis'], []).append(name)
+        return groups
+
+    def bins(self, axis):
+        """Spectrum length of an axis (stores written before content keys name axes by it)"""
+        return self.index['axes'][axis].get('bins') or int(axis)
+
+    def freq(self, axis):
+        return np.load(self._axis_files(axis)[0], mmap_mode='r')
+
+    def matrix(self, axis):
+        """Read-only memory map (rows, bins) of all rows of an axis, dead rows included"""
+        rows = self.index['axes'][axis]['rows']
+        return np.memmap(self._axis_files(axis)[1], dtype='<f4', mode='r', shape=(rows, self.bins(axis)))
+
+    def spectrum(self, name):
+        """(freq, amplitude) of name, both memory-mapped"""
+        entry = self.index['files'][name]
+        return self.freq(entry['axis']), self.matrix(entry['axis'])[entry['row']]
+
+    def rows(self, axis, names=None):
+        """(names, row numbers) of the live rows of an axis, in name order"""
+        if names is None:
+            names = sorted(name for name, entry in self.index['files'].items() if entry['axis'] == axis)
+        return names, [self.index['files'][name]['row'] for name in names]
+
+    def export_csv(self, name, csv_path):
+        """The former <name>_spectrum.csv"""
+        freq, amplitude = self.spectrum(name)
+        pd.DataFrame({'Frequency_cm-1': freq, 'Amplitude': amplitude}).to_csv(csv_path, index=False)
+        return csv_path
+
+    def merge(self, other):
+        """Append every spectrum of another store (e.g. a shard); identical ones are not duplicated"""
+        for name in other.names():
+            freq, amplitude = other.spectrum(name)
+            if name in self.index['files'] and np.array_equal(self.spectrum(name)[1], amplitude):
+                continue
+            self.append(name, freq, amplitude)
+
+    def compact(self):
+        """Rewrite the matrices without dead rows"""
+        with self._locked():
+            index = self._read_index()
+            self._index = index
+            for axis in list(index['axes']):
+                names, rows = self.rows(axis)
+                live = np.array(self.matrix(axis)[rows]) if rows else np.empty((0, self.bins(axis)), dtype='<f4')
+                data_path = self._axis_files(axis)[1]
+                tmp_path = "%s.%d.tmp" % (data_path, os.getpid())
+                live.tofile(tmp_path)
+                os.replace(tmp_path, data_path)
+                index['axes'][axis]['rows'] = len(names)
+                for row, name in enumerate(names):
+                    index['files'][name]['row'] = row
+            self._write_index(index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect, export and merge spectrum stores')
+    sub = parser.add_subparsers(dest='command', required=True)
+    listing = sub.add_parser('list', help='stored files per frequency axis')
+    listing.add_argument('store')
+    export = sub.add_parser('export', help='write <name>_spectrum.csv files')
+    export.add_argument('store')
+    export.add_argument('names', nargs='*', help='default: all')
+    export.add_argument('--output-dir', default=os.getcwd())
+    merge = sub.add_parser('merge', help='append the spectra of other stores')
+    merge.add_argument('store')
+    merge.add_argument('others', nargs='+')
+    compact = sub.add_parser('compact', help='drop rows replaced by later runs')
+    compact.add_argument('store')
+    args = parser.parse_args()
+    store = SpectrumStore(args.store)
+    if args.command != 'merge' and not store.exists():
+        print(f"No spectrum store in {args.store}")
+        sys.exit(1)
+    if args.command == 'list':
+        for axis in sorted(store.index['axes'], key=lambda axis: (store.bins(axis), axis)):
+            names = store.rows(axis)[0]
+            freq = store.freq(axis)
+            step = freq[1] - freq[0] if len(freq) > 1 else 0.0
+            print(f"{axis}: {store.bins(axis)} bins, step {step:.6g} cm-1, {len(names)} spectra")
+            for name in names:
+                print(f"  {name}")
+    elif args.command == 'export':
+        for stored_name in args.names or store.names():
+            name, component = split_key(stored_name)
+            base_name = os.path.splitext(name)[0] + (f"_{component}" if component else '')
+            print(store.export_csv(stored_name, os.path.join(args.output_dir, f"{base_name}_spectrum.csv")))
+    elif args.command == 'merge':
+        for other in args.others:
+            store.merge(SpectrumStore(other))
+        print(f"{len(store.names())} spectra in {args.store}")
+    else:
+        store.compact()
+
+
+if __name__ == '__main__':
+    main()
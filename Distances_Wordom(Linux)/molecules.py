@@ -1,5 +1,8 @@
 import os
+import sys
 import xlsxwriter
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import namd_log
 
 # CONSTANTS
 concentrations = []
@@ -22,26 +25,7 @@ def Molecules():
             concentrations.append(float(dirname))
             # TAKE ATOMS NUMBER
             os.chdir(main_path + dirname)
-            with open(logFile, 'r') as f:
-                for i in range(181):
-                    x = f.readline()
-            l = len(x)
-            integ = []
-            i = 0
-            while i < l:
-                s_int = ''
-                a = x[i]
-                while '0' <= a <= '9':
-                    s_int += a
-                    i += 1
-                    if i < l:
-                        a = x[i]
-                    else:
-                        break
-                i += 1
-                if s_int != '':
-                    integ.append(int(s_int))
-            atoms = int(integ[0])
+            atoms = namd_log.read_log_info(logFile).atoms
             atomsNum.append(atoms)
     expenses = [[concentrations[i], atomsNum[i]] for i in range(len(concentrations))]
     expenses.sort(key=lambda x: x[0])
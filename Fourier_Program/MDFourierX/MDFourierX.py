@@ -10,6 +10,47 @@ from pandas import Series
 from scipy import fftpack
 from PyQt5 import QtWidgets
 import subprocess
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'common'))
+from downsample import downsample
+import namd_energy
+from qt_workers import Worker, Tasks
+CHUNK_ROWS = 1000000  # CSV rows per step of upload: progress, cancel and the partial energy curve
+# -----------------------------------------------------------------------------------------------------------------------
+
+
+def readEnergyCsv(worker, csvfile, atoms):
+    """(times s, energies eV per atom) of the TS and ENERGY columns, read in chunks"""
+    if csvfile.endswith(('.log', '.npz')):
+        # NAMD log or its extracted ENERGY columns: TS and the total energy, as in the CSV exports
+        columns = namd_energy.load_energy(csvfile, ['TS', namd_energy.ENERGY_COLUMN], progress=worker.progress)
+        return columns['TS']*(10**(-15)), columns[namd_energy.ENERGY_COLUMN] / atoms * 0.0434
+    size = os.path.getsize(csvfile)
+    times = []
+    energies = []
+    with open(csvfile, 'r') as f:
+        for chunk in pd.read_csv(f, usecols=['TS', 'ENERGY'], chunksize=CHUNK_ROWS):
+            times.append(chunk['TS'].to_numpy()*(10**(-15)))
+            energies.append(chunk['ENERGY'].to_numpy() / atoms * 0.0434)
+            worker.partial((times[-1], energies[-1]))
+            worker.progress(f.tell(), size)
+    return np.concatenate(times), np.concatenate(energies)
+
+
+def computeSpectrum(worker, newTimes, newEnergies, sampleRate):
+    """Hann-windowed |FFT|; returns the attributes the plots and saveData use"""
+    xSamp = np.array(newTimes)
+    ySamp = np.array(newEnergies)
+    window = np.hanning(int(round(len(xSamp))))
+    y_res = ySamp * window
+    worker.check()
+    energies_fft = sp.fftpack.fft(np.array(y_res))
+    energies_psd = np.abs(energies_fft)
+    fftFreq = sp.fftpack.fftfreq(
+        len(energies_fft), 1 / sampleRate)
+    i = fftFreq > 0
+    reverseCm = 1/((3*(10**10))/(fftFreq[i]))
+    return {'xSamp': xSamp, 'ySamp': ySamp, 'window': window, 'y_res': y_res, 'energies_psd': energies_psd,
+            'fftFreq': fftFreq, 'i': i, 'reverseCm': reverseCm}
 # -----------------------------------------------------------------------------------------------------------------------
 
 
@@ -17,6 +58,7 @@ class MainApplication(QtWidgets.QMainWindow, Ui_designX.Ui_MDFourier):
     def __init__(self):
         super().__init__()
         self.setupUi(self)
+        self.tasks = Tasks(self)
         self.directory = False
         self.data = None
         self.times = []
@@ -43,60 +85,67 @@ class MainApplication(QtWidgets.QMainWindow, Ui_designX.Ui_MDFourier):
 # -----------------------------------------------------------------------------------------------------------------------
 
     def upload(self):
-        try:
-            self.newTimes = []
-            self.newEnergies = []
-            self.atoms = float(self.atomNumValue.value())
-            self.df = pd.read_csv(self.csvfile)
-            self.newTimes = self.df['TS']
-            self.newEnergies = self.df['ENERGY']
-            self.newTimes = np.array(Series.tolist(self.newTimes))*(10**(-15))
-            self.newEnergies = np.array(Series.tolist(self.newEnergies))
-            try:
-                self.newEnergies = self.newEnergies / self.atoms * 0.0434
-            except RuntimeWarning:
-                pass
-            self.cutTime = float(self.newTimes[1] - self.newTimes[0])
-            self.sampleRate = float(round(float(1 / float(self.cutTime))))
-            self.tsLabel.setText(str(self.cutTime) + " s")
-            self.srLabel.setText(str(float(self.sampleRate)/(10**12))+" THz")
-            self.mlLabel.setText(str(len(self.newTimes)))
-            self.graphicsView_energy.setBackground('w')
-            self.graphicsView_energy.setLabel('bottom', 'time', units='s')
-            self.graphicsView_energy.setLabel('left', 'Energy', units='eV')
-            self.graphicsView_energy.plot(
-                self.newTimes, self.newEnergies, pen='b')
-            self.directory = os.path.dirname(self.csvfile)
-        except ValueError:
-            pass
+        """Read the energy CSV on a worker thread; the curve grows as the chunks arrive"""
+        if self.tasks.busy() or not getattr(self, 'csvfile', None):
+            return None
+        self.newTimes = []
+        self.newEnergies = []
+        self.partialTimes = []
+        self.partialEnergies = []
+        self.atoms = float(self.atomNumValue.value())
+        self.graphicsView_energy.clear()
+        self.graphicsView_energy.setBackground('w')
+        self.energyCurve = self.graphicsView_energy.plot(pen='b')
+        return self.tasks.start(Worker(readEnergyCsv, self.csvfile, self.atoms), self.uploadDone,
+                                self.uploadPartial, 'Reading')
+
+    def uploadPartial(self, chunk):
+        self.partialTimes.append(chunk[0])
+        self.partialEnergies.append(chunk[1])
+        self.energyCurve.setData(
+            *downsample(np.concatenate(self.partialTimes), np.concatenate(self.partialEnergies)))
+
+    def uploadDone(self, result):
+        self.newTimes, self.newEnergies = result
+        self.partialTimes = []
+        self.partialEnergies = []
+        self.cutTime = float(self.newTimes[1] - self.newTimes[0])
+        self.sampleRate = float(round(float(1 / float(self.cutTime))))
+        self.tsLabel.setText(str(self.cutTime) + " s")
+        self.srLabel.setText(str(float(self.sampleRate)/(10**12))+" THz")
+        self.mlLabel.setText(str(len(self.newTimes)))
+        self.graphicsView_energy.clear()
+        self.graphicsView_energy.setBackground('w')
+        self.graphicsView_energy.setLabel('bottom', 'time', units='s')
+        self.graphicsView_energy.setLabel('left', 'Energy', units='eV')
+        self.graphicsView_energy.plot(
+            *downsample(self.newTimes, self.newEnergies), pen='b')
+        self.directory = os.path.dirname(self.csvfile)
 # ----------------------------------------------------------------------------------------------------------------------
 
     def goProcess(self):
+        """FFT on a worker thread, the curves are drawn when it is done"""
+        if self.tasks.busy():
+            return None
         self.graphicsView_fourier.clear()
-        self.xSamp = []
-        self.ySamp = []
-        self.xSamp = np.array(self.newTimes)
-        self.ySamp = np.array(self.newEnergies)
-        self.window = np.hanning(int(round(len(self.xSamp))))
-        self.y_res = self.ySamp * self.window
-        energies_fft = sp.fftpack.fft(np.array(self.y_res))
-        self.energies_psd = np.abs(energies_fft)
-        self.fftFreq = sp.fftpack.fftfreq(
-            len(energies_fft), 1 / float(self.sampleRate))
-        self.i = self.fftFreq > 0
-        self.reverseCm = 1/((3*(10**10))/(self.fftFreq[self.i]))
+        return self.tasks.start(Worker(computeSpectrum, self.newTimes, self.newEnergies, float(self.sampleRate)),
+                                self.processDone, text='FFT')
+
+    def processDone(self, result):
+        for name, value in result.items():
+            setattr(self, name, value)
         self.graphicsView_fourier.setBackground('w')
         self.graphicsView_fourier.setLabel('bottom', 'k', units='cm^-1')
         self.graphicsView_fourier.setLabel('left', 'Amplitude', units=None)
         if self.naturalBox.isChecked():
             self.graphicsView_fourier.plot(
-                self.reverseCm, self.energies_psd[self.i], pen='r')
+                *downsample(self.reverseCm, self.energies_psd[self.i]), pen='r')
         if self.logBox.isChecked():
             self.graphicsView_fourier.plot(
-                self.reverseCm, np.log10(self.energies_psd[self.i]), pen='b')
+                *downsample(self.reverseCm, np.log10(self.energies_psd[self.i])), pen='b')
         if self.tenLogsBox.isChecked():
             self.graphicsView_fourier.plot(
-                self.reverseCm, 10 * np.log10(self.energies_psd[self.i]), pen='r')
+                *downsample(self.reverseCm, 10 * np.log10(self.energies_psd[self.i])), pen='r')
 # ----------------------------------------------------------------------------------------------------------------------
 
     def misc(self):
@@ -409,6 +409,14 @@ class Ui_MDFourier(object):
         self.gaussBox_2.setStyleSheet("color: rgb(81, 0, 255)")
         self.gaussBox_2.setObjectName("gaussBox_2")
         self.horizontalLayout_6.addWidget(self.gaussBox_2)
+        self.decimateBox = QtWidgets.QCheckBox(self.widget_2)
+        font = QtGui.QFont()
+        font.setFamily("Rockwell")
+        font.setPointSize(10)
+        self.decimateBox.setFont(font)
+        self.decimateBox.setStyleSheet("color: rgb(81, 0, 255)")
+        self.decimateBox.setObjectName("decimateBox")
+        self.horizontalLayout_6.addWidget(self.decimateBox)
         self.widget_23 = QtWidgets.QWidget(self.widget_2)
         self.widget_23.setObjectName("widget_23")
         self.horizontalLayout_17 = QtWidgets.QHBoxLayout(self.widget_23)
@@ -666,6 +674,7 @@ class Ui_MDFourier(object):
         self.atomNumValue_2.setText(_translate("MDFourier", "SR(fs)"))
         self.gaussBox.setText(_translate("MDFourier", "Hamming"))
         self.gaussBox_2.setText(_translate("MDFourier", "Sin"))
+        self.decimateBox.setText(_translate("MDFourier", "Decimate"))
         self.sigmaLabel_3.setText(_translate("MDFourier", "Period"))
         self.naturalBox.setText(_translate("MDFourier", "Pure Energy"))
         self.logBox.setText(_translate("MDFourier", "Log 10"))
@@ -9,11 +9,132 @@ from pandas import Series
 from scipy import fftpack
 from PyQt5 import QtWidgets
 import subprocess
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'common'))
+import decimate
+from downsample import downsample
+import namd_table
+import namd_log
+import namd_energy
+import stages
+from qt_workers import Worker, Tasks
+MAX_WAVENUMBER = 4000  # cm^-1, band kept by the optional decimation
+STAGE_LOG = 'MDFourier_stages.jsonl'  # with --stages: time/RSS of the goProcess stages, in the start directory
+STAGE_ENV = 'MDFOURIER_STAGES'  # or this variable set to the log path
+CHUNK_BYTES = 16 << 20  # text read per step of upload: progress, cancel and the partial energy curve
+#-----------------------------------------------------------------------------------------------------------------------
+def readInputs(worker, logfile, datafile, csvfile, dcdfile, atoms):
+    """upload() on a worker thread: whatever of log/.dat, energy CSV and dipole table is selected"""
+    result = {}
+    if logfile is not None:
+        info = namd_log.read_log_info(logfile)
+        ions = info.atoms
+        result['ions'] = ions
+        result['duration'] = info.duration
+    if datafile is not None:
+        result['times'], result['energies'] = readEnergyDat(worker, datafile, ions)
+    if csvfile is not None and csvfile.endswith(('.log', '.npz')):
+        # NAMD log or its extracted ENERGY columns: TS and the total energy, as in the CSV exports
+        columns = namd_energy.load_energy(csvfile, ['TS', namd_energy.ENERGY_COLUMN], progress=worker.progress)
+        result['newTimes'] = columns['TS']*(10**(-15))
+        result['newEnergies'] = columns[namd_energy.ENERGY_COLUMN] / atoms * 0.0434
+    elif csvfile is not None:
+        size = os.path.getsize(csvfile)
+        chunks = []
+        with open(csvfile, 'r') as f:
+            for chunk in pd.read_csv(f, usecols=['TS', 'ENERGY'], chunksize=1000000):
+                chunks.append(chunk)
+                worker.partial((chunk['TS'].to_numpy()*(10**(-15)), chunk['ENERGY'].to_numpy() / atoms * 0.0434))
+                worker.progress(f.tell(), size)
+        df = pd.concat(chunks, ignore_index=True)
+        newEnergies = np.array(Series.tolist(df['ENERGY']))
+        try:
+            newEnergies = newEnergies / atoms * 0.0434
+        except RuntimeWarning:
+            pass
+        result['newTimes'] = np.array(Series.tolist(df['TS']))*(10**(-15))
+        result['newEnergies'] = newEnergies
+    if dcdfile is not None:
+        # frame, dip_x, dip_y, dip_z, |dip| straight from the whitespace table (no dipoles.csv copy)
+        columns = namd_table.read_columns(dcdfile, ['int64'] + ['float64'] * 4)
+        result['frames'] = columns[0]
+        result['dipMoment'] = columns[4]
+    return result
+#-----------------------------------------------------------------------------------------------------------------------
+def readEnergyDat(worker, datafile, ions):
+    """Time (s) and energy per atom of a "<step> <energy>" .dat, parsed in blocks straight into arrays"""
+    size = os.path.getsize(datafile)
+    _, positions = namd_table.layout(datafile, 0)
+    if len(positions) == 2:
+        times = []
+        energies = []
+        try:
+            for (steps, energy), done in namd_table.iter_columns(datafile, ['int64', 'float64'], 0, block_size=CHUNK_BYTES):
+                times.append(steps*(10**(-15)))
+                energies.append(energy / ions * 0.0434)
+                worker.partial((times[-1], energies[-1]))
+                worker.progress(done, size)
+        except ValueError:  # a line that is not two numbers: the line-by-line parser below takes any text
+            worker.partial(None)
+        else:
+            if times:
+                return np.concatenate(times), np.concatenate(energies)
+            return np.array([]), np.array([])
+    times = []
+    energies = []
+    done = 0
+    with open(datafile, 'r') as f:
+        my_lines = f.readlines(CHUNK_BYTES)
+        while my_lines:
+            start = len(times)
+            done += sum(map(len, my_lines))
+            for i in my_lines:
+                raw_time = re.findall(r'\d+ ', i)
+                for a in raw_time:
+                    times.append(int(a))
+                raw_energy = re.findall(r'(?<=\s).*\d+.\d+', i)
+                for b in raw_energy:
+                    energies.append(float(b) / ions * 0.0434)
+            worker.partial((np.array(times[start:])*(10**(-15)), np.array(energies[start:])))
+            worker.progress(done, size)
+            my_lines = f.readlines(CHUNK_BYTES)
+    return np.array(times)*(10**(-15)), np.array(energies)
+#-----------------------------------------------------------------------------------------------------------------------
+def computeSpectrum(worker, source, xSamp, ySamp, sampleRate, decimated, gauss):
+    """goProcess() on a worker thread: |FFT| of the series; returns the attributes the plots and saveData use"""
+    result = {'source': source}
+    with stages.track_file(source):
+        xSamp = np.array(xSamp)
+        ySamp = np.array(ySamp)
+        # Optional decimation: same bin step, |FFT| rescaled by the factor to match the full series
+        fftRate = sampleRate
+        fftScale = 1
+        if decimated:
+            with stages.stage('decimate'):
+                ySamp, dt, fftScale = decimate.decimate(ySamp, 1 / fftRate, MAX_WAVENUMBER * 3 * (10**10))
+                xSamp = xSamp[::fftScale][:len(ySamp)]
+                fftRate = 1 / dt
+        worker.check()
+        y_res = ySamp
+        if gauss:
+            with stages.stage('window'):
+                result['window'] = np.hanning(int(round(len(xSamp))))
+                result['y_res'] = y_res = ySamp * result['window']
+            worker.check()
+        with stages.stage('fft'):
+            energies_fft = sp.fftpack.fft(np.array(y_res))
+            result['energies_psd'] = np.abs(energies_fft) * fftScale
+            result['fftFreq'] = sp.fftpack.fftfreq(len(energies_fft), 1 / fftRate)
+            result['i'] = result['fftFreq'] > 0
+            if gauss:
+                result['reverseCm'] = 1/((3*(10**10))/(result['fftFreq'][result['i']]))
+    result.update(xSamp=xSamp, ySamp=ySamp, fftRate=fftRate, fftScale=fftScale)
+    return result
 #-----------------------------------------------------------------------------------------------------------------------
 class MainApplication(QtWidgets.QMainWindow, Fourier.Ui_MDFourier):
     def __init__(self):
         super().__init__()
         self.setupUi(self)
+        self.tasks = Tasks(self)
         self.directory = False
         self.data = None
         self.times = []
@@ -124,41 +245,48 @@ class MainApplication(QtWidgets.QMainWindow, Fourier.Ui_MDFourier):
         self.logLabel_2.setText(os.path.basename(self.dcdfile))
 #-----------------------------------------------------------------------------------------------------------------------
     def upload(self):
+        """Parse the selected files on a worker thread; the energy curve grows as the file is read"""
+        if self.tasks.busy():
+            return None
         self.sampleRate = None
         self.graphicsView_energy.clear()
         self.times = []
         self.energies = []
-        try:
-            with open(self.logfile, 'r') as file:
-                line = file.readlines()
-                for i in line:
-                    if re.findall(r'Info: \d+ ATOMS\n', i):
-                        ions = re.search(r'\d+', i)
-                        ions = int(ions.group(0))
-                self.atomLabel.setText(str(ions))
-        except TypeError:
-            pass
-        #---------------------------------------------------------------------------------------------------------------
-        try:
-            with open(self.logfile, 'r') as file:
-                lastLine = file.readlines()[-5]
-                duration = re.findall(r'\d+', lastLine)
-                self.duration = int(duration[0])
-                NS = round(float(self.duration/1000000), 3)
+        self.newTimes = []
+        self.newEnergies = []
+        self.frames = []
+        self.dipMoment = []
+        self.partialTimes = []
+        self.partialEnergies = []
+        self.graphicsView_energy.setBackground('w')
+        self.energyCurve = self.graphicsView_energy.plot(pen='b')
+        worker = Worker(readInputs, self.logfile, self.datafile, self.csvfile, self.dcdfile,
+                        float(self.atomNumValue.value()))
+        return self.tasks.start(worker, self.uploadDone, self.uploadPartial, 'Reading')
+
+    def uploadPartial(self, chunk):
+        if chunk is None:  # the reader starts over
+            self.partialTimes = []
+            self.partialEnergies = []
+            self.energyCurve.setData([], [])
+            return
+        self.partialTimes.append(chunk[0])
+        self.partialEnergies.append(chunk[1])
+        self.energyCurve.setData(*downsample(np.concatenate(self.partialTimes), np.concatenate(self.partialEnergies)))
+
+    def uploadDone(self, result):
+        self.graphicsView_energy.clear()
+        self.partialTimes = []
+        self.partialEnergies = []
+        if 'ions' in result:
+            self.atomLabel.setText(str(result['ions']))
+        if 'duration' in result:
+            self.duration = result['duration']
+            NS = round(float(self.duration/1000000), 3)
             self.durLabel.setText(str(NS) + " ns")
-        except TypeError:
-            pass
-        try:
-            with open(self.datafile, 'r') as f:
-                my_lines = f.readlines()
-            for i in my_lines:
-                raw_time = re.findall(r'\d+ ', i)
-                for a in raw_time:
-                    self.times.append(int(a))
-                raw_energy = re.findall(r'(?<=\s).*\d+.\d+', i)
-                for b in raw_energy:
-                    self.energies.append(float(b) / ions * 0.0434)
-            self.times = np.array(self.times)*(10**(-15))
+        if 'energies' in result:
+            self.times = result['times']
+            self.energies = result['energies']
             self.mlLabel.setText(str(len(self.times)))
             self.cutTime = float(self.times[1]-self.times[0])
             self.sampleRate = round(float(1/self.cutTime))
@@ -167,23 +295,10 @@ class MainApplication(QtWidgets.QMainWindow, Fourier.Ui_MDFourier):
             self.graphicsView_energy.setBackground('w')
             self.graphicsView_energy.setLabel('bottom', 'time', units='s')
             self.graphicsView_energy.setLabel('left', 'Energy', units='eV')
-            self.graphicsView_energy.plot(self.times, self.energies, pen='b', )
-        except TypeError:
-            pass
-        # ---------------------------------------------------------------------------------------------------------------
-        try:
-            self.newTimes=[]
-            self.newEnergies=[]
-            self.atoms = float(self.atomNumValue.value())
-            self.df = pd.read_csv(self.csvfile)
-            self.newTimes = self.df['TS']
-            self.newEnergies = self.df['ENERGY']
-            self.newTimes = np.array(Series.tolist(self.newTimes))*(10**(-15))
-            self.newEnergies = np.array(Series.tolist(self.newEnergies))
-            try:
-                self.newEnergies = self.newEnergies / self.atoms * 0.0434
-            except RuntimeWarning:
-                pass
+            self.graphicsView_energy.plot(*downsample(self.times, self.energies), pen='b', )
+        if 'newEnergies' in result:
+            self.newTimes = result['newTimes']
+            self.newEnergies = result['newEnergies']
             self.cutTime = float(self.newTimes[1] - self.newTimes[0])
             self.sampleRate = float(round(float(1 / float(self.cutTime))))
             self.tsLabel.setText(str(self.cutTime) + " s")
@@ -192,83 +307,54 @@ class MainApplication(QtWidgets.QMainWindow, Fourier.Ui_MDFourier):
             self.graphicsView_energy.setBackground('w')
             self.graphicsView_energy.setLabel('bottom', 'time', units='s')
             self.graphicsView_energy.setLabel('left', 'Energy', units='eV')
-            self.graphicsView_energy.plot(self.newTimes, self.newEnergies, pen='b')
+            self.graphicsView_energy.plot(*downsample(self.newTimes, self.newEnergies), pen='b')
             self.directory = os.path.dirname(self.csvfile)
-        except ValueError:
-            pass
-#-----------------------------------------------------------------------------------------------------------------------
-        try:
-            out = []
-            file = open(self.dcdfile, 'r+')
-            for line in file.readlines():
-                newLine = ' '.join(line.split()) + '\n'
-                out.append(newLine)
-            file.close()
-            out[0] = 'frame dip_x dip_y dip_z abs\n'
-            newFile = open('./dipoles.csv', 'w')
-            for string in out:
-                newFile.write(string)
-            newFile.close()
-            df = pd.read_csv('./dipoles.csv', sep=' ')
-            self.frames = np.array(df['frame'].tolist())
-            self.dipMoment = np.array(df['abs'].tolist())
+        if 'dipMoment' in result:
+            self.frames = result['frames']
+            self.dipMoment = result['dipMoment']
             self.graphicsView_energy.setBackground('w')
             self.graphicsView_energy.setLabel('bottom', 'frame', units=None)
             self.graphicsView_energy.setLabel('left', 'Dipole Moment', units='rel. u.')
-            self.graphicsView_energy.plot(self.frames, self.dipMoment, pen='b')
+            self.graphicsView_energy.plot(*downsample(self.frames, self.dipMoment), pen='b')
             self.sampleRate = round(1/(float(self.srNumValue.value())*(10**(-15))))
             self.srLabel.setText(str(float(self.sampleRate)/(10**12))+" THz")
             self.mlLabel.setText(str(len(self.frames)))
             self.tsLabel.setText(str(float(self.srNumValue.value())*(10**(-15)))+" s")
             self.directory = os.path.dirname(self.dcdfile)
-        except TypeError:
-            pass
 # ----------------------------------------------------------------------------------------------------------------------
     def goProcess(self):
+        """FFT on a worker thread, the curves are drawn when it is done"""
+        if self.tasks.busy():
+            return None
         self.graphicsView_fourier.clear()
-        self.xSamp = []
-        self.ySamp = []
         if self.logfile is not None:
-            self.xSamp = np.array(self.times)
-            self.ySamp = np.array(self.energies)
+            xSamp, ySamp = self.times, self.energies
         elif self.csvfile is not None:
-            self.xSamp = np.array(self.newTimes)
-            self.ySamp = np.array(self.newEnergies)
+            xSamp, ySamp = self.newTimes, self.newEnergies
         else:
-            self.xSamp = np.array(self.frames)
-            self.ySamp = np.array(self.dipMoment)
+            xSamp, ySamp = self.frames, self.dipMoment
+        worker = Worker(computeSpectrum, str(self.logfile or self.csvfile or self.dcdfile), xSamp, ySamp,
+                        float(self.sampleRate), self.decimateBox.isChecked(), self.gaussBox.isChecked())
+        return self.tasks.start(worker, self.processDone, text='FFT')
 
-        if self.gaussBox.isChecked():
-            self.window = np.hanning(int(round(len(self.xSamp))))
-            self.y_res = self.ySamp * self.window
-            energies_fft = sp.fftpack.fft(np.array(self.y_res))
-            self.energies_psd = np.abs(energies_fft)
-            self.fftFreq = sp.fftpack.fftfreq(len(energies_fft), 1 / float(self.sampleRate))
-            self.i = self.fftFreq > 0
-            self.reverseCm = 1/((3*(10**10))/(self.fftFreq[self.i]))
-            self.graphicsView_fourier.setBackground('w')
-            self.graphicsView_fourier.setLabel('bottom', 'k', units='cm^-1')
-            self.graphicsView_fourier.setLabel('left', 'Amplitude', units=None)
-            if self.naturalBox.isChecked():
-                self.graphicsView_fourier.plot(self.reverseCm, self.energies_psd[self.i], pen='r')
-            if self.logBox.isChecked():
-                self.graphicsView_fourier.plot(self.reverseCm, np.log10(self.energies_psd[self.i]), pen='b')
-            if self.tenLogsBox.isChecked():
-                self.graphicsView_fourier.plot(self.reverseCm, 10 * np.log10(self.energies_psd[self.i]), pen='r')
-        else:
-            energies_fft = sp.fftpack.fft(np.array(self.ySamp))
-            self.energies_psd = np.abs(energies_fft)
-            self.fftFreq = sp.fftpack.fftfreq(len(energies_fft), 1 / float(self.sampleRate))
-            self.i = self.fftFreq > 0
+    def processDone(self, result):
+        for name, value in result.items():
+            setattr(self, name, value)
+        with stages.track_file(result['source']), stages.stage('plot'):
             self.graphicsView_fourier.setBackground('w')
-            self.graphicsView_fourier.setLabel('bottom', 'k', units='cm-1')
             self.graphicsView_fourier.setLabel('left', 'Amplitude', units=None)
+            if 'reverseCm' in result:
+                self.graphicsView_fourier.setLabel('bottom', 'k', units='cm^-1')
+                x = self.reverseCm
+            else:
+                self.graphicsView_fourier.setLabel('bottom', 'k', units='cm-1')
+                x = self.fftFreq[self.i]
             if self.naturalBox.isChecked():
-                self.graphicsView_fourier.plot(self.fftFreq[self.i], self.energies_psd[self.i], pen='r')
+                self.graphicsView_fourier.plot(*downsample(x, self.energies_psd[self.i]), pen='r')
             if self.logBox.isChecked():
-                self.graphicsView_fourier.plot(self.fftFreq[self.i], np.log10(self.energies_psd[self.i]), pen='b')
+                self.graphicsView_fourier.plot(*downsample(x, np.log10(self.energies_psd[self.i])), pen='b')
             if self.tenLogsBox.isChecked():
-                self.graphicsView_fourier.plot(self.fftFreq[self.i], 10 * np.log10(self.energies_psd[self.i]), pen='r')
+                self.graphicsView_fourier.plot(*downsample(x, 10 * np.log10(self.energies_psd[self.i])), pen='r')
 # ----------------------------------------------------------------------------------------------------------------------
     def saveData(self):
         df = pandas.DataFrame()
@@ -308,9 +394,16 @@ class MainApplication(QtWidgets.QMainWindow, Fourier.Ui_MDFourier):
         subprocess.run(['vmd'])
 # ----------------------------------------------------------------------------------------------------------------------
 def main():
-    app = QtWidgets.QApplication(sys.argv)
+    # openFiles changes the working directory, so the log path is fixed here
+    stage_log = os.environ.get(STAGE_ENV) or (STAGE_LOG if '--stages' in sys.argv else None)
+    if stage_log:
+        stage_log = os.path.abspath(stage_log)
+        stages.activate(stage_log)
+    app = QtWidgets.QApplication([arg for arg in sys.argv if arg != '--stages'])
     window = MainApplication()
     window.show()
     app.exec_()
+    if stage_log:
+        stages.summarize(stage_log)
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,9 +1,12 @@
 import os
+import sys
 import re
 import numpy as np
 import pandas as pd
 from matplotlib import pyplot as plt
 from scipy.interpolate import make_interp_spline
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import namd_energy
 
 l=list()
 fig = plt.figure()
@@ -12,6 +15,8 @@ amino_acids = list()
 legend = list()
 frequencies = list()
 energy_type = ['KINETIC', 'POTENTIAL']
+# Hand-made .dat exports or ENERGY columns extracted from the logs (namd_energy.py)
+energy_files = ('.dat', namd_energy.SUFFIX)  # not other .npz
 field_amplitudes = [0.0435,	0.087,	0.1305,	0.174,	0.2175,
                     0.261,	0.3045,	0.348,	0.3915,	0.435,	0.4785,	0.522]
 norm_freq = [0 , 100, 200, 300, 400, 500]
@@ -31,7 +36,7 @@ print('Frequencies is ', ticks)
 for address, dirs, names in os.walk(directory):
     for name in names:
         filename, file_extension = os.path.splitext(name)
-        if file_extension == ".dat":
+        if name.endswith(energy_files):
             amino_acid = re.search(r'^\w{,2}[^\_]', filename)
             amino_acid = amino_acid.group(0)
             amino_acids.append(amino_acid)
@@ -50,9 +55,9 @@ for i in amino_acids:
             files = sorted(files)
             for file in files:
                 filename, file_extension = os.path.splitext(file)
-                if file_extension == ".dat":
-                    one_file_data = pd.read_csv(
-                        directory+"/"+str(f)+'/'+i+"/"+file, delimiter=' ', index_col=None, header=[0])
+                if file.endswith(energy_files):
+                    filename = namd_energy.table_name(file)
+                    one_file_data = namd_energy.read_energy_table(directory+"/"+str(f)+'/'+i+"/"+file, [j])
                     data[(str(filename)+"_"+j)] = round((one_file_data[j])*0.0434/5400, 3) # переводим усл.ед. в эВ
             last_moment_energies = list()
             for energy_column in data.columns.values:
@@ -2,10 +2,14 @@
 
 
 import os
+import sys
 import re
 import pandas as pd
 import numpy as np
 from matplotlib import pyplot as plt
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import dipole_cache
+from downsample import downsample
 
 # df = pd.DataFrame()
 files = os.listdir(os.getcwd())
@@ -29,10 +33,7 @@ for i in files:
     if file_extension == ".dat":
         name = os.path.basename(i)
         print(i)
-        df = pd.read_csv(dirPath+'/'+i, sep=' ')
-        df.dropna(how='all', axis=1, inplace=True)
-        df.rename(columns={'#': 'frame', 'Unnamed: 2': 'dip_x', 'Unnamed: 4': 'dip_y',
-                  'Unnamed: 6': 'dip_z', 'Unnamed: 8': '|dip|'}, inplace=True)
+        df = dipole_cache.read_dipole_frame(dirPath+'/'+i)
         dip_x_1.append(df['dip_x'].tolist())
         dip_y_1.append(df['dip_y'].tolist())
         dip_z_1.append(df['dip_z'].tolist())
@@ -73,7 +74,7 @@ for i in files:
 
         # Make plot
         plt.gcf().clear()
-        plt.plot(np.array(dipole["Time (ps)"].tolist()), np.array(dipole["dip_x"].tolist()), color='crimson', linewidth=2)
+        plt.plot(*downsample(dipole["Time (ps)"].to_numpy(), dipole["dip_x"].to_numpy()), color='crimson', linewidth=2)
         plt.ylabel('Dipole Moment (D)')
         plt.xlabel('Time (ps)')
         plt.grid()
@@ -81,7 +82,7 @@ for i in files:
         print('Dip X picture saved...')
 
         plt.gcf().clear()
-        plt.plot(np.array(dipole["Time (ps)"].tolist()), np.array(dipole["dip_y"].tolist()), color='darkmagenta', linewidth=2)
+        plt.plot(*downsample(dipole["Time (ps)"].to_numpy(), dipole["dip_y"].to_numpy()), color='darkmagenta', linewidth=2)
         plt.ylabel('Dipole Moment (D)')
         plt.xlabel('Time (ps)')
         plt.grid()
@@ -89,7 +90,7 @@ for i in files:
         print('Dip Y picture saved...')
 
         plt.gcf().clear()
-        plt.plot(np.array(dipole["Time (ps)"].tolist()), np.array(dipole["dip_z"].tolist()), color='indigo', linewidth=2)
+        plt.plot(*downsample(dipole["Time (ps)"].to_numpy(), dipole["dip_z"].to_numpy()), color='indigo', linewidth=2)
         plt.ylabel('Dipole Moment (D)')
         plt.xlabel('Time (ps)')
         plt.grid()
@@ -97,7 +98,7 @@ for i in files:
         print('Dip Z picture saved...')
 
         plt.gcf().clear()
-        plt.plot(np.array(dipole["Time (ps)"].tolist()), np.array(dipole["|dip|"].tolist()), color='darkblue', linewidth=2)
+        plt.plot(*downsample(dipole["Time (ps)"].to_numpy(), dipole["|dip|"].to_numpy()), color='darkblue', linewidth=2)
         plt.ylabel('Dipole Moment (D)')
         plt.xlabel('Time (ps)')
         plt.grid()
@@ -106,10 +107,10 @@ for i in files:
 
 
         plt.gcf().clear()
-        plt.plot(np.array(dipole["Time (ps)"].tolist()), np.array(dipole["dip_x"].tolist()), color='crimson', linewidth=1)
-        plt.plot(np.array(dipole["Time (ps)"].tolist()), np.array(dipole["dip_y"].tolist()), color='darkmagenta', linewidth=1)
-        plt.plot(np.array(dipole["Time (ps)"].tolist()), np.array(dipole["dip_z"].tolist()), color='green', linewidth=1)
-        plt.plot(np.array(dipole["Time (ps)"].tolist()), np.array(dipole["|dip|"].tolist()), color='darkblue', linewidth=1)
+        plt.plot(*downsample(dipole["Time (ps)"].to_numpy(), dipole["dip_x"].to_numpy()), color='crimson', linewidth=1)
+        plt.plot(*downsample(dipole["Time (ps)"].to_numpy(), dipole["dip_y"].to_numpy()), color='darkmagenta', linewidth=1)
+        plt.plot(*downsample(dipole["Time (ps)"].to_numpy(), dipole["dip_z"].to_numpy()), color='green', linewidth=1)
+        plt.plot(*downsample(dipole["Time (ps)"].to_numpy(), dipole["|dip|"].to_numpy()), color='darkblue', linewidth=1)
         plt.ylabel('Dipole Moment (D)')
         plt.xlabel('Time (ps)')
         plt.grid()
@@ -1,9 +1,13 @@
 # Здесь считаем полный дипольный момент для нескольких реализаций 
 import os
+import sys
 import re
 import pandas as pd
 import numpy as np
 from matplotlib import pyplot as plt
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import dipole_cache
+from downsample import downsample
 
 data = pd.DataFrame()
 
@@ -14,10 +18,7 @@ for i in os.listdir(os.getcwd()):
         number = re.search(r'\d+', filename)
         number = number.group(0)
         print(number)
-        df = pd.read_csv(os.getcwd()+'/'+i, sep=' ')
-        df.dropna(how='all', axis=1, inplace=True)
-        df.rename(columns={'#': 'frame', 'Unnamed: 2': 'dip_x', 'Unnamed: 4': 'dip_y',
-                  'Unnamed: 6': 'dip_z', 'Unnamed: 8': '|dip|'}, inplace=True)
+        df = dipole_cache.read_dipole_frame(os.getcwd()+'/'+i)
         data['N='+number] = df['|dip|'] 
     
 
@@ -27,8 +28,10 @@ data = data.set_index('Time (ps)')
 print(data.head())    
 # # data = data.drop(columns=['N=3', 'N=4', 'N=5', 'N=7', 'N=8', 'N=10', 'N=11', 'N=13', 'N=14', 'N=16', 'N=17'], axis=1)
 # # data = data.drop(columns=['N=1', 'N=2', 'N=6', 'N=9', 'N=12'], axis=1)
-data.plot(linewidth = 1, legend=False)
+for column in data.columns:
+    plt.plot(*downsample(data.index.to_numpy(), data[column].to_numpy()), linewidth = 1)
 plt.grid()
+plt.xlabel('Time (ps)')
 plt.ylabel('Dipole Moment (D)')
 # plt.legend(data.columns)
 # plt.show()
@@ -1,4 +1,5 @@
 import os
+import sys
 import re
 import numpy as np
 import scipy as sc
@@ -6,6 +7,9 @@ import pandas as pd
 from scipy import signal
 from matplotlib import pyplot as plt
 import matplotlib as mpl
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import dipole_cache
+from downsample import downsample
 
 average = list()
 field_dict = dict()
@@ -17,10 +21,7 @@ for address, dirs, names in os.walk(os.getcwd()):
             a = re.search(r'\d+', name)
             a = int(a.group(0))
             print(name)
-            df = pd.read_csv(os.getcwd() + '/' + name, sep=' ')
-            df.dropna(how='all', axis=1, inplace=True)
-            df.rename(columns={'#': 'frame', 'Unnamed: 2': 'dip_x', 'Unnamed: 4': 'dip_y',
-                    'Unnamed: 6': 'dip_z', 'Unnamed: 8': '|dip|'}, inplace=True)
+            df = dipole_cache.read_dipole_frame(os.getcwd() + '/' + name)
             if a == 0:
                 df.insert(1, "Time", (df['frame'] * 5 / 1000))
             else:
@@ -30,10 +31,10 @@ for address, dirs, names in os.walk(os.getcwd()):
             field_dict[int(a)] = float(df['|dip|'].mean())
             #Построение графиков АВР ДМ и сохранение в файл
             plt.gcf().clear()
-            plt.plot(np.array(df["Time"].tolist()), np.array(df["dip_x"].tolist()), linewidth=1)
-            plt.plot(np.array(df["Time"].tolist()), np.array(df["dip_y"].tolist()), linewidth=1)
-            plt.plot(np.array(df["Time"].tolist()), np.array(df["dip_z"].tolist()), linewidth=1)
-            plt.plot(np.array(df["Time"].tolist()), np.array(df["|dip|"].tolist()), linewidth=1)
+            plt.plot(*downsample(df["Time"].to_numpy(), df["dip_x"].to_numpy()), linewidth=1)
+            plt.plot(*downsample(df["Time"].to_numpy(), df["dip_y"].to_numpy()), linewidth=1)
+            plt.plot(*downsample(df["Time"].to_numpy(), df["dip_z"].to_numpy()), linewidth=1)
+            plt.plot(*downsample(df["Time"].to_numpy(), df["|dip|"].to_numpy()), linewidth=1)
             plt.legend(["dip_x", "dip_y", "dip_z", "|dip|"])
             plt.ylabel('Dipole Moment (D)')  
             plt.xlabel('Time (ps)')
@@ -1,4 +1,5 @@
 import os
+import sys
 import numpy as np
 import re
 import scipy as sp
@@ -9,10 +10,14 @@ from matplotlib import cm
 from matplotlib import pyplot as plt
 from scipy.fft import rfft, rfftfreq
 from scipy.interpolate import make_interp_spline
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import namd_energy
 
 amino_acids = list()
 legend = list()
 energy_type = ['KINETIC', 'POTENTIAL']
+# Hand-made .dat exports or ENERGY columns extracted from the logs (namd_energy.py)
+energy_files = ('.dat', namd_energy.SUFFIX)  # not other .npz
 field_amplitudes = [0.0435,	0.087,	0.1305,	0.174,	0.2175,
                     0.261,	0.3045,	0.348,	0.3915,	0.435,	0.4785,	0.522]
 data = pd.DataFrame()
@@ -24,7 +29,7 @@ directory = os.getcwd()
 for address, dirs, names in os.walk(directory):
     for name in names:
         filename, file_extension = os.path.splitext(name)
-        if file_extension == ".dat":
+        if name.endswith(energy_files):
             amino_acid = re.search(r'^\w{,2}[^\_]', filename)
             amino_acid = amino_acid.group(0)
             amino_acids.append(amino_acid)
@@ -46,9 +51,9 @@ for i in amino_acids:
         data = pd.DataFrame()
         for file in dat_files:
             filename, file_extension = os.path.splitext(file)
-            if file_extension == ".dat":
-                one_data = pd.read_csv(
-                    directory+"/"+file, delimiter=' ', index_col=None, header=[0])
+            if file.endswith(energy_files):
+                filename = namd_energy.table_name(file)
+                one_data = namd_energy.read_energy_table(directory+"/"+file, ["TS", j])
                 data["TIME"] = (one_data["TS"]) * 0.001
                 data[(str(filename)+"_"+j)] = (one_data[j]) * 0.0434/5400 # переводим усл.ед. в эВ
         # print(data.head())
@@ -1,17 +1,16 @@
 # Здесь считаем дипольные моменты в полярных координатах. строим годограф
 import os
+import sys
 import re
 import time
 import numpy as np
-import pandas as pd
 from matplotlib import pyplot as plt
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import dipole_cache
 for i in os.listdir(os.getcwd()):
     filename, file_extension = os.path.splitext(os.getcwd()+'/'+i)
     if file_extension == ".dat":
-        df = pd.read_csv(os.getcwd()+'/'+i, sep=' ')
-        df.dropna(how='all', axis=1, inplace=True)
-        df.rename(columns={'#': 'frame', 'Unnamed: 2': 'dip_x', 'Unnamed: 4': 'dip_y',
-                  'Unnamed: 6': 'dip_z', 'Unnamed: 8': '|dip|'}, inplace=True)
+        df = dipole_cache.read_dipole_frame(os.getcwd()+'/'+i)
         df.insert(5, 'r', (df['dip_x']**2+df['dip_y']**2)**(1/2))
         theta = list()
         for i, row in df.iterrows():
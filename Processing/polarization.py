@@ -1,7 +1,9 @@
 import os
+import sys
 import numpy as np
-import pandas as pd
 from matplotlib import pyplot as plt
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import dipole_cache
 
 # Requesting dcd-time and field time
 timeframe = input("Укажите время разделения фреймов (фс): ")
@@ -19,11 +21,9 @@ a = list(zip(field_list, zero_copm_list, zero_copm_list))
 for i in a:
     electric_array.append(np.array(i))
 # Read csv
-df = pd.read_csv(
-    "/Users/max/Yandex.Disk.localized/Journals/Микроэлектроника/data/gly/dipole_20_1.dat", sep=' ', index_col=None)
-df.dropna(how='all', axis=1, inplace=True)
-df.rename(columns={'#': 'frame', 'Unnamed: 2': 'dip_x', 'Unnamed: 4': 'dip_y',
-                   'Unnamed: 6': 'dip_z', 'Unnamed: 8': 'dip_abs'}, inplace=True)
+df = dipole_cache.read_dipole_frame(
+    "/Users/max/Yandex.Disk.localized/Journals/Микроэлектроника/data/gly/dipole_20_1.dat")
+df.rename(columns={'|dip|': 'dip_abs'}, inplace=True)
 df.insert(1, "Time", (df['frame'] * timeframe)*10**12)
 # Make and add zeros part electric vector
 without_field_ts = int(len(df['Time'])-int(len(electric_array)))
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from multiprocessing import Pool
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'AI'))
+import spectral
+from bench_spectrum import make_signal
+
+"""
+Пропускная способность: Pool.map по файлам (как в plot_spectrum_AI_detect.py)
+против одного пакетного 2-D преобразования со scipy.fft workers.
+Запуск: python bench_batch.py --files 16 --size 1e6 --jobs 16
+"""
+
+
+def _one_spectrum(args):
+    signal, engine = args
+    return spectral.acf_spectrum(signal, engine=engine)[1]
+
+
+def run_pool(signals, engine, jobs):
+    with Pool(min(jobs, len(signals))) as pool:
+        return pool.map(_one_spectrum, [(signal, engine) for signal in signals])
+
+
+def run_batched(signals, engine, jobs, batch_size):
+    spectra = []
+    for start in range(0, len(signals), batch_size):
+        block = np.stack(signals[start:start + batch_size])
+        spectra.extend(spectral.acf_spectrum(block, engine=engine, workers=jobs)[1])
+    return spectra
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pool vs batched ACF spectra throughput')
+    parser.add_argument('--files', type=int, default=16)
+    parser.add_argument('--size', type=float, default=1e6)
+    parser.add_argument('--jobs', type=int, default=16)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--engine', default='fft', choices=spectral.ENGINES)
+    args = parser.parse_args()
+    n = int(args.size)
+    signals = [make_signal(n, seed=i) for i in range(args.files)]
+    print("%d files x %d samples, %d jobs, engine %s" % (args.files, n, args.jobs, args.engine))
+    start = time.perf_counter()
+    pooled = run_pool(signals, args.engine, args.jobs)
+    t_pool = time.perf_counter() - start
+    start = time.perf_counter()
+    batched = run_batched(signals, args.engine, args.jobs, args.batch_size)
+    t_batch = time.perf_counter() - start
+    deviation = max(float(np.max(np.abs(a - b)) / np.max(a)) for a, b in zip(pooled, batched))
+    print("  pool    %8.3f s  %6.2f files/s" % (t_pool, args.files / t_pool))
+    print("  batched %8.3f s  %6.2f files/s  x%.2f  max dev: %.1e" % (t_batch, args.files / t_batch,
+                                                                     t_pool / t_batch, deviation))
+
+
+if __name__ == '__main__':
+    main()
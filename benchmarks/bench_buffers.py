@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import gc
+import time
+import argparse
+import resource
+import tracemalloc
+import numpy as np
+from multiprocessing import Pool
+from scipy.fft import rfft, irfft
+from scipy.signal.windows import hann
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'AI'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import spectral
+import stages
+from bench_spectrum import make_signal
+
+"""
+Память воркера пула при серии файлов одной длины:
+  former - прежний _windowed_autocorr (rfft(2n), X*conj(X), gc.collect(), hann(n) float64 на каждый вызов);
+  cold   - АКФ на месте, окно строится заново для каждого файла;
+  cached - то же с кэшем окон процесса (spectral.init_worker, как в пуле detect).
+На каждый вызов: время, пик RSS воркера, пик памяти массивов (tracemalloc)
+и minor page faults - страницы, которые пришлось выделить заново.
+Запуск: python bench_buffers.py --size 1e6 --files 8
+"""
+
+
+def _former_windowed_autocorr(signal, workers=None):
+    n = signal.shape[-1]
+    fft_sig = rfft(signal, n=2*n, axis=-1, workers=workers)
+    autocorr = irfft(fft_sig * np.conj(fft_sig), n=2*n, axis=-1, workers=workers)[..., :n].real
+    autocorr /= np.max(autocorr, axis=-1, keepdims=True)
+    del fft_sig
+    gc.collect()
+    window = hann(n)
+    return autocorr * window
+
+
+def _measure(args):
+    """Spectra of files signals of length n in this worker; per-call means of the counters"""
+    n, files, engine, mode = args
+    if mode == 'former':
+        spectral._windowed_autocorr = _former_windowed_autocorr
+    signal = make_signal(n)
+    spectral.acf_spectrum(signal.copy(), engine=engine)  # first call fills the caches
+    stages._reset_peak_rss()
+    tracemalloc.start()
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+    start = time.perf_counter()
+    for _ in range(files):
+        if mode == 'cold':
+            spectral.init_worker()
+        spectral.acf_spectrum(signal.copy(), engine=engine)
+    seconds = time.perf_counter() - start
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults
+    traced_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds / files, stages._peak_rss(), traced_peak, faults / files
+
+
+def run(mode, n, files, engine):
+    # A fresh single-worker pool per mode, initialised as in plot_spectrum_AI_detect.py
+    with Pool(1, initializer=spectral.init_worker) as pool:
+        return pool.apply(_measure, ((n, files, engine, mode),))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='In-place ACF and per-worker window cache: peak RSS and fresh allocations')
+    parser.add_argument('--size', type=float, default=1e6)
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--engine', default='fft', choices=spectral.ENGINES)
+    args = parser.parse_args()
+    n = int(args.size)
+    print(f"n = {n}, {args.files} files, engine {args.engine}")
+    print(f"  {'acf':<10}{'s/file':>9}{'peak RSS, MB':>14}{'traced peak, MB':>17}{'page faults/file':>18}")
+    for mode in ('former', 'cold', 'cached'):
+        seconds, rss, traced, faults = run(mode, n, args.files, args.engine)
+        print(f"  {mode:<10}{seconds:>9.3f}{rss / 2**20:>14.1f}{traced / 2**20:>17.1f}{faults:>18.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.signal import savgol_filter
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'AI'))
+import peaks
+from spectrum_store import SpectrumStore
+
+"""
+Проверка и замер AI/peaks.py против прежнего цикла detect_peaks.
+Спектры: синтетические и записанные - хранилище спектров (<result>/spectra) или *_spectrum.csv,
+переданные аргументами. Запуск: python bench_peaks.py result/spectra
+Та же проверка на синтетических спектрах для pytest: test_peaks.py
+"""
+
+
+def detect_peaks_loop(xf_filtered, smoothed_spectrum, original_spectrum):
+    """The former pure-Python detect_peaks, kept as the reference"""
+    max_amp = np.max(original_spectrum)
+    found = []
+    for i in range(1, len(smoothed_spectrum) - 1):
+        if smoothed_spectrum[i] > smoothed_spectrum[i - 1] and smoothed_spectrum[i] > smoothed_spectrum[i + 1]:
+            found.append((xf_filtered[i], smoothed_spectrum[i]))
+    if not found:
+        return []
+    current_peaks = found.copy()
+    while len(current_peaks) >= 500:
+        new_peaks = []
+        n = len(current_peaks)
+        for i in range(n):
+            if i == 0:
+                if current_peaks[i][1] > current_peaks[i + 1][1]:
+                    new_peaks.append(current_peaks[i])
+            elif i == n - 1:
+                if current_peaks[i][1] > current_peaks[i - 1][1]:
+                    new_peaks.append(current_peaks[i])
+            else:
+                if current_peaks[i][1] > current_peaks[i - 1][1] and current_peaks[i][1] > current_peaks[i + 1][1]:
+                    new_peaks.append(current_peaks[i])
+        if len(new_peaks) == len(current_peaks):
+            break
+        current_peaks = new_peaks
+    return [peak for peak in current_peaks if peak[1] >= 0.01 * max_amp]
+
+
+def synthetic_spectra(sizes, seed=0):
+    rng = np.random.default_rng(seed)
+    for n in sizes:
+        xf = np.linspace(0, 4000, n)
+        spectrum = np.abs(rng.standard_normal(n)).cumsum() % 50
+        for centre in rng.uniform(100, 3900, 20):
+            spectrum += 500 / (1 + ((xf - centre) / 5) ** 2)
+        yield "synthetic %d" % n, xf, spectrum
+
+
+def recorded_spectra(paths):
+    """(name, freq, amplitude) of every spectrum in the given stores and *_spectrum.csv files"""
+    for path in paths:
+        if os.path.isdir(path):
+            store = SpectrumStore(path)
+            if not store.exists():
+                print(f"No spectrum store in {path}")
+                continue
+            for name in store.names():
+                freq, amplitude = store.spectrum(name)
+                yield name, np.array(freq), np.array(amplitude, dtype='float64')
+            continue
+        df = pd.read_csv(path)
+        yield os.path.basename(path), df['Frequency_cm-1'].values, df['Amplitude'].values
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Vectorised vs loop peak detection')
+    parser.add_argument('spectra', nargs='*', help='spectrum stores (<result>/spectra) or *_spectrum.csv files')
+    parser.add_argument('--sizes', nargs='+', type=float, default=[1e5, 1e6])
+    args = parser.parse_args()
+    failures = 0
+    sources = list(synthetic_spectra([int(n) for n in args.sizes])) + list(recorded_spectra(args.spectra))
+    for name, xf, spectrum in sources:
+        smoothed = savgol_filter(spectrum, window_length=11, polyorder=2)
+        start = time.perf_counter()
+        expected = detect_peaks_loop(xf, smoothed, spectrum)
+        t_loop = time.perf_counter() - start
+        start = time.perf_counter()
+        result = peaks.detect_peaks(xf, smoothed, spectrum)
+        t_vec = time.perf_counter() - start
+        same = [tuple(map(float, p)) for p in expected] == result
+        failures += not same
+        print("%-24s %5d peaks  loop %7.3f s  numpy %7.4f s  x%-7.1f %s" % (
+            name, len(result), t_loop, t_vec, t_loop / max(t_vec, 1e-9), 'ok' if same else 'MISMATCH'))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
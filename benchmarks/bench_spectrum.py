@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import argparse
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'AI'))
+import spectral
+
+"""
+Сравнение движков спектра АКФ: время и совпадение с исходным путем (engine='fft').
+Запуск: python bench_spectrum.py --sizes 1e6 1e7
+"""
+
+PEAKS_CM = (1600.0, 3000.0, 3400.0)  # injected lines, cm⁻¹
+
+
+def make_signal(n, seed=0):
+    """Noisy sum of damped-phase sines at PEAKS_CM sampled every 1 fs"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) * spectral.TIMESTEP
+    signal = rng.standard_normal(n)
+    for k in PEAKS_CM:
+        phase = np.cumsum(rng.standard_normal(n)) * 1e-3
+        signal += np.sin(2 * np.pi * k * 3e10 * t + phase)
+    signal = signal.astype('float32')
+    signal -= signal.mean()
+    return signal
+
+
+def check_equivalence(signal, engine):
+    """Max deviation of |spectrum| of an engine from the reference path, in units of the reference peak"""
+    xf, reference = spectral.acf_spectrum(signal.copy(), engine='fft')
+    xf_result, result = spectral.acf_spectrum(signal.copy(), engine=engine)
+    start = np.searchsorted(xf, xf_result[0])
+    return float(np.max(np.abs(np.abs(result) - np.abs(reference[start:start + len(result)]))) / np.max(reference))
+
+
+def check_decimation(signal):
+    """
+    (axis deviation in cm⁻¹, max |spectrum| deviation in units of the peak) of decimate=True from the
+    undecimated path on the first n - n % factor samples, the length the decimated spectrum stands for
+    """
+    n = len(signal)
+    factor = spectral.decimation.choose_factor(spectral.TIMESTEP, spectral.MAX_WAVENUMBER * 0.03e12)
+    xf, reference = spectral.acf_spectrum(signal[:n - n % factor].copy(), engine='fft')
+    xf_result, result = spectral.acf_spectrum(signal.copy(), engine='fft', decimate=True)
+    if len(xf_result) != len(xf):
+        return np.inf, np.inf
+    return float(np.max(np.abs(xf_result - xf))), float(np.max(np.abs(result - reference)) / np.max(reference))
+
+
+def top_peaks(xf, spectrum, count=len(PEAKS_CM)):
+    """Frequencies of the strongest local maxima"""
+    inner = (spectrum[1:-1] > spectrum[:-2]) & (spectrum[1:-1] > spectrum[2:])
+    idx = np.flatnonzero(inner) + 1
+    idx = idx[np.argsort(spectrum[idx])[-count:]]
+    return np.sort(xf[idx])
+
+
+def bench(func, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ACF spectrum engine benchmark')
+    parser.add_argument('--sizes', nargs='+', type=float, default=[1e6, 1e7])
+    parser.add_argument('--engines', nargs='+', default=list(spectral.ENGINES),
+                        choices=spectral.ENGINES + spectral.RESOLUTION_ENGINES,
+                        help="'czt' (resolution only) is checked against 'fft' when given")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    for size in args.sizes:
+        n = int(size)
+        signal = make_signal(n)
+        print("n = %d" % n)
+        timings = {}
+        for engine in args.engines:
+            timings[engine] = bench(lambda: spectral.acf_spectrum(signal.copy(), engine=engine), args.repeat)
+            xf, spectrum = spectral.acf_spectrum(signal.copy(), engine=engine)
+            peaks = ', '.join("%.1f" % f for f in top_peaks(xf, spectrum))
+            peaks += " (%d bins)" % len(xf)
+            line = "  %-4s %8.3f s  x%.2f  peaks: %s" % (engine, timings[engine],
+                                                        timings.get('fft', timings[engine]) / timings[engine], peaks)
+            if engine != 'fft':
+                line += "  max dev: %.2e" % check_equivalence(signal, engine)
+            print(line)
+        # An odd length as well: the decimated series must keep the bins of an undecimated one
+        for length in (n, n + 1):
+            axis, deviation = check_decimation(make_signal(length))
+            print("  decimate n=%d  axis dev: %.2e cm⁻¹  max dev: %.2e" % (length, axis, deviation))
+
+
+if __name__ == '__main__':
+    main()
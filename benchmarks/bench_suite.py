@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import importlib.util
+import numpy as np
+import pandas as pd
+from scipy.signal import savgol_filter
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(ROOT, 'AI'))
+sys.path.append(os.path.join(ROOT, 'common'))
+import namd_synth
+import namd_table
+import plot_spectrum_AI_detect as detect
+from peaks import detect_peaks
+from spectrum_store import SpectrumStore, default_path
+
+"""
+Набор замеров на синтетических данных (namd_synth.py) с проверкой найденных частот:
+разбор текстовых таблиц (MB/s), process_file и detect_peaks (AI), mean_spectre.py, MDFourier upload/goProcess (нужен PyQt5),
+скрипты Processing. Данные генерируются один раз в --workdir/<frames> и переиспользуются.
+Запуск: python bench_suite.py --sizes 1e5 1e6 1e7 --workdir /tmp/namd_bench
+"""
+
+SIZES = (1e5, 1e6)
+BENCHES = ('parse', 'process_file', 'detect_peaks', 'mean_spectre', 'mdfourier', 'processing')
+# Processing scripts run as they are, in the folder of the artefact they read
+PROCESSING_SCRIPTS = {'dipole.py': 'dipole', 'spectres.py': 'spec'}
+TOLERANCE_BINS = 3  # recovered line may be this many bins away from the injected one
+
+
+def prepare(workdir, frames, peaks_cm):
+    """Generated set for this size, reused while truth.json matches"""
+    data_dir = os.path.join(workdir, str(frames))
+    truth_path = os.path.join(data_dir, 'truth.json')
+    if os.path.exists(truth_path):
+        with open(truth_path, 'r') as f:
+            truth = json.load(f)
+        if truth['frames'] == frames and truth['peaks_cm'] == list(peaks_cm):
+            return data_dir, truth
+    start = time.perf_counter()
+    # The log keeps ~1e5 ENERGY lines whatever the size
+    truth = namd_synth.generate(data_dir, frames, peaks_cm, log_stride=max(1, frames // 100000))
+    print(f"  generated {data_dir} in {time.perf_counter() - start:.1f} s")
+    return data_dir, truth
+
+
+def check_lines(found_cm, truth, frames):
+    """'ok' if every injected line has a found one within TOLERANCE_BINS bins, otherwise the misses"""
+    tolerance = max(TOLERANCE_BINS / (frames * namd_synth.TIMESTEP) / 3e10, 0.5)
+    found_cm = np.asarray(found_cm, dtype=float)
+    missed = [cm for cm in truth['peaks_cm']
+              if len(found_cm) == 0 or np.min(np.abs(found_cm - cm)) > tolerance]
+    return 'ok' if not missed else 'missed ' + ', '.join(f"{cm:g}" for cm in missed)
+
+
+def strongest(freq, amplitude, count):
+    """Frequencies of the count highest local maxima"""
+    inner = np.flatnonzero((amplitude[1:-1] > amplitude[:-2]) & (amplitude[1:-1] >= amplitude[2:])) + 1
+    return freq[inner[np.argsort(amplitude[inner])[-count:]]]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_parse(data_dir, truth):
+    """Throughput of namd_table on the dipole table against the former pandas sep=' ' read"""
+    dat = os.path.join(data_dir, truth['files']['dipole'])
+    megabytes = os.path.getsize(dat) / 2**20
+    dtypes = ['int32'] + ['float32'] * 4
+    rows = []
+    seconds, df = timed(lambda: pd.read_csv(dat, sep=' ', usecols=['#', 'Unnamed: 2', 'Unnamed: 4', 'Unnamed: 6',
+                                                                     'Unnamed: 8'], engine='c'))
+    reference = [df[name].to_numpy(dtype=dtype) for name, dtype in zip(df.columns, dtypes)]
+    rows.append(('parse pandas sep=\' \' (old)', seconds, f"{megabytes / seconds:.0f} MB/s"))
+    engines = ['pandas'] + (['pyarrow'] if namd_table.pa is not None else [])
+    for engine in engines:
+        seconds, columns = timed(namd_table.read_columns, dat, dtypes, 1, engine)
+        same = all(np.array_equal(a, b) for a, b in zip(columns, reference))
+        status = f"{megabytes / seconds:.0f} MB/s"
+        rows.append((f"parse namd_table {engine}", seconds, status if same else f"failed: values differ ({status})"))
+    return rows
+
+
+def stored_spectrum(dat):
+    """(freq, amplitude) written by process_file for dat"""
+    store = SpectrumStore(default_path(detect.OUTPUT_DIR))
+    freq, amplitude = store.spectrum(os.path.basename(dat))
+    return np.array(freq), np.array(amplitude, dtype=float)
+
+
+def bench_process_file(data_dir, truth):
+    dat = os.path.join(data_dir, truth['files']['dipole'])
+    detect.OUTPUT_DIR = os.path.join(data_dir, 'result')
+    # First call parses the text, the second one maps the dipole cache
+    if os.path.exists(dat + '.dipcache'):
+        os.remove(dat + '.dipcache')
+    rows = []
+    for label in ('process_file (text)', 'process_file (cached)'):
+        seconds, peaks = timed(detect.process_file, dat, False)
+        rows.append((label, seconds, check_lines(peaks or [], truth, truth['frames'])))
+    freq, amplitude = stored_spectrum(dat)
+    rows.append(('  strongest lines', 0.0,
+                 check_lines(strongest(freq, amplitude, len(truth['peaks_cm'])), truth, truth['frames'])))
+    return rows
+
+
+def bench_detect_peaks(data_dir, truth):
+    dat = os.path.join(data_dir, truth['files']['dipole'])
+    detect.OUTPUT_DIR = os.path.join(data_dir, 'result')
+    freq, amplitude = stored_spectrum(dat)
+    smoothed = savgol_filter(amplitude, window_length=11, polyorder=2)
+    seconds, found = timed(detect_peaks, freq, smoothed, amplitude)
+    found.sort(key=lambda peak: -peak[1])
+    top = [cm for cm, _ in found[:len(truth['peaks_cm'])]]
+    return [('detect_peaks', seconds, check_lines(top, truth, truth['frames']))]
+
+
+def run_script(script, cwd):
+    env = dict(os.environ, MPLBACKEND='Agg')
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, script], cwd=cwd, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    seconds = time.perf_counter() - start
+    if completed.returncode != 0:
+        return seconds, 'failed: ' + (completed.stderr.strip().splitlines() or ['?'])[-1]
+    return seconds, 'ok'
+
+
+def bench_mean_spectre(data_dir, truth):
+    # Reads the spectrum store of the current directory, i.e. the result of process_file
+    result_dir = os.path.join(data_dir, 'result')
+    seconds, status = run_script(os.path.join(ROOT, 'AI', 'mean_spectre.py'), result_dir)
+    if status == 'ok':
+        mean = pd.read_csv(os.path.join(result_dir, 'mean_spectre_AI.csv'))
+        found = strongest(mean['Frequency_cm-1'].values, mean['Amplitude'].values, len(truth['peaks_cm']))
+        status = check_lines(found, truth, truth['frames'])
+    return [('mean_spectre.py (process)', seconds, status)]
+
+
+def load_mdfourier():
+    app_dir = os.path.join(ROOT, 'Fourier_Program', 'MDFourier_v')
+    sys.path.append(app_dir)
+    spec = importlib.util.spec_from_file_location('mdfourier', os.path.join(app_dir, 'MDFourier_v.0.2.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_mdfourier(data_dir, truth):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt5 import QtWidgets
+        mdfourier = load_mdfourier()
+    except ImportError as e:
+        return [('MDFourier', 0.0, f"skipped ({e})")]
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    window = mdfourier.MainApplication()
+    window.naturalBox.setChecked(True)
+    rows = []
+    for mode in ('dat', 'csv'):
+        window.datafile = os.path.join(data_dir, truth['files']['energy_dat']) if mode == 'dat' else None
+        window.logfile = os.path.join(data_dir, truth['files']['log']) if mode == 'dat' else None
+        window.csvfile = os.path.join(data_dir, truth['files']['energy_csv']) if mode == 'csv' else None
+        window.dcdfile = None
+        window.atomNumValue.setValue(truth['atoms'])
+        # upload and goProcess run on the window's worker thread: wait for it and deliver the results
+        seconds, _ = timed(lambda: (window.upload(), window.tasks.wait()))
+        rows.append((f"MDFourier upload ({mode})", seconds, f"{len(window.energies) or len(window.newEnergies)} rows"))
+        seconds, _ = timed(lambda: (window.goProcess(), window.tasks.wait()))
+        freq_cm = window.fftFreq[window.i] / 3e10
+        found = strongest(freq_cm, window.energies_psd[window.i], len(truth['peaks_cm']))
+        rows.append((f"MDFourier goProcess ({mode})", seconds, check_lines(found, truth, truth['frames'])))
+    window.close()
+    app.processEvents()
+    return rows
+
+
+def bench_processing(data_dir, truth):
+    rows = []
+    for script, kind in PROCESSING_SCRIPTS.items():
+        seconds, status = run_script(os.path.join(ROOT, 'Processing', script), os.path.join(data_dir, kind))
+        rows.append((f"Processing/{script} (process)", seconds, status))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks on synthetic NAMD data with known lines')
+    parser.add_argument('--sizes', nargs='+', type=float, default=list(SIZES), help='frames, e.g. 1e5 1e6 1e7')
+    parser.add_argument('--workdir', default=os.path.join(os.getcwd(), 'namd_bench'))
+    parser.add_argument('--peaks', nargs='+', type=float, default=list(namd_synth.PEAKS_CM))
+    parser.add_argument('--only', nargs='+', choices=BENCHES, default=list(BENCHES))
+    args = parser.parse_args()
+    benches = {name: globals()['bench_' + name] for name in BENCHES}
+    selected = set(args.only)
+    # detect_peaks and mean_spectre read the spectrum written by process_file
+    if selected & {'detect_peaks', 'mean_spectre'}:
+        selected.add('process_file')
+    failed = False
+    for size in args.sizes:
+        frames = int(size)
+        print(f"frames = {frames}")
+        data_dir, truth = prepare(args.workdir, frames, args.peaks)
+        for name in BENCHES:
+            if name not in selected:
+                continue
+            for label, seconds, status in benches[name](data_dir, truth):
+                print(f"  {label:<34} {seconds:9.3f} s  {status}")
+                failed |= status.startswith(('missed', 'failed'))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import json
+import argparse
+import numpy as np
+
+"""
+Генератор синтетических файлов в форматах NAMD с известными частотами (для тестов и замеров
+без настоящих траекторий). Каждый вид - в своей папке, как их ищут скрипты (все .dat папки):
+  dipole/<name>.dat   - диполь '#' ... 'Unnamed: 8' (кадр, dip_x, dip_y, dip_z, |dip|), шаг 1 фс;
+  energy/<name>.dat   - 'TS ENERGY' построчно без заголовка, <name>.log рядом (MDFourier upload),
+  energy/<name>.csv   - столбцы TS, ENERGY (MDFourier, режим CSV);
+  energies/<name>.dat - таблица ENERGY с заголовком TS BOND ... (Processing/kin_pon_2.py, 3d_plot.py);
+                        (то же, что common/namd_energy.py извлекает из <name>.log);
+  energy/<name>.log   - 'Info: N ATOMS' в строке 181, ETITLE/ENERGY строки и концовка NAMD;
+  spec/<name>.dat     - спектр с заголовком '0.0 0.0' (после pandas столбцы '0.0' и '0.0.1');
+  dcd/<name>.dcd      - траектория DCD (только с --dcd-atoms N: атомы на сетке, сдвиг по x несет линии);
+  truth.json          - параметры и заложенные частоты.
+Запуск: python namd_synth.py /tmp/synth --frames 1e6 --peaks 1600 3000 3400
+"""
+
+PEAKS_CM = (1600.0, 3000.0, 3400.0)  # injected lines, cm⁻¹
+TIMESTEP = 1e-15  # 1 fs between frames
+ATOMS = 5400
+CHUNK = 1 << 20  # rows formatted per write
+ETITLE_EVERY = 100  # NAMD repeats the ETITLE line between ENERGY blocks
+MAX_SPEC_CM = 4000
+ETITLE = ('TS', 'BOND', 'ANGLE', 'DIHED', 'IMPRP', 'ELECT', 'VDW', 'BOUNDARY', 'MISC', 'KINETIC',
+          'TOTAL', 'TEMP', 'POTENTIAL', 'TOTAL3', 'TEMPAVG', 'PRESSURE', 'GPRESSURE', 'VOLUME',
+          'PRESSAVG', 'GPRESSAVG')
+# Mean level of every ENERGY column (kcal/mol, K, bar, Å^3)
+ENERGY_LEVELS = {'BOND': 2100.0, 'ANGLE': 5600.0, 'DIHED': 7400.0, 'IMPRP': 420.0, 'ELECT': -52000.0,
+                 'VDW': 3900.0, 'BOUNDARY': 0.0, 'MISC': 0.0, 'KINETIC': 9700.0, 'TOTAL': -22900.0,
+                 'TEMP': 300.0, 'POTENTIAL': -32600.0, 'TOTAL3': -22900.0, 'TEMPAVG': 300.0,
+                 'PRESSURE': 1.0, 'GPRESSURE': 1.0, 'VOLUME': 216000.0, 'PRESSAVG': 1.0, 'GPRESSAVG': 1.0}
+
+
+def lines(t, peaks_cm, rng, amplitude=1.0, noise=0.5):
+    """Sum of sines at peaks_cm (decreasing amplitudes) plus white noise; t in seconds"""
+    signal = noise * rng.standard_normal(len(t))
+    for k, cm in enumerate(peaks_cm):
+        signal += amplitude / (k + 1) * np.sin(2 * np.pi * cm * 3e10 * t + rng.uniform(0, 2 * np.pi))
+    return signal
+
+
+def dipole_series(frames, peaks_cm=PEAKS_CM, seed=0):
+    """frame, dip_x, dip_y, dip_z, |dip|: the modulus carries the lines, the direction drifts slowly"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(frames) * TIMESTEP
+    modulus = 20.0 + lines(t, peaks_cm, rng)
+    theta = 0.8 + 0.1 * np.sin(2 * np.pi * t / (frames * TIMESTEP))
+    phi = 0.3 + 0.1 * np.cos(2 * np.pi * t / (frames * TIMESTEP))
+    x = modulus * np.sin(theta) * np.cos(phi)
+    y = modulus * np.sin(theta) * np.sin(phi)
+    z = modulus * np.cos(theta)
+    return np.arange(frames), x, y, z, np.sqrt(x * x + y * y + z * z)
+
+
+def energy_table(frames, peaks_cm=PEAKS_CM, seed=1, stride=1):
+    """Columns of ETITLE for every stride-th step; KINETIC, POTENTIAL and TOTAL carry the lines"""
+    rng = np.random.default_rng(seed)
+    steps = np.arange(0, frames, stride)
+    t = steps * TIMESTEP
+    table = {'TS': steps}
+    kinetic = lines(t, peaks_cm, rng, amplitude=40.0, noise=10.0)
+    potential = lines(t, peaks_cm, rng, amplitude=40.0, noise=10.0)
+    for name, level in ENERGY_LEVELS.items():
+        table[name] = level + rng.standard_normal(len(steps)) * (abs(level) * 1e-4 + 1e-3)
+    table['KINETIC'] += kinetic
+    table['POTENTIAL'] += potential
+    table['TOTAL'] += kinetic + potential
+    table['TOTAL3'] += kinetic + potential
+    table['TEMP'] = table['KINETIC'] / ENERGY_LEVELS['KINETIC'] * 300.0
+    return table
+
+
+def _write_rows(f, fmt, columns):
+    """np.savetxt in chunks, so 1e7 rows never need one huge format pass"""
+    n = len(columns[0])
+    for start in range(0, n, CHUNK):
+        np.savetxt(f, np.column_stack([c[start:start + CHUNK] for c in columns]), fmt=fmt)
+
+
+def write_dipole_dat(path, frames, peaks_cm=PEAKS_CM, seed=0):
+    """Dipole .dat as the NAMD tcl script writes it: values separated by two spaces"""
+    columns = dipole_series(frames, peaks_cm, seed)
+    with open(path, 'w') as f:
+        f.write('#' + ' ' * 8 + '\n')  # 9 fields with sep=' ': '#', 'Unnamed: 1' ... 'Unnamed: 8'
+        _write_rows(f, '%d  %.4f  %.4f  %.4f  %.4f', columns)
+    return path
+
+
+def write_energy_dat(path, table, column='TOTAL'):
+    """'TS ENERGY' per line, the format parsed by MDFourier upload()"""
+    with open(path, 'w') as f:
+        _write_rows(f, '%d %.4f', (table['TS'], table[column]))
+    return path
+
+
+def write_energy_csv(path, table, column='TOTAL'):
+    with open(path, 'w') as f:
+        f.write('TS,ENERGY\n')
+        _write_rows(f, '%d,%.4f', (table['TS'], table[column]))
+    return path
+
+
+def write_energy_table(path, table):
+    """Space separated ENERGY columns with the ETITLE names as the header"""
+    with open(path, 'w') as f:
+        f.write(' '.join(ETITLE) + '\n')
+        _write_rows(f, ' '.join(['%d'] + ['%.4f'] * (len(ETITLE) - 1)), [table[name] for name in ETITLE])
+    return path
+
+
+def write_log(path, table, atoms=ATOMS, frames=None):
+    """NAMD log: startup Info block with the atom count on line 181, ETITLE/ENERGY blocks, shutdown"""
+    steps = table['TS']
+    frames = frames if frames is not None else int(steps[-1]) + 1
+    head = ['Charm++: standalone mode (not using charmrun)', 'Info: NAMD 2.14 for Linux-x86_64-multicore',
+            'Info:', 'Info: Please visit http://www.ks.uiuc.edu/Research/namd/',
+            'Info: TIMESTEP               %g' % (TIMESTEP * 1e15)]
+    head += [f"Info: SIMULATION PARAMETER {k}" for k in range(180 - len(head))]
+    head += [f"Info: {atoms} ATOMS", f"Info: {atoms // 3} BONDS", 'Info: 0 ANGLES',
+             f"Info: TOTAL MASS = {atoms * 12.0:.4f} amu", 'TCL: Running for %d steps' % frames]
+    etitle = 'ETITLE:      TS' + ''.join(f"{name:>15}" for name in ETITLE[1:])
+    fmt = 'ENERGY: %7d' + ' %14.4f' * (len(ETITLE) - 1)
+    with open(path, 'w') as f:
+        f.write('\n'.join(head) + '\n')
+        for start in range(0, len(steps), ETITLE_EVERY):
+            f.write('\n' + etitle + '\n')
+            np.savetxt(f, np.column_stack([table[name][start:start + ETITLE_EVERY] for name in ETITLE]), fmt=fmt)
+        # upload() takes the run length from the 5th line from the end
+        f.write(f"WRITING EXTENDED SYSTEM TO OUTPUT FILE AT STEP {frames}\n"
+                f"WRITING COORDINATES TO OUTPUT FILE AT STEP {frames}\n"
+                "The last position output (seq=-2) takes 0.002 seconds, 512.000 MB of memory in use\n"
+                f"WRITING VELOCITIES TO OUTPUT FILE AT STEP {frames}\n"
+                "The last velocity output (seq=-2) takes 0.002 seconds, 512.000 MB of memory in use\n"
+                "====================================================\n"
+                "\n"
+                "WallClock: 100.000000  CPUTime: 100.000000  Memory: 512.000000 MB\n")
+    return path
+
+
+def spectrum(frames, peaks_cm=PEAKS_CM, width_cm=5.0, seed=2):
+    """Lorentzian lines on a noisy floor over the native bins of a frames-long series, 0..MAX_SPEC_CM"""
+    rng = np.random.default_rng(seed)
+    step = 1.0 / (frames * TIMESTEP) / 3e10
+    freq = np.arange(int(MAX_SPEC_CM / step) + 1) * step
+    amplitude = 1e-3 * np.abs(rng.standard_normal(len(freq)))
+    for k, cm in enumerate(peaks_cm):
+        amplitude += 1.0 / (k + 1) / (1.0 + ((freq - cm) / (width_cm / 2)) ** 2)
+    amplitude[0] = 0.0
+    return freq, amplitude
+
+
+def write_dcd(path, frames, atoms, peaks_cm=PEAKS_CM, seed=3, cell=60.0):
+    """NAMD-style DCD (CHARMM format, unit cell, little endian): atoms on a grid, shifted along x by the lines"""
+    rng = np.random.default_rng(seed)
+    grid = int(np.ceil(atoms ** (1 / 3)))
+    base = (np.indices((grid,) * 3).reshape(3, -1).T[:atoms] * (cell / grid)).astype('float32')
+    shift = 0.05 * lines(np.arange(frames) * TIMESTEP, peaks_cm, rng)
+    control = np.zeros(20, dtype='<i4')
+    control[:4] = frames, 1, 1, frames  # NSET, ISTART, NSAVC, NSTEP
+    control[9] = np.array([TIMESTEP * 1e15 / 48.88821], dtype='<f4').view('<i4')[0]  # timestep, AKMA units
+    control[10], control[19] = 1, 24  # unit cell in every frame, CHARMM version
+    title = b''.join(line.ljust(80)[:80] for line in (b'REMARKS synthetic trajectory (namd_synth.py)',
+                                                       b'REMARKS x shifted by the injected lines'))
+
+    def record(payload):
+        return np.int32(len(payload)).tobytes() + payload + np.int32(len(payload)).tobytes()
+
+    frame = np.dtype([('cell_begin', '<i4'), ('cell', '<f8', 6), ('cell_end', '<i4')] +
+                     [(name, dtype, shape) for axis in 'xyz' for name, dtype, shape in
+                      ((axis + '_begin', '<i4', ()), (axis, '<f4', atoms), (axis + '_end', '<i4', ()))])
+    with open(path, 'wb') as f:
+        f.write(record(b'CORD' + control.tobytes()))
+        f.write(record(np.int32(len(title) // 80).tobytes() + title))
+        f.write(record(np.int32(atoms).tobytes()))
+        rows = max(1, CHUNK // atoms)
+        for start in range(0, frames, rows):
+            block = np.zeros(min(rows, frames - start), dtype=frame)
+            block['cell'] = [cell, 0.0, cell, 0.0, 0.0, cell]  # a, cos(gamma), b, cos(beta), cos(alpha), c
+            block['cell_begin'] = block['cell_end'] = 48
+            for k, axis in enumerate('xyz'):
+                block[axis + '_begin'] = block[axis + '_end'] = 4 * atoms
+                block[axis] = base[:, k]
+            block['x'] += shift[start:start + len(block), None].astype('float32')
+            f.write(block.tobytes())
+    return path
+
+
+def write_spec_dat(path, frames, peaks_cm=PEAKS_CM, seed=2):
+    """spec.dat: first row '0.0 0.0' doubles as the header the Processing scripts rename"""
+    freq, amplitude = spectrum(frames, peaks_cm, seed=seed)
+    with open(path, 'w') as f:
+        f.write('0.0 0.0\n')
+        _write_rows(f, '%.4f %.8f', (freq[1:], amplitude[1:]))
+    return path
+
+
+def generate(output_dir, frames, peaks_cm=PEAKS_CM, atoms=ATOMS, log_stride=1, name='synth', dcd_atoms=0):
+    """Write the whole set into output_dir; returns the truth record (also saved as truth.json)"""
+    def path(kind, ext='.dat'):
+        os.makedirs(os.path.join(output_dir, kind), exist_ok=True)
+        return os.path.join(output_dir, kind, name + ext)
+
+    table = energy_table(frames, peaks_cm)
+    log_table = table if log_stride == 1 else {k: v[::log_stride] for k, v in table.items()}
+    files = {
+        'dipole': write_dipole_dat(path('dipole'), frames, peaks_cm),
+        'energy_dat': write_energy_dat(path('energy'), table),
+        'energy_csv': write_energy_csv(path('energy', '.csv'), table),
+        'log': write_log(path('energy', '.log'), log_table, atoms, frames),
+        'energies': write_energy_table(path('energies'), table),
+        'spec': write_spec_dat(path('spec'), frames, peaks_cm),
+    }
+    if dcd_atoms:
+        files['dcd'] = write_dcd(path('dcd', '.dcd'), frames, dcd_atoms, peaks_cm)
+    truth = {'frames': frames, 'timestep': TIMESTEP, 'peaks_cm': list(peaks_cm), 'atoms': atoms,
+             'log_stride': log_stride, 'files': {k: os.path.relpath(v, output_dir) for k, v in files.items()}}
+    with open(os.path.join(output_dir, 'truth.json'), 'w') as f:
+        json.dump(truth, f, indent=1)
+    return truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic NAMD-format files with known frequencies')
+    parser.add_argument('output_dir')
+    parser.add_argument('--frames', type=float, default=1e5)
+    parser.add_argument('--peaks', nargs='+', type=float, default=list(PEAKS_CM), help='injected lines, cm⁻¹')
+    parser.add_argument('--atoms', type=int, default=ATOMS)
+    parser.add_argument('--log-stride', type=int, default=1, help='write every N-th step to the .log')
+    parser.add_argument('--name', default='synth')
+    parser.add_argument('--dcd-atoms', type=int, default=0, help='also write dcd/<name>.dcd with this many atoms')
+    args = parser.parse_args()
+    truth = generate(args.output_dir, int(args.frames), args.peaks, args.atoms, args.log_stride, args.name,
+                     args.dcd_atoms)
+    print(json.dumps(truth, indent=1))
+
+
+if __name__ == '__main__':
+    main()
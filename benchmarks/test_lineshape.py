@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import numpy as np
+from scipy.signal import find_peaks
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'AI'))
+import lineshape
+
+"""
+Проверка AI/lineshape.py на лоренцианах без шума с известными параметрами на плотной оси
+(шаг 1/60 cm⁻¹, как у ~10⁶ кадров): широкая линия, перекрывающаяся пара, узкая линия рядом с широкой.
+Запуск: python test_lineshape.py или python -m pytest benchmarks
+"""
+
+STEP = 1.0 / 60  # cm^-1
+TOLERANCE = 0.01  # relative error of FWHM and height
+
+
+def lorentzians(freq, lines, background=0.0):
+    """Sum of (center, fwhm, height) Lorentzians"""
+    spectrum = np.full_like(freq, background)
+    for center, fwhm, height in lines:
+        spectrum += height / (1 + ((freq - center) / (0.5 * fwhm)) ** 2)
+    return spectrum
+
+
+def fit(lines, background=0.0, low=500.0, high=1500.0):
+    """Fitted table of a synthetic spectrum, peaks at its local maxima as detect_peaks gives them"""
+    freq = np.arange(low, high, STEP)
+    spectrum = lorentzians(freq, lines, background)
+    idx = find_peaks(spectrum)[0]
+    assert len(idx) == len(lines), freq[idx]
+    return lineshape.fit_lorentzians([(freq, spectrum, idx)])[0]
+
+
+def check(table, lines):
+    for (center, fwhm, height), (_, row) in zip(sorted(lines), table.iterrows()):
+        assert abs(row['center_cm'] - center) < 0.1 * STEP, (center, row['center_cm'])
+        assert abs(row['fwhm_cm'] / fwhm - 1) < TOLERANCE, (center, fwhm, row['fwhm_cm'])
+        assert abs(row['height'] / height - 1) < TOLERANCE, (center, height, row['height'])
+
+
+def test_wide_line():
+    lines = [(800.0, 20.0, 100.0)]
+    check(fit(lines), lines)
+
+
+def test_overlapping_pair():
+    lines = [(1000.0, 10.0, 100.0), (1012.0, 10.0, 50.0)]
+    check(fit(lines, background=2.0), lines)
+
+
+def test_narrow_next_to_wide():
+    lines = [(900.0, 30.0, 100.0), (930.0, 0.5, 40.0)]
+    check(fit(lines), lines)
+
+
+def test_bounded_fit_dropped():
+    # A line wider than MAX_HALF_WINDOW_CM allows cannot be measured in its window
+    lines = [(1000.0, 4 * lineshape.MAX_HALF_WINDOW_CM, 100.0)]
+    table = fit(lines, low=0.0, high=2000.0)
+    assert len(table) == 1 and np.isnan(table['fwhm_cm'][0]), table
+
+
+if __name__ == '__main__':
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
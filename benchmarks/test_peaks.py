@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import numpy as np
+from scipy.signal import savgol_filter
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import bench_peaks
+import peaks
+
+"""
+Проверка AI/peaks.py: find_peak_indices дает те же пики, что и прежний цикл detect_peaks
+(bench_peaks.detect_peaks_loop), на синтетических спектрах - с прореживанием максимумов
+(больше MAX_PEAKS) и без, с краевыми максимумами и плато.
+Запуск: python test_peaks.py или python -m pytest benchmarks
+"""
+
+
+def check(spectrum, smoothed=None):
+    """Indices of find_peak_indices against the loop on an axis where frequency = index"""
+    smoothed = savgol_filter(spectrum, window_length=11, polyorder=2) if smoothed is None else smoothed
+    xf = np.arange(len(spectrum), dtype='float64')
+    expected = [int(f) for f, _ in bench_peaks.detect_peaks_loop(xf, smoothed, spectrum)]
+    result = peaks.find_peak_indices(smoothed, spectrum).tolist()
+    assert result == expected, (len(result), len(expected))
+    assert peaks.detect_peaks(xf, smoothed, spectrum) == \
+        [tuple(map(float, p)) for p in bench_peaks.detect_peaks_loop(xf, smoothed, spectrum)]
+    return result
+
+
+def test_synthetic():
+    # Dense noise: many passes of the reduction before fewer than MAX_PEAKS remain
+    for name, _, spectrum in bench_peaks.synthetic_spectra([10000, 100000]):
+        assert len(check(spectrum)) > 0, name
+
+
+def test_few_peaks():
+    x = np.linspace(0, 100, 2000)
+    spectrum = 100 / (1 + (x - 30) ** 2) + 50 / (1 + ((x - 70) / 2) ** 2)
+    assert check(spectrum) == [600, 1399]
+
+
+def test_ends_and_plateaus():
+    # The ends are never peaks of the first pass; a flat top is not a strict maximum
+    smoothed = np.array([5.0, 1.0, 3.0, 3.0, 1.0, 4.0, 2.0, 6.0])
+    check(smoothed, smoothed)
+    check(np.zeros(2), np.zeros(2))
+
+
+def test_reduction_threshold():
+    rng = np.random.default_rng(1)
+    for count in (peaks.MAX_PEAKS - 1, peaks.MAX_PEAKS, 4 * peaks.MAX_PEAKS):
+        smoothed = np.zeros(2 * count + 1)
+        smoothed[1::2] = rng.uniform(1, 2, count)
+        check(smoothed, smoothed)
+
+
+if __name__ == '__main__':
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import argparse
+import numpy as np
+
+"""
+Чтение траекторий DCD (CHARMM/NAMD) без wordom: файл отображается в память (np.memmap),
+каждый кадр - запись структурного dtype (ячейка, X, Y, Z вместе с маркерами записей Fortran),
+так что x/y/z всех кадров - float32-представления прямо над файлом, без копирования.
+Срезы по кадрам (шаг) и выборка атомов читают с диска только затронутые страницы.
+Заголовок: число атомов и кадров, ISTART, NSAVC, шаг по времени (фс), заголовок-title, есть ли ячейка.
+Порядок байт и 4/8-байтовые маркеры определяются по первой записи. Фиксированные атомы
+(кадры разной длины) не поддерживаются.
+    python dcd.py runned.dcd --atoms 0 1 2 --step 10 --output xyz.npy
+"""
+
+AKMA_FS = 48.88821  # fs in the AKMA time unit of the DCD timestep
+CHUNK_FRAMES = 1000  # frames per step of iter_coordinates()
+
+
+def _record(mm, offset, marker):
+    """(payload start, payload end, offset after the record) of the Fortran record at offset"""
+    length = int(np.frombuffer(mm, dtype=marker, count=1, offset=offset)[0])
+    start = offset + marker.itemsize
+    end = start + length
+    if end + marker.itemsize > len(mm) or int(np.frombuffer(mm, dtype=marker, count=1, offset=end)[0]) != length:
+        raise ValueError(f"broken Fortran record at byte {offset}")
+    return start, end, end + marker.itemsize
+
+
+def _byte_order(head):
+    """(byte order, marker dtype) from the first bytes: an 84-byte record starting with 'CORD'"""
+    for order in '<>':
+        for marker in ('i4', 'i8'):
+            marker = np.dtype(order + marker)
+            if len(head) >= marker.itemsize + 4 and head[marker.itemsize:marker.itemsize + 4] == b'CORD' \
+                    and int(np.frombuffer(head, dtype=marker, count=1)[0]) == 84:
+                return order, marker
+    raise ValueError("not a DCD file (no 'CORD' header record)")
+
+
+class DCDFile:
+    """Memory-mapped DCD trajectory; coordinates in Å as float32"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            head = f.read(16)
+        order, marker = _byte_order(head)
+        self.byte_order = order
+        raw = np.memmap(path, dtype=np.uint8, mode='r')
+        # Header: 'CORD' + 20 control integers
+        start, end, offset = _record(raw, 0, marker)
+        control = np.frombuffer(raw, dtype=order + 'i4', count=20, offset=start + 4)
+        self.header_frames, self.istart, self.nsavc = int(control[0]), int(control[1]), int(control[2])
+        fixed = int(control[8])
+        self.charmm = bool(control[19])
+        if self.charmm:
+            delta = float(np.frombuffer(raw, dtype=order + 'f4', count=1, offset=start + 4 + 9 * 4)[0])
+            self.has_cell = bool(control[10])
+            four_dims = bool(control[11])
+        else:  # X-PLOR: double timestep, no unit cell
+            delta = float(np.frombuffer(raw, dtype=order + 'f8', count=1, offset=start + 4 + 9 * 4)[0])
+            self.has_cell = four_dims = False
+        self.timestep = delta * AKMA_FS  # fs
+        # Title lines
+        start, end, offset = _record(raw, offset, marker)
+        lines = int(np.frombuffer(raw, dtype=order + 'i4', count=1, offset=start)[0])
+        text = bytes(raw[start + 4:min(end, start + 4 + 80 * lines)])
+        self.title = [text[k:k + 80].decode('ascii', 'replace').rstrip(' \0') for k in range(0, len(text), 80)]
+        # Atoms
+        start, end, offset = _record(raw, offset, marker)
+        self.natoms = int(np.frombuffer(raw, dtype=order + 'i4', count=1, offset=start)[0])
+        if fixed:
+            raise ValueError(f"{path}: {fixed} fixed atoms, frames of different sizes are not supported")
+        fields = []
+        if self.has_cell:
+            fields += [('cell_begin', marker), ('cell', order + 'f8', 6), ('cell_end', marker)]
+        for axis in 'xyzw'[:4 if four_dims else 3]:
+            fields += [(axis + '_begin', marker), (axis, order + 'f4', self.natoms), (axis + '_end', marker)]
+        self.frame_dtype = np.dtype(fields)
+        self.header_size = offset
+        # The control count is not updated by every writer and a cut run ends in a partial frame
+        self.nframes = (len(raw) - offset) // self.frame_dtype.itemsize
+        del raw
+        self.frames = np.memmap(path, dtype=self.frame_dtype, mode='r', offset=offset, shape=(self.nframes,)) \
+            if self.nframes else np.zeros(0, dtype=self.frame_dtype)
+        if self.nframes and self.frames[0]['x_begin'] != 4 * self.natoms:
+            raise ValueError(f"{path}: first frame does not hold {self.natoms} atoms")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.nframes
+
+    def close(self):
+        self.frames = None
+
+    @property
+    def x(self):
+        """(frames, atoms) float32 view of the file"""
+        return self.frames['x']
+
+    @property
+    def y(self):
+        return self.frames['y']
+
+    @property
+    def z(self):
+        return self.frames['z']
+
+    def steps(self):
+        """MD step of every frame from ISTART and NSAVC"""
+        return self.istart + self.nsavc * np.arange(self.nframes, dtype='int64')
+
+    def times(self):
+        """Time of every frame, fs"""
+        return self.steps() * self.timestep
+
+    def coordinates(self, frames=slice(None), atoms=None):
+        """(frames, atoms, 3) float32 array of the given frames (index, slice or array) and atoms"""
+        selected = self.frames[frames]
+        columns = [selected[axis] for axis in 'xyz']
+        if atoms is not None:
+            columns = [column[..., atoms] for column in columns]
+        return np.stack(columns, axis=-1).astype('float32', copy=False)
+
+    def iter_coordinates(self, start=0, stop=None, step=1, atoms=None, chunk=CHUNK_FRAMES):
+        """(frame indices, (n, atoms, 3) float32) in chunks of chunk frames, for passes over long runs"""
+        indices = np.arange(self.nframes)[start:stop:step]
+        for first in range(0, len(indices), chunk):
+            part = indices[first:first + chunk]
+            yield part, self.coordinates(slice(part[0], part[-1] + 1, step), atoms)
+
+    def unit_cell(self, frames=slice(None)):
+        """(frames, 6) a, b, c (Å), alpha, beta, gamma (degrees); None without the cell record"""
+        if not self.has_cell:
+            return None
+        # Stored as a, gamma, b, beta, alpha, c
+        cell = np.asarray(self.frames[frames]['cell'], dtype='float64')[..., [0, 2, 5, 4, 3, 1]]
+        angles = cell[..., 3:]
+        # NAMD stores the cosines of the angles, CHARMM the angles themselves
+        if np.all(np.abs(angles) <= 1.0):
+            cell[..., 3:] = np.degrees(np.arccos(angles))
+        return cell
+
+    def __repr__(self):
+        return (f"DCDFile({self.path!r}: {self.natoms} atoms, {self.nframes} frames, "
+                f"timestep {self.timestep:g} fs, every {self.nsavc} steps from {self.istart})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show a DCD header or export coordinates of some atoms')
+    parser.add_argument('dcd')
+    parser.add_argument('--atoms', type=int, nargs='+', help='0-based atom indices (default all)')
+    parser.add_argument('--start', type=int, default=0)
+    parser.add_argument('--stop', type=int)
+    parser.add_argument('--step', type=int, default=1)
+    parser.add_argument('--output', help='.npy of (frames, atoms, 3) float32')
+    args = parser.parse_args()
+    try:
+        trajectory = DCDFile(args.dcd)
+    except (OSError, ValueError) as e:
+        print(f"{args.dcd}: {e}")
+        sys.exit(1)
+    with trajectory:
+        print(trajectory)
+        for line in trajectory.title:
+            print(' ', line)
+        if trajectory.has_cell and trajectory.nframes:
+            cell = trajectory.unit_cell(slice(0, 1))[0]
+            print('Unit cell of the first frame:', ', '.join(f"{name} {value:.4f}" for name, value in
+                                                             zip(('a', 'b', 'c', 'alpha', 'beta', 'gamma'), cell)))
+        if args.output:
+            atoms = None if args.atoms is None else np.array(args.atoms)
+            xyz = trajectory.coordinates(slice(args.start, args.stop, args.step), atoms)
+            np.save(args.output, xyz)
+            print(f"{args.output}: {xyz.shape}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+from scipy.signal import firwin, kaiserord, resample_poly
+
+"""
+Прореживание сигнала перед спектральным анализом.
+Шаг 1 фс дает Найквиста ~16700 cm⁻¹, а смотрим мы до 4000 cm⁻¹, поэтому сигнал можно
+сократить в q раз: полифазный КИХ-фильтр нижних частот (resample_poly) + выборка каждой q-й точки.
+"""
+
+ATTENUATION_DB = 60  # stopband attenuation of the anti-aliasing filter
+MARGIN = 0.05  # minimal transition band, fraction of max_freq
+
+
+def choose_factor(dt, max_freq, margin=MARGIN):
+    """
+    Largest factor q that keeps [0, max_freq] (Hz) free of aliasing.
+    After decimation everything above fs/q - max_freq folds outside the band, so the
+    transition band [max_freq, fs/q - max_freq] must be at least margin * max_freq wide.
+    """
+    fs = 1.0 / dt
+    return max(1, int(fs / (max_freq * (2 + margin))))
+
+
+def design_lowpass(factor, dt, max_freq, attenuation=ATTENUATION_DB):
+    """Kaiser-window FIR low-pass with passband up to max_freq and stopband from fs/factor - max_freq"""
+    fs = 1.0 / dt
+    stop = fs / factor - max_freq
+    numtaps, beta = kaiserord(attenuation, (stop - max_freq) / (fs / 2))
+    numtaps |= 1  # odd length -> integer group delay, compensated by resample_poly
+    return firwin(numtaps, (max_freq + stop) / 2, window=('kaiser', beta), fs=fs)
+
+
+def decimate(signal, dt, max_freq, factor=None):
+    """
+    Low-pass and downsample signal along its last axis. Returns (decimated signal, new dt, factor).
+    factor=None picks it with choose_factor; factor 1 returns the signal unchanged.
+    The last n % factor samples are dropped, so the result has exactly n // factor samples and its
+    rfft bins are those of the first n - n % factor samples at the original step.
+    """
+    if factor is None:
+        factor = choose_factor(dt, max_freq)
+    if factor <= 1:
+        return signal, dt, 1
+    # resample_poly would return ceil(n / factor) samples, a bin step that matches no undecimated length
+    n = np.shape(signal)[-1]
+    signal = np.asarray(signal)[..., :n - n % factor]
+    taps = design_lowpass(factor, dt, max_freq)
+    decimated = resample_poly(signal, 1, factor, axis=-1, window=taps)
+    return decimated.astype(np.asarray(signal).dtype, copy=False), dt * factor, factor
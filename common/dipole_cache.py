@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+import pandas as pd
+import namd_table
+
+"""
+Бинарный кэш для дипольных .dat файлов NAMD.
+При первом чтении рядом с file.dat пишется file.dat.dipcache (заголовок + столбцы),
+дальше файл только отображается в память (np.memmap) без разбора текста.
+Если размер или время изменения исходника поменялись - кэш пересобирается.
+"""
+
+MAGIC = b'NAMDDIP1'
+VERSION = 1
+HEADER_SIZE = 64
+SUFFIX = '.dipcache'
+# Column names as pandas sees them with sep=' ' -> names used in the scripts
+RAW_COLUMNS = {'#': 'frame', 'Unnamed: 2': 'dip_x', 'Unnamed: 4': 'dip_y',
+               'Unnamed: 6': 'dip_z', 'Unnamed: 8': '|dip|'}
+COLUMNS = tuple(RAW_COLUMNS.values())
+VALUE_COLUMNS = COLUMNS[1:]
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('ncols', '<u4'),
+    ('rows', '<i8'),
+    ('source_size', '<i8'),
+    ('source_mtime_ns', '<i8'),
+])
+
+
+def sidecar_path(path):
+    """Path of the binary sidecar for a .dat file"""
+    return path + SUFFIX
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def _parse_dat(path):
+    """Parse the whitespace .dat into frame (int32) and dipole (float32) columns"""
+    columns = namd_table.read_columns(path, ['int32'] + ['float32'] * len(VALUE_COLUMNS))
+    frame = columns[0]
+    values = np.empty((len(VALUE_COLUMNS), len(frame)), dtype='float32')
+    for row, column in enumerate(columns[1:]):
+        values[row] = column
+    return frame, values
+
+
+def _read_header(cache_path):
+    with open(cache_path, 'rb') as f:
+        raw = f.read(HEADER_DTYPE.itemsize)
+    if len(raw) < HEADER_DTYPE.itemsize:
+        return None
+    header = np.frombuffer(raw, dtype=HEADER_DTYPE)[0]
+    if header['magic'] != MAGIC or header['version'] != VERSION:
+        return None
+    if header['ncols'] != len(VALUE_COLUMNS):
+        return None
+    return header
+
+
+def is_fresh(path, cache_path=None):
+    """True if the sidecar exists and matches size/mtime of the source file"""
+    cache_path = cache_path or sidecar_path(path)
+    if not os.path.exists(cache_path):
+        return False
+    header = _read_header(cache_path)
+    if header is None:
+        return False
+    size, mtime_ns = _source_stamp(path)
+    if header['source_size'] != size or header['source_mtime_ns'] != mtime_ns:
+        return False
+    rows = int(header['rows'])
+    expected = HEADER_SIZE + rows * 4 * (1 + len(VALUE_COLUMNS))
+    return os.path.getsize(cache_path) == expected
+
+
+def cached_rows(path):
+    """Number of rows stored in the sidecar (check is_fresh first)"""
+    return int(_read_header(sidecar_path(path))['rows'])
+
+
+def write_sidecar(path, frame, values, cache_path=None):
+    """Write columns to the sidecar atomically (tmp file + rename)"""
+    cache_path = cache_path or sidecar_path(path)
+    size, mtime_ns = _source_stamp(path)
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header['magic'] = MAGIC
+    header['version'] = VERSION
+    header['ncols'] = len(VALUE_COLUMNS)
+    header['rows'] = len(frame)
+    header['source_size'] = size
+    header['source_mtime_ns'] = mtime_ns
+    tmp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(header.tobytes().ljust(HEADER_SIZE, b'\0'))
+        f.write(np.ascontiguousarray(frame, dtype='<i4').tobytes())
+        f.write(np.ascontiguousarray(values, dtype='<f4').tobytes())
+    os.replace(tmp_path, cache_path)
+    return cache_path
+
+
+def _map_sidecar(cache_path):
+    header = _read_header(cache_path)
+    rows = int(header['rows'])
+    frame = np.memmap(cache_path, dtype='<i4', mode='r', offset=HEADER_SIZE, shape=(rows,))
+    values = np.memmap(cache_path, dtype='<f4', mode='r', offset=HEADER_SIZE + 4 * rows,
+                       shape=(len(VALUE_COLUMNS), rows))
+    return frame, values
+
+
+def load_dipole(path, rebuild=False):
+    """
+    Return {'frame', 'dip_x', 'dip_y', 'dip_z', '|dip|'} arrays for a dipole .dat file.
+    Arrays come from a read-only memory map of the sidecar; copy before modifying.
+    """
+    cache_path = sidecar_path(path)
+    if not rebuild and is_fresh(path, cache_path):
+        frame, values = _map_sidecar(cache_path)
+    else:
+        frame, values = _parse_dat(path)
+        try:
+            write_sidecar(path, frame, values, cache_path)
+            frame, values = _map_sidecar(cache_path)
+        except OSError as e:
+            # Read-only data directory: work from the parsed arrays
+            print(f"Dipole cache not written for {path}: {e}")
+    data = {'frame': frame}
+    for row, name in enumerate(VALUE_COLUMNS):
+        data[name] = values[row]
+    return data
+
+
+def read_dipole_frame(path, rebuild=False):
+    """DataFrame with the renamed columns used by the Processing scripts"""
+    data = load_dipole(path, rebuild=rebuild)
+    return pd.DataFrame({name: np.asarray(data[name]) for name in COLUMNS})
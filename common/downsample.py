@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+
+"""
+Прореживание длинных рядов перед построением графика (не путать с decimate.py: тот готовит
+сигнал к спектру, а этот только рисует).
+На картинке шириной в пару тысяч пикселей миллионы точек сливаются в полосу, а matplotlib и
+pyqtgraph все равно обходят каждую, EPS распухает до сотен мегабайт. Ряды длиннее MAX_POINTS
+сокращаются до ~MAX_POINTS точек:
+  'minmax' - на каждый участок минимум и максимум в исходном порядке: огибающая и все пики на месте;
+  'lttb'   - Largest-Triangle-Three-Buckets: одна точка на участок, форма кривой.
+"""
+
+MAX_POINTS = 8000  # min/max pairs for every pixel column of a 12-inch, 300 dpi figure
+METHOD = 'minmax'
+
+
+def minmax_indices(y, buckets):
+    """Indices of the minimum and maximum of each of the buckets equal parts of y, plus both ends, sorted"""
+    n = len(y)
+    size = n // buckets
+    body = np.asarray(y[:size * buckets]).reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    parts = [[0], offsets + body.argmin(axis=1), offsets + body.argmax(axis=1), [n - 1]]
+    if size * buckets < n:
+        tail = np.asarray(y[size * buckets:])
+        parts.append([size * buckets + tail.argmin(), size * buckets + tail.argmax()])
+    return np.unique(np.concatenate(parts).astype(np.intp))
+
+
+def lttb_indices(x, y, points):
+    """Largest-Triangle-Three-Buckets: first and last point and one point per bucket in between"""
+    n = len(y)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    edges = np.linspace(1, n - 1, points - 1).astype(np.intp)
+    indices = np.empty(points, dtype=np.intp)
+    indices[0], indices[-1] = 0, n - 1
+    for k in range(points - 2):
+        start, stop = edges[k], edges[k + 1]
+        # The next bucket is represented by its mean, the last one by the last point
+        following = slice(stop, edges[k + 2]) if k + 2 < len(edges) else slice(n - 1, n)
+        next_x, next_y = x[following].mean(), y[following].mean()
+        previous = indices[k]
+        area = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        indices[k + 1] = start + np.argmax(area)
+    return indices
+
+
+def downsample(x, y, max_points=MAX_POINTS, method=METHOD):
+    """(x, y) unchanged up to max_points points, otherwise about max_points of them picked by method"""
+    if max_points is None or len(y) <= max_points:
+        return x, y
+    if method == 'minmax':
+        idx = minmax_indices(y, max(1, max_points // 2 - 1))
+    elif method == 'lttb':
+        idx = lttb_indices(x, y, max(3, max_points))
+    else:
+        raise ValueError(f"unknown method {method!r}, expected 'minmax' or 'lttb'")
+    return np.asarray(x)[idx], np.asarray(y)[idx]
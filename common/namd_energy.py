@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import re
+import sys
+import mmap
+import shutil
+import zipfile
+import argparse
+import tempfile
+import warnings
+import numpy as np
+import pandas as pd
+import namd_log
+
+"""
+Все столбцы ENERGY: из .log NAMD (BOND, ANGLE, ..., KINETIC, TOTAL, TEMP, POTENTIAL, PRESSURE ...)
+за один проход в столбцовый файл run.energy.npz рядом с логом - вместо ручных выгрузок .dat/CSV.
+Лог отображается в память и разбирается блоками по BLOCK_SIZE: строки ENERGY: выбираются
+регулярным выражением, числа всего блока разбираются одним вызовом np.fromstring, каждый столбец
+дописывается во временный файл; в конце столбцы переносятся в .npz без сжатия (один .npy на
+столбец, имена из строки ETITLE), так что память не зависит от размера лога.
+np.load(run.energy.npz)['KINETIC'] читает только нужный столбец. load_energy() берет готовый
+.npz, если размер и время изменения лога не поменялись, иначе извлекает заново.
+    python namd_energy.py run1/min.log run2/md.log
+"""
+
+SUFFIX = '.energy.npz'
+BLOCK_SIZE = 16 << 20  # bytes of log per step
+ENERGY_LINE = re.compile(rb'^ENERGY:([^\n]*)', re.MULTILINE)
+SOURCE = '__source__'  # [size, mtime_ns] of the log the file was extracted from
+ENERGY_COLUMN = 'TOTAL'  # what the hand-made 'TS ENERGY' exports contain
+
+
+def output_path(log_path):
+    """run.log -> run.energy.npz"""
+    return os.path.splitext(log_path)[0] + SUFFIX
+
+
+def table_name(path):
+    """File name without .energy.npz / .log / .dat"""
+    name = os.path.basename(path)
+    if name.endswith(SUFFIX):
+        return name[:-len(SUFFIX)]
+    return os.path.splitext(name)[0]
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def _parse_block(lines, columns):
+    """(rows, columns) float64 array of the ENERGY: lines of one block"""
+    text = b' '.join(lines)
+    with warnings.catch_warnings():
+        # fromstring stops at the first token that is not a number (a warning or an error by numpy version)
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            values = np.fromstring(text, dtype='float64', sep=' ')
+        except (DeprecationWarning, ValueError):
+            values = None
+    if values is None or len(values) != len(lines) * columns:
+        widths = sorted({len(line.split()) for line in lines})
+        raise ValueError(f"ENERGY: lines with {widths} fields (not all numbers?), ETITLE has {columns}")
+    return values.reshape(len(lines), columns)
+
+
+def extract(log_path, output=None, block_size=BLOCK_SIZE, progress=None):
+    """
+    Write every ENERGY: column of a NAMD log to an .npz (TS int64, the rest float64).
+    progress(done, total) is called with bytes after each block. Returns the output path.
+    """
+    output = output or output_path(log_path)
+    names = namd_log.read_log_info(log_path).energy_columns
+    if not names:
+        raise ValueError(f"{log_path}: no ETITLE line")
+    dtypes = [np.dtype('<i8') if name == 'TS' else np.dtype('<f8') for name in names]
+    size, mtime_ns = _source_stamp(log_path)
+    rows = 0
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output))) as tmp:
+        parts = [open(os.path.join(tmp, '%d.bin' % k), 'wb') for k in range(len(names))]
+        try:
+            with open(log_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start = 0
+                while start < size:
+                    # Blocks end on a line break, so every block starts at the beginning of a line
+                    end = mm.find(b'\n', min(start + block_size, size) - 1)
+                    end = size if end < 0 else end + 1
+                    lines = ENERGY_LINE.findall(mm, start, end)
+                    if lines:
+                        values = _parse_block(lines, len(names))
+                        for k, part in enumerate(parts):
+                            part.write(values[:, k].astype(dtypes[k]).tobytes())
+                        rows += len(lines)
+                    start = end
+                    if progress is not None:
+                        progress(start, size)
+        finally:
+            for part in parts:
+                part.close()
+        tmp_output = "%s.%d.tmp" % (output, os.getpid())
+        with zipfile.ZipFile(tmp_output, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+            with archive.open(SOURCE + '.npy', 'w') as member:
+                np.lib.format.write_array(member, np.array([size, mtime_ns], dtype='<i8'))
+            for k, name in enumerate(names):
+                with archive.open(name + '.npy', 'w', force_zip64=True) as member:
+                    np.lib.format.write_array_header_1_0(
+                        member, {'descr': dtypes[k].str, 'fortran_order': False, 'shape': (rows,)})
+                    with open(os.path.join(tmp, '%d.bin' % k), 'rb') as part:
+                        shutil.copyfileobj(part, member)
+        os.replace(tmp_output, output)
+    return output
+
+
+def is_fresh(log_path, output=None):
+    """True if the .npz exists and was extracted from the log as it is now"""
+    output = output or output_path(log_path)
+    if not os.path.exists(output):
+        return False
+    try:
+        with np.load(output) as data:
+            return tuple(data[SOURCE]) == _source_stamp(log_path)
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return False
+
+
+def load_energy(path, columns=None, progress=None):
+    """
+    {name: array} of the ENERGY columns (all or the given ones) from a .log or an .energy.npz.
+    A log is extracted first (progress as in extract()) unless its .npz is up to date.
+    """
+    if not path.endswith('.npz'):
+        if not is_fresh(path):
+            extract(path, progress=progress)
+        path = output_path(path)
+    with np.load(path) as data:
+        names = [name for name in data.files if name != SOURCE]
+        missing = [name for name in columns or () if name not in names]
+        if missing:
+            raise KeyError(f"{path}: no columns {missing}, available {names}")
+        return {name: data[name] for name in (columns or names)}
+
+
+def read_energy_table(path, columns=None):
+    """
+    DataFrame of ENERGY columns from a .log, an .energy.npz or a space-separated .dat table with the
+    ETITLE names in its first line (the hand-made exports).
+    """
+    if path.endswith('.npz') or path.endswith('.log'):
+        return pd.DataFrame(load_energy(path, columns))
+    table = pd.read_csv(path, delimiter=' ', index_col=None, header=[0])
+    return table if columns is None else table[list(columns)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract the ENERGY columns of NAMD logs to .energy.npz files')
+    parser.add_argument('logs', nargs='+')
+    parser.add_argument('--force', action='store_true', help='extract even if the .npz is up to date')
+    args = parser.parse_args()
+    for log_path in args.logs:
+        if not args.force and is_fresh(log_path):
+            print(f"{output_path(log_path)} is up to date")
+            continue
+        try:
+            output = extract(log_path)
+        except (OSError, ValueError) as e:
+            print(f"{log_path}: {e}")
+            sys.exit(1)
+        with np.load(output) as data:
+            print(f"{output}: {len(data['TS'])} steps, {', '.join(n for n in data.files if n != SOURCE)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import re
+import json
+
+"""
+Сведения о запуске из .log NAMD за один проход: число атомов, шаг по времени, первый и последний
+шаг, длина запуска, имена столбцов ENERGY (строка ETITLE).
+Шапка читается построчно только до первой строки ENERGY:, конец файла - одним чтением
+последних TAIL_BYTES (окно растет, пока в нем не найдется строка ENERGY:), середина лога
+не читается вовсе.
+Результат сохраняется рядом с логом в file.log.info.json; пока размер и время изменения лога
+те же, повторное открытие запуска только читает этот файл.
+"""
+
+VERSION = 2
+SUFFIX = '.info.json'
+TAIL_BYTES = 64 << 10  # first tail window; doubled until it holds an ENERGY: line
+ATOMS = re.compile(r'^Info: (\d+) ATOMS\s*$')
+TIMESTEP = re.compile(r'^Info: TIMESTEP\s+([-+.\deE]+)')
+RUN = re.compile(r'^TCL: (?:Running|Minimizing) for (\d+) steps')
+FINAL = re.compile(r'^WRITING .* TO OUTPUT FILE AT STEP (\d+)')
+TRAILER = (b'WallClock:', b'End of program')  # shutdown lines: without them the run was cut
+
+
+class LogInfo:
+    """Metadata of one NAMD run; fields the log does not carry are None"""
+
+    FIELDS = ('atoms', 'timestep', 'first_step', 'last_step', 'run_steps', 'final_step', 'energy_columns')
+
+    def __init__(self, atoms=None, timestep=None, first_step=None, last_step=None, run_steps=None,
+                 final_step=None, energy_columns=()):
+        self.atoms = atoms  # int
+        self.timestep = timestep  # float, fs
+        self.first_step = first_step  # int, TS of the first ENERGY: line
+        self.last_step = last_step  # int, TS of the last ENERGY: line
+        self.run_steps = run_steps  # int, 'TCL: Running for N steps'
+        self.final_step = final_step  # int, 'WRITING ... TO OUTPUT FILE AT STEP N' before the WallClock trailer, else None
+        self.energy_columns = tuple(energy_columns)  # ETITLE names: ('TS', 'BOND', ...)
+
+    @property
+    def duration(self):
+        """Steps of the run as MDFourier shows them: the final output step, else the last ENERGY step"""
+        return self.final_step if self.final_step is not None else self.last_step
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def __repr__(self):
+        return 'LogInfo(%s)' % ', '.join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS)
+
+
+def sidecar_path(path):
+    return path + SUFFIX
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def _energy_step(line):
+    """TS of an 'ENERGY: <TS> ...' line"""
+    return int(line.split()[1])
+
+
+def _read_head(f, info):
+    """Startup block up to the first ENERGY: line; leaves f right after it"""
+    for line in f:
+        if line.startswith(b'ENERGY:'):
+            info.first_step = _energy_step(line)
+            return
+        line = line.decode('utf-8', 'replace').rstrip('\r\n')
+        if line.startswith('ETITLE:'):
+            info.energy_columns = tuple(line.split()[1:])
+        elif info.atoms is None and ATOMS.match(line):
+            info.atoms = int(ATOMS.match(line).group(1))
+        elif info.timestep is None and TIMESTEP.match(line):
+            info.timestep = float(TIMESTEP.match(line).group(1))
+        elif info.run_steps is None and RUN.match(line):
+            info.run_steps = int(RUN.match(line).group(1))
+
+
+def _read_tail(f, start, size, info):
+    """
+    Last ENERGY: and shutdown lines from the end of the file, not reading before start.
+    The output writes count only if the WallClock / End of program trailer follows them:
+    a cut run ends in restart writes or in nothing.
+    """
+    window = TAIL_BYTES
+    while True:
+        offset = max(start, size - window)
+        f.seek(offset)
+        lines = f.read(size - offset).splitlines()
+        if offset > start:
+            lines = lines[1:]  # probably cut in the middle
+        finished = False
+        for line in reversed(lines):
+            if any(marker in line for marker in TRAILER):
+                finished = True
+            elif finished and info.final_step is None and line.startswith(b'WRITING'):
+                match = FINAL.match(line.decode('utf-8', 'replace'))
+                if match:
+                    info.final_step = int(match.group(1))
+            elif line.startswith(b'ENERGY:'):
+                info.last_step = _energy_step(line)
+                return
+        if offset == start:
+            return
+        window *= 2
+
+
+def parse_log(path):
+    """LogInfo of a NAMD .log, reading its header and its tail only"""
+    info = LogInfo()
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        _read_head(f, info)
+        if info.first_step is not None:
+            info.last_step = info.first_step
+            _read_tail(f, f.tell(), size, info)
+    return info
+
+
+def read_log_info(path, rebuild=False):
+    """LogInfo from the sidecar if it matches the log, otherwise parsed and saved next to the log"""
+    cache_path = sidecar_path(path)
+    size, mtime_ns = _source_stamp(path)
+    if not rebuild and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('version') == VERSION and cached.get('source_size') == size \
+                    and cached.get('source_mtime_ns') == mtime_ns:
+                return LogInfo(**{name: cached[name] for name in LogInfo.FIELDS})
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+    info = parse_log(path)
+    record = dict(info.to_dict(), version=VERSION, source_size=size, source_mtime_ns=mtime_ns)
+    tmp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, indent=1)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        # Read-only run directory: the parsed record still works
+        print(f"Log info not cached for {path}: {e}")
+    return info
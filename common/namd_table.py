@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+import pandas as pd
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+except ImportError:  # pandas path only
+    pa = None
+
+"""
+Быстрое чтение текстовых таблиц NAMD (дипольные .dat, таблицы энергий), разделенных пробелами.
+pd.read_csv(sep=' ') видит каждый лишний пробел как пустой столбец ('Unnamed: N'),
+поэтому положения настоящих столбцов определяются один раз по первой строке данных,
+а дальше файл разбирается сразу в массивы нужного типа:
+  pyarrow (если установлен) - многопоточный разбор блоками, читаются только нужные поля;
+  pandas - C-парсер с разделителем-пробельной последовательностью, без пустых столбцов.
+iter_columns() отдает тот же разбор блоками (прогресс и частичные графики в MDFourier);
+числа там разбираются с точным округлением, как float() в Python.
+"""
+
+BLOCK_SIZE = 16 << 20  # bytes per pyarrow parse block (one block per thread)
+
+
+def layout(path, skip_rows=1):
+    """(fields per line when split on single spaces, indices of the non-empty ones) from the first data line"""
+    with open(path, 'rb') as f:
+        for _ in range(skip_rows):
+            f.readline()
+        line = f.readline().rstrip(b'\r\n')
+    tokens = line.split(b' ')
+    return len(tokens), [i for i, token in enumerate(tokens) if token]
+
+
+def _read_pyarrow(path, skip_rows, dtypes, fields, positions):
+    names = ['f%d' % i for i in range(fields)]
+    wanted = [names[i] for i in positions]
+    table = pa_csv.read_csv(
+        path,
+        read_options=pa_csv.ReadOptions(skip_rows=skip_rows, column_names=names, block_size=BLOCK_SIZE,
+                                        use_threads=True),
+        parse_options=pa_csv.ParseOptions(delimiter=' '),
+        convert_options=pa_csv.ConvertOptions(include_columns=wanted,
+                                              column_types={n: pa.from_numpy_dtype(np.dtype(t))
+                                                            for n, t in zip(wanted, dtypes)}))
+    return [table.column(name).to_numpy() for name in wanted]
+
+
+def _read_pandas(path, skip_rows, dtypes, positions=None):
+    """Single spaces at the known positions, or any whitespace run without positions"""
+    if positions is None:
+        df = pd.read_csv(path, sep=r'\s+', header=None, skiprows=skip_rows, usecols=range(len(dtypes)),
+                         dtype=dict(enumerate(dtypes)), engine='c')
+        return [df[i].to_numpy() for i in range(len(dtypes))]
+    df = pd.read_csv(path, sep=' ', header=None, skiprows=skip_rows, usecols=positions,
+                     dtype=dict(zip(positions, dtypes)), engine='c')
+    columns = [df[i].to_numpy() for i in positions]
+    # A shifted field lands in an empty column and leaves NaN behind
+    if any(c.dtype.kind == 'f' and np.isnan(c).any() for c in columns):
+        raise ValueError("empty fields at the column positions of the first data line")
+    return columns
+
+
+def read_columns(path, dtypes, skip_rows=1, engine=None):
+    """
+    First len(dtypes) columns of a whitespace table as NumPy arrays of the given dtypes.
+    engine: 'pyarrow', 'pandas' or None (pyarrow when installed). Both read only the fields found
+    by layout(); a file whose spacing changes between lines is parsed again splitting on any whitespace.
+    """
+    if engine is None:
+        engine = 'pyarrow' if pa is not None else 'pandas'
+    fields, positions = layout(path, skip_rows)
+    if len(positions) < len(dtypes):
+        raise ValueError("%s: %d columns in the first data line, %d expected" % (path, len(positions), len(dtypes)))
+    positions = positions[:len(dtypes)]
+    try:
+        if engine == 'pyarrow':
+            return _read_pyarrow(path, skip_rows, dtypes, fields, positions)
+        return _read_pandas(path, skip_rows, dtypes, positions)
+    except ValueError as e:  # pa.ArrowInvalid and pandas ParserError are ValueErrors
+        print(f"{os.path.basename(path)}: irregular spacing ({str(e).splitlines()[0]}), parsing any whitespace")
+    return _read_pandas(path, skip_rows, dtypes)
+
+
+def iter_columns(path, dtypes, skip_rows=1, engine=None, block_size=BLOCK_SIZE):
+    """
+    read_columns() in blocks: yields (arrays of the block, bytes read so far).
+    Floats are correctly rounded (pyarrow always, pandas with float_precision='round_trip'), i.e. equal to float().
+    Raises ValueError if a line does not have the fields of the first data line at the same positions.
+    """
+    if engine is None:
+        engine = 'pyarrow' if pa is not None else 'pandas'
+    fields, positions = layout(path, skip_rows)
+    if len(positions) < len(dtypes):
+        raise ValueError("%s: %d columns in the first data line, %d expected" % (path, len(positions), len(dtypes)))
+    positions = positions[:len(dtypes)]
+    if engine == 'pyarrow':
+        names = ['f%d' % i for i in range(fields)]
+        wanted = [names[i] for i in positions]
+        with pa.OSFile(path, 'rb') as source:
+            reader = pa_csv.open_csv(
+                source,
+                read_options=pa_csv.ReadOptions(skip_rows=skip_rows, column_names=names, block_size=block_size),
+                parse_options=pa_csv.ParseOptions(delimiter=' '),
+                convert_options=pa_csv.ConvertOptions(include_columns=wanted,
+                                                      column_types={n: pa.from_numpy_dtype(np.dtype(t))
+                                                                    for n, t in zip(wanted, dtypes)}))
+            for batch in reader:
+                yield [batch.column(name).to_numpy() for name in wanted], source.tell()
+        return
+    # Rows per chunk from the length of the first data line
+    with open(path, 'rb') as f:
+        for _ in range(skip_rows + 1):
+            line = f.readline()
+    rows = max(1, block_size // max(len(line), 1))
+    with open(path, 'r') as f:
+        for df in pd.read_csv(f, sep=' ', header=None, skiprows=skip_rows, usecols=positions,
+                              dtype=dict(zip(positions, dtypes)), engine='c', float_precision='round_trip',
+                              chunksize=rows):
+            columns = [df[i].to_numpy() for i in positions]
+            if any(c.dtype.kind == 'f' and np.isnan(c).any() for c in columns):
+                raise ValueError("empty fields at the column positions of the first data line")
+            yield columns, f.tell()
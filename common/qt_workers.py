@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import traceback
+from PyQt5 import QtCore, QtWidgets
+
+"""
+Фоновые задачи для окон MDFourier: разбор файлов и FFT идут в QThreadPool, окно не замирает.
+Функция задачи получает первым аргументом worker и через него сообщает прогресс
+(worker.progress(done, total)), отдает частичные результаты (worker.partial(...)) и проверяет
+отмену. Результат, частичные данные и ошибки приходят в окно сигналами, то есть уже в потоке GUI.
+Tasks - полоса прогресса и кнопка Cancel в строке состояния окна, одна задача за раз.
+"""
+
+
+class Cancelled(Exception):
+    """Raised inside a task function once cancel() was requested"""
+
+
+class WorkerSignals(QtCore.QObject):
+    progress = QtCore.pyqtSignal(int)  # percent, -1 while the total is unknown
+    partial = QtCore.pyqtSignal(object)
+    result = QtCore.pyqtSignal(object)
+    error = QtCore.pyqtSignal(str)
+    cancelled = QtCore.pyqtSignal()
+    finished = QtCore.pyqtSignal()
+
+
+class Worker(QtCore.QRunnable):
+    """Runs func(worker, *args, **kwargs) on a pool thread"""
+
+    def __init__(self, func, *args, **kwargs):
+        super().__init__()
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self._cancel = False
+        self._percent = None
+
+    def cancel(self):
+        self._cancel = True
+
+    def check(self):
+        if self._cancel:
+            raise Cancelled()
+
+    def progress(self, done, total=None):
+        """Report progress (also a cancellation point); signals only when the percentage changes"""
+        self.check()
+        percent = int(100 * done / total) if total else -1
+        if percent != self._percent:
+            self._percent = percent
+            self.signals.progress.emit(percent)
+
+    def partial(self, data):
+        self.check()
+        self.signals.partial.emit(data)
+
+    def run(self):
+        try:
+            result = self.func(self, *self.args, **self.kwargs)
+            self.check()
+        except Cancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            traceback.print_exc()
+            self.signals.error.emit(f"{type(e).__name__}: {e}")
+        else:
+            self.signals.result.emit(result)
+        finally:
+            self.signals.finished.emit()
+
+
+class Tasks:
+    """One background task at a time, with a progress bar and a Cancel button in the window status bar"""
+
+    def __init__(self, window):
+        self.window = window
+        self.pool = QtCore.QThreadPool()
+        self.pool.setMaxThreadCount(1)
+        self.worker = None
+        self.label = QtWidgets.QLabel()
+        self.bar = QtWidgets.QProgressBar()
+        self.bar.setMaximumWidth(200)
+        self.button = QtWidgets.QPushButton('Cancel')
+        self.button.clicked.connect(self.cancel)
+        status = window.statusBar()
+        for widget in (self.label, self.bar, self.button):
+            status.addPermanentWidget(widget)
+            widget.hide()
+
+    def busy(self):
+        return self.worker is not None
+
+    def start(self, worker, on_result, on_partial=None, text=''):
+        """Run worker unless another task is running; returns the worker or None"""
+        if self.busy():
+            self.window.statusBar().showMessage("Wait for the current task or cancel it", 3000)
+            return None
+        self.worker = worker
+        worker.signals.progress.connect(self._progress)
+        worker.signals.result.connect(on_result)
+        if on_partial is not None:
+            worker.signals.partial.connect(on_partial)
+        worker.signals.error.connect(lambda message: self.window.statusBar().showMessage(f"{text} failed: {message}"))
+        worker.signals.cancelled.connect(lambda: self.window.statusBar().showMessage(f"{text} cancelled", 3000))
+        worker.signals.finished.connect(self._finished)
+        self.label.setText(text)
+        self.bar.setRange(0, 0)
+        self.button.setEnabled(True)
+        for widget in (self.label, self.bar, self.button):
+            widget.show()
+        self.pool.start(worker)
+        return worker
+
+    def cancel(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.button.setEnabled(False)
+
+    def wait(self):
+        """Block until the task is done and deliver its signals (scripts and benchmarks)"""
+        self.pool.waitForDone()
+        QtWidgets.QApplication.processEvents()
+
+    def _progress(self, percent):
+        if percent < 0:
+            self.bar.setRange(0, 0)
+        else:
+            self.bar.setRange(0, 100)
+            self.bar.setValue(percent)
+
+    def _finished(self):
+        self.worker = None
+        for widget in (self.label, self.bar, self.button):
+            widget.hide()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import cProfile
+import resource
+from contextlib import contextmanager
+
+"""
+Замер этапов обработки: время (wall и CPU) и пик RSS на каждый этап каждого файла.
+Записи дописываются построчно в JSON-lines лог (из всех процессов пула в один файл),
+в конце summarize() печатает сводную таблицу по этапам.
+Пока recorder не активирован (activate), stage() ничего не делает.
+Если задан profile_dir, каждый процесс пишет свой cProfile в <profile_dir>/<pid>.prof.
+"""
+
+_recorder = None
+
+
+def _reset_peak_rss():
+    """Reset the VmHWM high-water mark (Linux >= 4.0); False where it is not supported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss():
+    """Peak resident size of this process, bytes"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StageRecorder:
+    """Appends one JSON line per stage to log_path"""
+
+    def __init__(self, log_path, profile_dir=None):
+        self.log_path = log_path
+        self.file = None
+        self.profiler = None
+        self.profile_path = None
+        if profile_dir is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+            self.profile_path = os.path.join(profile_dir, f"{os.getpid()}.prof")
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    @contextmanager
+    def stage(self, name):
+        # Per-stage peak if the kernel can reset it, otherwise the process peak so far
+        peak_reset = _reset_peak_rss()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            record = {
+                'file': self.file,
+                'stage': name,
+                'wall_s': round(time.perf_counter() - wall, 6),
+                'cpu_s': round(time.process_time() - cpu, 6),
+                'peak_rss_mb': round(_peak_rss() / 2**20, 1),
+                'peak_scope': 'stage' if peak_reset else 'process',
+                'pid': os.getpid(),
+            }
+            # Short appends from several processes do not interleave
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+
+    def dump_profile(self):
+        """Write the cumulative profile of this process so far"""
+        if self.profiler is None:
+            return
+        self.profiler.disable()
+        self.profiler.dump_stats(self.profile_path)
+        self.profiler.enable()
+
+
+def activate(log_path, profile_dir=None):
+    """Start recording in this process (also usable as a Pool initializer)"""
+    global _recorder
+    _recorder = StageRecorder(log_path, profile_dir)
+    return _recorder
+
+
+def deactivate():
+    global _recorder
+    if _recorder is not None:
+        _recorder.dump_profile()
+    _recorder = None
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as stage name of the current file; no-op when not active"""
+    if _recorder is None:
+        yield
+        return
+    with _recorder.stage(name):
+        yield
+
+
+@contextmanager
+def track_file(file_path):
+    """Attribute the stages inside the block to file_path"""
+    if _recorder is None:
+        yield
+        return
+    previous = _recorder.file
+    _recorder.file = os.path.basename(file_path)
+    try:
+        yield
+    finally:
+        _recorder.file = previous
+        _recorder.dump_profile()
+
+
+def load_log(log_path):
+    with open(log_path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(log_path):
+    """Print per-stage totals of a log: files, wall and CPU time, peak RSS"""
+    if not os.path.exists(log_path):
+        return
+    totals = {}
+    for record in load_log(log_path):
+        entry = totals.setdefault(record['stage'], {'files': set(), 'count': 0, 'wall': 0.0,
+                                                    'wall_max': 0.0, 'cpu': 0.0, 'rss': 0.0})
+        entry['files'].add(record['file'])
+        entry['count'] += 1
+        entry['wall'] += record['wall_s']
+        entry['wall_max'] = max(entry['wall_max'], record['wall_s'])
+        entry['cpu'] += record['cpu_s']
+        entry['rss'] = max(entry['rss'], record['peak_rss_mb'])
+    total_wall = sum(entry['wall'] for entry in totals.values()) or 1.0
+    print(f"{'stage':<12}{'files':>7}{'wall, s':>10}{'share':>8}{'max, s':>9}{'cpu, s':>10}{'peak RSS, MB':>14}")
+    for name, entry in sorted(totals.items(), key=lambda item: -item[1]['wall']):
+        print(f"{name:<12}{len(entry['files']):>7}{entry['wall']:>10.2f}{entry['wall'] / total_wall:>8.1%}"
+              f"{entry['wall_max']:>9.2f}{entry['cpu']:>10.2f}{entry['rss']:>14.1f}")